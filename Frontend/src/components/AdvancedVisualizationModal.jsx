@@ -26,6 +26,7 @@ import {
   Cell,
 } from "recharts";
 import "./AdvancedVisualizationModal.css";
+import { API_BASE_URL } from "../services/api";
 
 // Custom tooltip component with solid background
 const CustomTooltip = ({
@@ -99,7 +100,7 @@ const AdvancedVisualizationModal = ({ isOpen, onClose, city }) => {
 
         console.log("Fetching predictions for:", searchName);
         const response = await fetch(
-          `http://localhost:5000/api/predict/${encodeURIComponent(searchName)}`
+          `${API_BASE_URL}/api/predict/${encodeURIComponent(searchName)}`
         );
         const data = await response.json();
 
@@ -12,11 +12,9 @@ import {
 } from "react-leaflet";
 import Toast from "./Toast";
 import EnhancedCityPopup from "./EnhancedCityPopup";
+import HeatmapLayer from "./MapViewHeatMapLayer";
 import { GROUNDWATER_DATA } from "../data/sightingsData";
 import "leaflet/dist/leaflet.css";
-import "leaflet.heat";
-import { OCEAN_DATA, getLayerColor } from "../data/oceanData";
-import L from "leaflet";
 import district from "../data/district"; // Your geojson file
 import { SIGHTINGS } from "../data/sightingsData";
 
@@ -131,65 +129,6 @@ function ResetView({ triggerReset, defaultCenter, defaultZoom }) {
   return null;
 }
 
-function HeatmapLayer({ data, layerType }) {
-  const map = useMap();
-
-  useEffect(() => {
-    if (
-      !data ||
-      !layerType ||
-      layerType === "none" ||
-      Object.keys(data).length === 0
-    ) {
-      return;
-    }
-
-    try {
-      const points = [];
-      Object.values(data).forEach((region) => {
-        if (region[layerType]) {
-          points.push(
-            ...region[layerType].points.map((p) => ({
-              lat: p.lat,
-              lng: p.lng,
-              value: p.value,
-            }))
-          );
-        }
-      });
-
-      if (points.length === 0) return;
-
-      const heatLayer = L.heatLayer(
-        points.map((p) => [p.lat, p.lng, p.value]),
-        {
-          radius: 35,
-          blur: 25,
-          maxZoom: 8,
-          minOpacity: 0.4,
-          max: Math.max(...points.map((p) => p.value)),
-          gradient: {
-            0.2: getLayerColor(points[0].value, layerType),
-            0.5: getLayerColor(
-              points[Math.floor(points.length / 2)].value,
-              layerType
-            ),
-            0.8: getLayerColor(points[points.length - 1].value, layerType),
-          },
-        }
-      ).addTo(map);
-
-      return () => {
-        map.removeLayer(heatLayer);
-      };
-    } catch (error) {
-      console.error("Error rendering heatmap:", error);
-    }
-  }, [map, data, layerType]);
-
-  return null;
-}
-
 function MapWatcher({
   defaultCenter,
   defaultZoom,
@@ -317,13 +256,6 @@ export default function MapView({
     }
   }, [activeLayer, markers.length]);
 
-  const visibleRegions = markers.reduce((acc, marker) => {
-    if (OCEAN_DATA[marker.regionKey]) {
-      acc[marker.regionKey] = OCEAN_DATA[marker.regionKey];
-    }
-    return acc;
-  }, {});
-
   function FloatingPanel() {
     if (!showResetButton) return null;
     return (
@@ -377,7 +309,7 @@ export default function MapView({
         <LightTiles />
         <FloatingPanel />
         {currentData &&(<ZoomToLocation lat={currentData.latitude} lng={currentData.longitude} zoom={12} />)}
-        <HeatmapLayer data={visibleRegions} layerType={activeLayer} />
+        <HeatmapLayer layerType={activeLayer} />
         <ResetView
           triggerReset={triggerReset}
           defaultCenter={defaultCenter}
@@ -1,53 +1,80 @@
-import { useEffect } from "react";
-import { useMap } from "react-leaflet";
+import { useEffect, useState } from "react";
+import { useMap, useMapEvents } from "react-leaflet";
 import L from "leaflet";
 import "leaflet.heat";
 import { getLayerColor } from "../data/oceanData";
+import { API_BASE_URL } from "../services/api";
 
-export default function HeatmapLayer({ data, layerType }) {
+const HEATMAP_API = `${API_BASE_URL}/api/heatmap`;
+
+// Viewport as the API's min_lng,min_lat,max_lng,max_lat, clamped to valid coordinates
+function viewportBbox(map) {
+  const bounds = map.getBounds();
+  return [
+    Math.max(bounds.getWest(), -180),
+    Math.max(bounds.getSouth(), -90),
+    Math.min(bounds.getEast(), 180),
+    Math.min(bounds.getNorth(), 90),
+  ].join(",");
+}
+
+export default function HeatmapLayer({ layerType }) {
   const map = useMap();
+  const [view, setView] = useState(() => ({
+    bbox: viewportBbox(map),
+    zoom: map.getZoom(),
+  }));
+  const [grid, setGrid] = useState(null);
 
+  useMapEvents({
+    moveend() {
+      setView({ bbox: viewportBbox(map), zoom: map.getZoom() });
+    },
+  });
+
+  // The server aggregates points into grid cells per zoom level and caches
+  // them per tile, so only the cells for the current viewport are fetched
   useEffect(() => {
-    if (
-      !data ||
-      !layerType ||
-      layerType === "none" ||
-      Object.keys(data).length === 0
-    ) {
+    if (!layerType || layerType === "none") {
+      setGrid(null);
       return;
     }
 
-    try {
-      const points = [];
-      Object.values(data).forEach((region) => {
-        if (region[layerType]) {
-          points.push(
-            ...region[layerType].points.map((p) => ({
-              lat: p.lat,
-              lng: p.lng,
-              value: p.value,
-            }))
-          );
+    const controller = new AbortController();
+    const params = new URLSearchParams({
+      bbox: view.bbox,
+      zoom: Math.round(view.zoom),
+    });
+    fetch(`${HEATMAP_API}/${encodeURIComponent(layerType)}?${params}`, {
+      signal: controller.signal,
+    })
+      .then((response) => (response.ok ? response.json() : null))
+      .then(setGrid)
+      .catch((error) => {
+        if (error.name !== "AbortError") {
+          console.error("Error loading heatmap:", error);
         }
       });
 
-      if (points.length === 0) return;
+    return () => controller.abort();
+  }, [layerType, view]);
 
+  useEffect(() => {
+    if (!grid || grid.cells.length === 0) return;
+
+    try {
       const heatLayer = L.heatLayer(
-        points.map((p) => [p.lat, p.lng, p.value]),
+        grid.cells.map((cell) => [cell.lat, cell.lng, cell.mean]),
         {
           radius: 35,
           blur: 25,
           maxZoom: 8,
           minOpacity: 0.4,
-          max: Math.max(...points.map((p) => p.value)),
+          max: grid.max,
           gradient: {
-            0.2: getLayerColor(points[0].value, layerType),
-            0.5: getLayerColor(
-              points[Math.floor(points.length / 2)].value,
-              layerType
-            ),
-            0.8: getLayerColor(points[points.length - 1].value, layerType),
+            0.2: getLayerColor(grid.min, layerType),
+            0.5: getLayerColor((grid.min + grid.max) / 2, layerType),
+            0.8: getLayerColor(grid.max, layerType),
           },
         }
       ).addTo(map);
@@ -58,7 +85,7 @@ export default function HeatmapLayer({ data, layerType }) {
     } catch (error) {
       console.error("Error rendering heatmap:", error);
     }
-  }, [map, data, layerType]);
+  }, [map, grid, layerType]);
 
   return null;
-}
\ No newline at end of file
+}
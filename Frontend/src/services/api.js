@@ -0,0 +1,3 @@
+// Backend base URL; set VITE_API_BASE_URL when the API is not on localhost:5000
+export const API_BASE_URL =
+  import.meta.env.VITE_API_BASE_URL || "http://localhost:5000";
@@ -1,17 +1,23 @@
-from flask import Flask, jsonify, request, send_file
+from flask import Flask, Response, jsonify, request
 from flask_cors import CORS
+import functools
+import hashlib
 import json
+import multiprocessing
 import os
-from sqlite3 import Error
-import pandas as pd
-import numpy as np
-from joblib import load
-import matplotlib.pyplot as plt
-from mpl_toolkits.mplot3d import Axes3D
-from sklearn.preprocessing import LabelEncoder
-import io
+import sys
 import base64
 
+from cache import ByteLRUCache, content_key
+import compression
+import heatmap
+from inference import DATA_YEAR, prediction_source
+from jobs import JobPool, JobQueueFull, JobTimeout
+from model_registry import get_file_version, get_model_info, warm_up
+import prediction_jobs
+import tasks
+import tiles
+
 # Import database functions
 from database import (
     init_db,
@@ -20,335 +26,304 @@ from database import (
     get_regions,
     get_sightings,
     get_groundwater_data,
+    iter_districts,
+    iter_sightings,
+    iter_groundwater_data,
     get_available_states,
     get_districts_by_state,
     get_stations_by_district,
+    get_stations_within,
+    get_nearest_stations,
+    get_region_bbox,
+    get_heatmap_layers,
+    get_heatmap_points,
     search_locations,
-    create_connection,
-    DB_PATH
+    get_prediction_job,
+    get_prediction_job_results,
+    get_stored_prediction,
+    save_prediction_summaries,
+    get_pool_stats,
+    get_write_generation,
+    MAX_PAGE_SIZE,
+    STATION_SOURCES,
+    TILE_LAYERS
 )
 
 # Initialize Flask app
 app = Flask(__name__)
 CORS(app)  # Enable CORS for all routes
 
-# Load the model globally
-model = load('ground_water_predictor.pkl')
+# Prediction and plot rendering run in worker processes (inline with AQUAGUARD_JOB_WORKERS=0)
+job_pool = JobPool()
 
-def create_tables():
-    """Create the database tables if they don't exist"""
-    conn = create_connection()
-    if conn:
-        try:
-            cursor = conn.cursor()
-            
-            # Create ocean_data table
-            cursor.execute('''
-            CREATE TABLE IF NOT EXISTS ocean_data (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                region TEXT NOT NULL,
-                data_type TEXT NOT NULL,
-                min_value REAL,
-                max_value REAL
-            )
-            ''')
-            
-            # Create ocean_data_points table
-            cursor.execute('''
-            CREATE TABLE IF NOT EXISTS ocean_data_points (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                ocean_data_id INTEGER,
-                latitude REAL NOT NULL,
-                longitude REAL NOT NULL,
-                value REAL NOT NULL,
-                FOREIGN KEY (ocean_data_id) REFERENCES ocean_data (id)
-            )
-            ''')
-            
-            # Create district table
-            cursor.execute('''
-            CREATE TABLE IF NOT EXISTS districts (
-                id TEXT PRIMARY KEY,
-                color TEXT,
-                agency_name TEXT,
-                state_name TEXT NOT NULL,
-                district_name TEXT NOT NULL,
-                tahsil_name TEXT,
-                station_name TEXT,
-                latitude REAL,
-                longitude REAL,
-                station_type TEXT,
-                station_status TEXT
-            )
-            ''')
-            
-            # Create regions table
-            cursor.execute('''
-            CREATE TABLE IF NOT EXISTS regions (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                name TEXT NOT NULL,
-                sw_lat REAL,
-                sw_lng REAL,
-                ne_lat REAL,
-                ne_lng REAL,
-                center_lat REAL,
-                center_lng REAL
-            )
-            ''')
-            
-            # Create sightings table
-            cursor.execute('''
-            CREATE TABLE IF NOT EXISTS sightings (
-                id TEXT PRIMARY KEY,
-                state_name TEXT NOT NULL,
-                district_name TEXT NOT NULL,
-                station_name TEXT,
-                latitude REAL,
-                longitude REAL,
-                temperature REAL,
-                ph REAL,
-                salinity REAL
-            )
-            ''')
-            
-            # Create groundwater table
-            cursor.execute('''
-            CREATE TABLE IF NOT EXISTS groundwater (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                state_name TEXT NOT NULL,
-                district_name TEXT NOT NULL,
-                city_name TEXT,
-                year INTEGER,
-                level REAL,
-                quality TEXT,
-                latitude REAL,
-                longitude REAL,
-                color TEXT,
-                rainfall REAL,
-                annual_extractable REAL,
-                current_extraction REAL,
-                ground_water_recharge REAL,
-                natural_discharges REAL,
-                extraction_percentage REAL,
-                historical_levels TEXT,
-                monthly_rainfall TEXT
-            )
-            ''')
-            
-            conn.commit()
-            print("Database tables created successfully")
-        except Error as e:
-            print(f"Error creating tables: {e}")
-        finally:
-            conn.close()
-
-def populate_database():
-    """Populate the database with sample data"""
-    conn = create_connection()
-    if conn:
-        try:
-            cursor = conn.cursor()
-            
-            # Check if ocean_data is already populated
-            cursor.execute("SELECT COUNT(*) FROM ocean_data")
-            if cursor.fetchone()[0] > 0:
-                print("Database already populated, skipping initialization")
-                return
-            
-            # Populate ocean_data and ocean_data_points
-            # West Bengal - Temperature
-            cursor.execute('''
-            INSERT INTO ocean_data (region, data_type, min_value, max_value)
-            VALUES (?, ?, ?, ?)
-            ''', ('west_bengal', 'temperature', 26, 29))
-            wb_temp_id = cursor.lastrowid
-            
-            temp_points = [
-                (wb_temp_id, 21.8, 87.75, 28),
-                (wb_temp_id, 21.2, 88.0, 27.5),
-                (wb_temp_id, 22.0, 88.5, 26.8)
-            ]
-            cursor.executemany('''
-            INSERT INTO ocean_data_points (ocean_data_id, latitude, longitude, value)
-            VALUES (?, ?, ?, ?)
-            ''', temp_points)
-            
-            # West Bengal - Salinity
-            cursor.execute('''
-            INSERT INTO ocean_data (region, data_type, min_value, max_value)
-            VALUES (?, ?, ?, ?)
-            ''', ('west_bengal', 'salinity', 32, 35))
-            wb_sal_id = cursor.lastrowid
-            
-            sal_points = [
-                (wb_sal_id, 21.8, 87.75, 33.5),
-                (wb_sal_id, 21.2, 88.0, 34.2),
-                (wb_sal_id, 22.0, 88.5, 32.8)
-            ]
-            cursor.executemany('''
-            INSERT INTO ocean_data_points (ocean_data_id, latitude, longitude, value)
-            VALUES (?, ?, ?, ?)
-            ''', sal_points)
-            
-            # West Bengal - pH
-            cursor.execute('''
-            INSERT INTO ocean_data (region, data_type, min_value, max_value)
-            VALUES (?, ?, ?, ?)
-            ''', ('west_bengal', 'ph', 7.8, 8.4))
-            wb_ph_id = cursor.lastrowid
-            
-            ph_points = [
-                (wb_ph_id, 21.8, 87.75, 8.1),
-                (wb_ph_id, 21.2, 88.0, 8.2),
-                (wb_ph_id, 22.0, 88.5, 7.9)
-            ]
-            cursor.executemany('''
-            INSERT INTO ocean_data_points (ocean_data_id, latitude, longitude, value)
-            VALUES (?, ?, ?, ?)
-            ''', ph_points)
-            
-            # Maharashtra - Temperature
-            cursor.execute('''
-            INSERT INTO ocean_data (region, data_type, min_value, max_value)
-            VALUES (?, ?, ?, ?)
-            ''', ('maharashtra', 'temperature', 25, 30))
-            mh_temp_id = cursor.lastrowid
-            
-            temp_points = [
-                (mh_temp_id, 18.9, 72.8, 28.5),
-                (mh_temp_id, 19.1, 73.0, 27.2),
-                (mh_temp_id, 18.4, 72.9, 29.1)
-            ]
-            cursor.executemany('''
-            INSERT INTO ocean_data_points (ocean_data_id, latitude, longitude, value)
-            VALUES (?, ?, ?, ?)
-            ''', temp_points)
-            
-            # Maharashtra - Salinity
-            cursor.execute('''
-            INSERT INTO ocean_data (region, data_type, min_value, max_value)
-            VALUES (?, ?, ?, ?)
-            ''', ('maharashtra', 'salinity', 33, 36))
-            mh_sal_id = cursor.lastrowid
-            
-            sal_points = [
-                (mh_sal_id, 18.9, 72.8, 34.1),
-                (mh_sal_id, 19.1, 73.0, 35.3),
-                (mh_sal_id, 18.4, 72.9, 33.7)
-            ]
-            cursor.executemany('''
-            INSERT INTO ocean_data_points (ocean_data_id, latitude, longitude, value)
-            VALUES (?, ?, ?, ?)
-            ''', sal_points)
-            
-            # Maharashtra - pH
-            cursor.execute('''
-            INSERT INTO ocean_data (region, data_type, min_value, max_value)
-            VALUES (?, ?, ?, ?)
-            ''', ('maharashtra', 'ph', 7.7, 8.3))
-            mh_ph_id = cursor.lastrowid
-            
-            ph_points = [
-                (mh_ph_id, 18.9, 72.8, 8.0),
-                (mh_ph_id, 19.1, 73.0, 7.9),
-                (mh_ph_id, 18.4, 72.9, 8.2)
-            ]
-            cursor.executemany('''
-            INSERT INTO ocean_data_points (ocean_data_id, latitude, longitude, value)
-            VALUES (?, ?, ?, ?)
-            ''', ph_points)
-            
-            # Populate districts
-            districts = [
-                ('station_001', '#F48FB1', 'CGWB', 'DELHI', 'Nazul Land', 'Nazul Land', 'Lalita Park (Pz)', 28.6325, 77.27166667, 'GROUND', 'Not Installed'),
-                ('station_002', '#4DD0E1', 'CGWB', 'DELHI', 'New Delhi', 'New Delhi', 'Lodhi Garden (Deep)', 28.59027778, 77.21638889, 'GROUND', 'Not Installed'),
-                ('station_003', '#FFB74D', 'CGWB', 'DELHI', 'New Delhi', 'New Delhi', 'Lodhi Garden (Shallow)', 28.59027778, 77.21638889, 'GROUND', 'Not Installed')
-            ]
-            cursor.executemany('''
-            INSERT INTO districts (id, color, agency_name, state_name, district_name, tahsil_name, station_name, latitude, longitude, station_type, station_status)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            ''', districts)
-            
-            # Populate regions
-            regions = [
-                ('WEST BENGAL', 21.25, 85.5, 27.13, 89.5, 22.9868, 87.855),
-                ('MAHARASHTRA', 15.6, 72.65, 22.03, 80.9, 19.75, 75.71),
-                ('TAMIL NADU', 8.07, 76.23, 13.49, 80.34, 11.13, 78.66),
-                ('ANDHRA PRADESH', 12.6, 76.7, 19.1, 84.8, 15.9, 79.74)
-            ]
-            cursor.executemany('''
-            INSERT INTO regions (name, sw_lat, sw_lng, ne_lat, ne_lng, center_lat, center_lng)
-            VALUES (?, ?, ?, ?, ?, ?, ?)
-            ''', regions)
-            
-            # Populate sightings
-            sightings = [
-                ('sight_001', 'WEST BENGAL', 'Kolkata', 'Salt Lake', 22.58, 88.42, 28.5, 8.1, 33.2),
-                ('sight_002', 'MAHARASHTRA', 'Mumbai', 'Worli', 19.02, 72.82, 29.1, 7.9, 34.5)
-            ]
-            cursor.executemany('''
-            INSERT INTO sightings (id, state_name, district_name, station_name, latitude, longitude, temperature, ph, salinity)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-            ''', sightings)
-            
-            # Populate groundwater
-            groundwater = [
-                ('WEST BENGAL', 'Kolkata', None, 2023, 12.5, 'Good', 22.57, 88.36, '#64B5F6', 1443.8, 4350.74, 819.19, 123.4, 6.7, 81.82, 
-                 json.dumps([{"year": 2018, "level": 14.2}, {"year": 2019, "level": 13.8}, {"year": 2020, "level": 13.1}, {"year": 2021, "level": 12.9}, {"year": 2022, "level": 12.7}, {"year": 2023, "level": 12.5}]),
-                 json.dumps([{"month": "Jan", "rainfall": 15.2}, {"month": "Feb", "rainfall": 25.1}, {"month": "Mar", "rainfall": 35.8}, {"month": "Apr", "rainfall": 58.4}, {"month": "May", "rainfall": 156.2}, {"month": "Jun", "rainfall": 305.7}, {"month": "Jul", "rainfall": 325.4}, {"month": "Aug", "rainfall": 328.6}, {"month": "Sep", "rainfall": 252.3}, {"month": "Oct", "rainfall": 125.6}, {"month": "Nov", "rainfall": 28.9}, {"month": "Dec", "rainfall": 12.6}])),
-                ('WEST BENGAL', 'Howrah', None, 2023, 10.2, 'Moderate', 22.59, 88.31, '#FFB74D', 1387.5, 3875.45, 782.65, 118.9, 5.9, 78.45, 
-                 json.dumps([{"year": 2018, "level": 12.8}, {"year": 2019, "level": 12.1}, {"year": 2020, "level": 11.5}, {"year": 2021, "level": 10.9}, {"year": 2022, "level": 10.5}, {"year": 2023, "level": 10.2}]),
-                 json.dumps([{"month": "Jan", "rainfall": 14.1}, {"month": "Feb", "rainfall": 22.3}, {"month": "Mar", "rainfall": 34.2}, {"month": "Apr", "rainfall": 55.8}, {"month": "May", "rainfall": 148.7}, {"month": "Jun", "rainfall": 298.5}, {"month": "Jul", "rainfall": 312.9}, {"month": "Aug", "rainfall": 321.1}, {"month": "Sep", "rainfall": 245.7}, {"month": "Oct", "rainfall": 119.8}, {"month": "Nov", "rainfall": 25.7}, {"month": "Dec", "rainfall": 11.4}])),
-                ('MAHARASHTRA', 'Mumbai', None, 2023, 15.8, 'Poor', 19.07, 72.87, '#E57373', 2165.3, 5842.38, 1985.61, 224.7, 12.8, 92.35, 
-                 json.dumps([{"year": 2018, "level": 12.6}, {"year": 2019, "level": 13.5}, {"year": 2020, "level": 14.2}, {"year": 2021, "level": 14.8}, {"year": 2022, "level": 15.3}, {"year": 2023, "level": 15.8}]),
-                 json.dumps([{"month": "Jan", "rainfall": 0.6}, {"month": "Feb", "rainfall": 1.3}, {"month": "Mar", "rainfall": 0.2}, {"month": "Apr", "rainfall": 0.7}, {"month": "May", "rainfall": 12.5}, {"month": "Jun", "rainfall": 523.1}, {"month": "Jul", "rainfall": 799.7}, {"month": "Aug", "rainfall": 546.2}, {"month": "Sep", "rainfall": 327.1}, {"month": "Oct", "rainfall": 55.8}, {"month": "Nov", "rainfall": 16.8}, {"month": "Dec", "rainfall": 5.9}])),
-                ('MAHARASHTRA', 'Pune', None, 2023, 8.9, 'Good', 18.52, 73.85, '#64B5F6', 722.8, 3267.92, 578.45, 145.3, 8.2, 65.74, 
-                 json.dumps([{"year": 2018, "level": 11.2}, {"year": 2019, "level": 10.7}, {"year": 2020, "level": 10.1}, {"year": 2021, "level": 9.5}, {"year": 2022, "level": 9.2}, {"year": 2023, "level": 8.9}]),
-                 json.dumps([{"month": "Jan", "rainfall": 0.8}, {"month": "Feb", "rainfall": 1.0}, {"month": "Mar", "rainfall": 1.1}, {"month": "Apr", "rainfall": 8.5}, {"month": "May", "rainfall": 22.6}, {"month": "Jun", "rainfall": 137.8}, {"month": "Jul", "rainfall": 181.5}, {"month": "Aug", "rainfall": 138.6}, {"month": "Sep", "rainfall": 146.1}, {"month": "Oct", "rainfall": 70.1}, {"month": "Nov", "rainfall": 25.6}, {"month": "Dec", "rainfall": 4.8}]))
-            ]
-            cursor.executemany('''
-            INSERT INTO groundwater (state_name, district_name, city_name, year, level, quality, latitude, longitude, color, 
-                                     rainfall, annual_extractable, current_extraction, ground_water_recharge, natural_discharges, 
-                                     extraction_percentage, historical_levels, monthly_rainfall)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            ''', groundwater)
-            
-            conn.commit()
-            print("Database populated successfully")
-        except Error as e:
-            print(f"Error populating database: {e}")
-        finally:
-            conn.close()
+def busy_response(e):
+    """503 telling the client when to retry because the job queue is full"""
+    response = jsonify({'error': 'Server is busy, please retry later'})
+    response.status_code = 503
+    response.headers['Retry-After'] = str(e.retry_after)
+    return response
 
 # API Routes
 @app.route('/')
 def index():
     return "AquaGuard Groundwater Monitoring API"
 
+@app.route('/api/health/db', methods=['GET'])
+def db_health_endpoint():
+    """Get database connection pool counters"""
+    return jsonify(get_pool_stats())
+
+@app.route('/api/health/model', methods=['GET'])
+def model_health_endpoint():
+    """Get the loaded prediction model's version"""
+    if job_pool.workers > 0:
+        # Report the model the workers serve, not this process's
+        if not job_pool.stats()['started']:
+            return jsonify({'loaded': False}), 503
+        try:
+            info = job_pool.run('model-info', tasks.model_info)
+        except JobQueueFull as e:
+            return busy_response(e)
+        except JobTimeout:
+            return jsonify({'loaded': False}), 503
+    else:
+        info = get_model_info()
+    if info is None:
+        return jsonify({'loaded': False}), 503
+    return jsonify(dict(info, loaded=True))
+
+@app.route('/api/health/jobs', methods=['GET'])
+def jobs_health_endpoint():
+    """Get job queue depth, wait times and counters"""
+    return jsonify(job_pool.stats())
+
+@app.route('/api/health/cache', methods=['GET'])
+def cache_health_endpoint():
+    """Get plot, heatmap and response cache and figure template counters"""
+    stats = {'plots': plot_cache.stats(), 'heatmap': heatmap_cache.stats(), 'responses': response_cache.stats()}
+    # Only report templates once a plot has been rendered; importing plots loads matplotlib
+    if 'plots' in sys.modules:
+        stats['plot_templates'] = sys.modules['plots'].get_template_stats()
+    return jsonify(stats)
+
+@app.after_request
+def compress_response(response):
+    """
+    Compress large text responses with the best encoding the client accepts.
+    
+    Responses that are already encoded (cached ones), streamed or sent from
+    files pass through. A compressed response's ETag is weakened, as it no
+    longer matches the bytes it was computed from.
+    """
+    if (response.status_code != 200 or response.direct_passthrough or response.is_streamed
+            or 'Content-Encoding' in response.headers):
+        return response
+    
+    body = response.get_data()
+    if not compression.compressible(response.mimetype, len(body)):
+        return response
+    response.vary.add('Accept-Encoding')
+    encoding = compression.negotiate(request.accept_encodings)
+    if encoding is None:
+        return response
+    
+    response.set_data(compression.compress(body, encoding))
+    response.headers['Content-Encoding'] = encoding
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(etag, weak=True)
+    return response
+
+# Listing endpoints can stream one JSON document per line instead of one big array
+NDJSON_MIMETYPE = 'application/x-ndjson'
+STREAM_CHUNK_ROWS = int(os.environ.get('AQUAGUARD_STREAM_CHUNK_ROWS', '200'))
+
+def wants_stream():
+    """Whether the client asked for NDJSON, via ?stream=1 or its Accept header"""
+    if request.args.get('stream', '').lower() in ('1', 'true', 'yes'):
+        return True
+    return request.accept_mimetypes.best_match(['application/json', NDJSON_MIMETYPE]) == NDJSON_MIMETYPE
+
+def ndjson_response(rows):
+    """Stream rows as newline-delimited JSON, a chunk of STREAM_CHUNK_ROWS lines at a time"""
+    def generate():
+        lines = []
+        for row in rows:
+            lines.append(json.dumps(row, separators=(',', ':')))
+            if len(lines) >= STREAM_CHUNK_ROWS:
+                yield '\n'.join(lines) + '\n'
+                lines = []
+        if lines:
+            yield '\n'.join(lines) + '\n'
+    
+    response = Response(generate(), mimetype=NDJSON_MIMETYPE)
+    response.headers['Vary'] = 'Accept'
+    return response
+
+def parse_bbox(value):
+    """Parse a min_lng,min_lat,max_lng,max_lat viewport; raises ValueError"""
+    try:
+        min_lng, min_lat, max_lng, max_lat = (float(part) for part in value.split(','))
+    except ValueError:
+        raise ValueError('bbox must be min_lng,min_lat,max_lng,max_lat')
+    if not (-180 <= min_lng <= max_lng <= 180 and -90 <= min_lat <= max_lat <= 90):
+        raise ValueError('bbox must be min_lng,min_lat,max_lng,max_lat within valid coordinates')
+    return min_lng, min_lat, max_lng, max_lat
+
+def query_arg(name, type, default=None):
+    """
+    Read an int or float query parameter, or default when it isn't given.
+    
+    Raises ValueError naming the parameter when it doesn't parse.
+    """
+    if name not in request.args:
+        return default
+    value = request.args.get(name, type=type)
+    if value is None:
+        raise ValueError(f"{name} must be {'an integer' if type is int else 'a number'}")
+    return value
+
+def list_params():
+    """
+    Read the list endpoints' query parameters.
+    
+    - fields: Comma-separated columns to return
+    - bbox: Only rows inside min_lng,min_lat,max_lng,max_lat
+    - limit: Page size, at most MAX_PAGE_SIZE; turns on pagination
+    - after: Cursor from the previous page's next_cursor
+    Returns a dict of the given parameters, or raises ValueError.
+    """
+    params = {}
+    if request.args.get('fields'):
+        params['fields'] = [field.strip() for field in request.args['fields'].split(',') if field.strip()]
+    if request.args.get('bbox'):
+        params['bbox'] = parse_bbox(request.args['bbox'])
+    if 'limit' in request.args or 'after' in request.args:
+        limit = query_arg('limit', int, MAX_PAGE_SIZE)
+        if not 1 <= limit <= MAX_PAGE_SIZE:
+            raise ValueError(f'limit must be between 1 and {MAX_PAGE_SIZE}')
+        params['limit'] = limit
+        params['after'] = request.args.get('after')
+    return params
+
+def page_response(fetch, params, cursor_key):
+    """
+    Fetch one page with keyset pagination and wrap it with the next page's cursor.
+    
+    One row more than the page size is fetched to tell whether another page
+    follows; next_cursor is None on the last page.
+    """
+    limit = params['limit']
+    items = fetch(**dict(params, limit=limit + 1))
+    next_cursor = None
+    if len(items) > limit:
+        items = items[:limit]
+        next_cursor = items[-1][cursor_key] if isinstance(items[-1], dict) else items[-1]
+    return jsonify({'items': items, 'next_cursor': next_cursor})
+
+def list_response(fetch, stream, cursor_key='id'):
+    """Respond to a list endpoint as JSON, a page of JSON or NDJSON, following its query parameters"""
+    try:
+        params = list_params()
+        if wants_stream():
+            return ndjson_response(stream(**params))
+        if 'limit' in params:
+            return page_response(fetch, params, cursor_key)
+        return jsonify(fetch(**params))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+# Serialized responses of the read-only endpoints, keyed by path, query and the database write generation
+RESPONSE_MAX_AGE = int(os.environ.get('AQUAGUARD_RESPONSE_MAX_AGE', '0'))
+response_cache = ByteLRUCache(int(os.environ.get('AQUAGUARD_RESPONSE_CACHE_BYTES', str(64 * 1024 * 1024))))
+
+def cached_response(view):
+    """
+    Serve a read-only endpoint's successful responses from response_cache.
+    
+    Every write to the tables the endpoints read bumps the database's write
+    generation, which is part of the cache key, so a cached body is never
+    served after the data behind it changed. Responses carry a strong ETag
+    of their body: a matching If-None-Match gets a 304 without the body.
+    Each compressed variant is stored next to the body the first time a
+    client accepts it, so hits never compress. NDJSON streams are passed
+    through uncached.
+    """
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        generation = get_write_generation()
+        if generation is None or wants_stream():
+            return view(*args, **kwargs)
+        
+        # Entries of older generations can't be hit again
+        response_cache.set_generation(generation)
+        key = content_key('response', request.path, sorted(request.args.items(multi=True)), generation)
+        cached = response_cache.get(key)
+        if cached is None:
+            response = app.make_response(view(*args, **kwargs))
+            if response.status_code != 200 or response.is_streamed:
+                return response
+            body = response.get_data()
+            # ETag, content type and body, so a hit builds the response without touching the body
+            cached = b'\n'.join([hashlib.sha256(body).hexdigest()[:32].encode('ascii'),
+                                 response.mimetype.encode('ascii'), body])
+            response_cache.put(key, cached)
+        # Only the header lines are split off; the body is copied out only when it is sent
+        etag_end = cached.index(b'\n')
+        mimetype_end = cached.index(b'\n', etag_end + 1)
+        etag = cached[:etag_end].decode('ascii')
+        mimetype = cached[etag_end + 1:mimetype_end].decode('ascii')
+        
+        encoding = None
+        if compression.compressible(mimetype, len(cached) - mimetype_end - 1):
+            encoding = compression.negotiate(request.accept_encodings)
+        
+        if request.if_none_match.contains_weak(etag):
+            response = Response(status=304)
+        elif encoding is None:
+            response = Response(cached[mimetype_end + 1:], mimetype=mimetype)
+        else:
+            variant_key = f'{key}-{encoding}'
+            body = response_cache.get(variant_key)
+            if body is None:
+                body = compression.compress(cached[mimetype_end + 1:], encoding, stored=True)
+                response_cache.put(variant_key, body)
+            response = Response(body, mimetype=mimetype)
+            response.headers['Content-Encoding'] = encoding
+        # Compressed variants share the body's ETag, so it only holds for weak comparison
+        response.set_etag(etag, weak=encoding is not None)
+        response.headers['Cache-Control'] = f'public, max-age={RESPONSE_MAX_AGE}, must-revalidate'
+        response.headers['Vary'] = 'Accept, Accept-Encoding'
+        return response
+    return wrapper
+
 # Ocean data endpoints
 @app.route('/api/ocean-data', methods=['GET'])
+@cached_response
 def get_ocean_data_endpoint():
     """Get all ocean data"""
     result = get_ocean_data()
     return jsonify(result)
                 
 @app.route('/api/ocean-data/regions/<region>', methods=['GET'])
+@cached_response
 def get_ocean_data_by_region(region):
     """Get ocean data for a specific region"""
-    # We could add a specific function for this in database.py
-    # For now, filter the results from get_ocean_data
-    all_data = get_ocean_data()
-    region_data = [data for data in all_data if data.get('region') == region]
-    return jsonify(region_data)
+    result = get_ocean_data(region)
+    return jsonify(result)
 
 # District data endpoints
 @app.route('/api/districts', methods=['GET'])
+@cached_response
 def get_districts_endpoint():
-    """Get all district data"""
-    result = get_districts()
-    return jsonify(result)
+    """
+    Get all district data, as NDJSON with ?stream=1 or Accept: application/x-ndjson.
+    Supports ?fields=, ?bbox= and keyset pagination with ?limit= and ?after=.
+    """
+    return list_response(get_districts, iter_districts)
     
 @app.route('/api/districts/<state>', methods=['GET'])
+@cached_response
 def get_districts_by_state_endpoint(state):
     """Get district data for a specific state"""
     result = get_districts_by_state(state)
@@ -356,6 +331,7 @@ def get_districts_by_state_endpoint(state):
 
 # Regions data endpoints
 @app.route('/api/regions', methods=['GET'])
+@cached_response
 def get_regions_endpoint():
     """Get all region data"""
     result = get_regions()
@@ -363,29 +339,42 @@ def get_regions_endpoint():
 
 # Sightings data endpoints
 @app.route('/api/sightings', methods=['GET'])
+@cached_response
 def get_sightings_endpoint():
-    """Get all sightings data"""
-    result = get_sightings()
-    return jsonify(result)
+    """
+    Get all sightings data, as NDJSON with ?stream=1 or Accept: application/x-ndjson.
+    Supports ?fields=, ?bbox= and keyset pagination with ?limit= and ?after=.
+    """
+    return list_response(get_sightings, iter_sightings)
     
 # Groundwater data endpoints
 @app.route('/api/groundwater', methods=['GET'])
+@cached_response
 def get_groundwater_data_endpoint():
-    """Get all groundwater data or filter by state and district"""
+    """
+    Get all groundwater data or filter by state and district.
+    
+    With ?stream=1 or Accept: application/x-ndjson, data points are streamed
+    one per line, each with its state, district and city.
+    """
     state = request.args.get('state')
     district = request.args.get('district')
     
+    if wants_stream():
+        return ndjson_response(iter_groundwater_data(state, district))
     result = get_groundwater_data(state, district)
     return jsonify(result)
     
 # Search endpoints to support SearchBar component
 @app.route('/api/search/states', methods=['GET'])
+@cached_response
 def get_available_states_endpoint():
     """Get all unique states from sightings data"""
     states = get_available_states()
     return jsonify(states)
 
 @app.route('/api/search/districts', methods=['GET'])
+@cached_response
 def get_available_districts_endpoint():
     """Get all unique districts from sightings data, optionally filtered by state"""
     state = request.args.get('state')
@@ -393,291 +382,501 @@ def get_available_districts_endpoint():
     return jsonify(districts)
 
 @app.route('/api/search/stations', methods=['GET'])
+@cached_response
 def get_available_stations_endpoint():
-    """Get all unique stations from sightings data, optionally filtered by state and district"""
+    """
+    Get all unique stations from sightings data, optionally filtered by state and district.
+    Pages through station names with ?limit= and ?after=<last name>.
+    """
     state = request.args.get('state')
     district = request.args.get('district')
     
     if state and district:
-        stations = get_stations_by_district(state, district)
+        fetch = lambda after=None, limit=None: get_stations_by_district(state, district, after, limit)
     else:
         # If no state and district provided, we return an empty list for now
         # This could be enhanced in database.py to return all stations
-        stations = []
+        fetch = lambda after=None, limit=None: []
+    
+    try:
+        params = list_params()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    if 'limit' in params:
+        return page_response(fetch, {'after': params['after'], 'limit': params['limit']}, None)
+    return jsonify(fetch())
+
+# Spatial station queries
+MAX_NEAREST = 100
+
+def station_source():
+    """Read the ?source= table to search (default districts); raises ValueError"""
+    source = request.args.get('source', 'districts')
+    if source not in STATION_SOURCES:
+        raise ValueError(f"source must be one of {', '.join(STATION_SOURCES)}")
+    return source
+
+@app.route('/api/stations/within', methods=['GET'])
+@cached_response
+def stations_within_endpoint():
+    """
+    Get stations inside a map viewport or region.
+    - bbox: min_lng,min_lat,max_lng,max_lat, or
+    - region: Name of a region whose bounds to use
+    - source: districts (default), sightings or groundwater
+    - limit: At most this many stations (default and maximum MAX_PAGE_SIZE)
+    """
+    try:
+        source = station_source()
+        if request.args.get('bbox'):
+            bbox = parse_bbox(request.args['bbox'])
+        elif request.args.get('region'):
+            bbox = get_region_bbox(request.args['region'])
+            if bbox is None:
+                return jsonify({'error': 'Region not found'}), 404
+        else:
+            return jsonify({'error': 'bbox or region is required'}), 400
+        limit = query_arg('limit', int, MAX_PAGE_SIZE)
+        if not 1 <= limit <= MAX_PAGE_SIZE:
+            raise ValueError(f'limit must be between 1 and {MAX_PAGE_SIZE}')
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    return jsonify(get_stations_within(bbox, source, limit))
+
+@app.route('/api/stations/nearest', methods=['GET'])
+@cached_response
+def nearest_stations_endpoint():
+    """
+    Get the stations nearest to a point, closest first, with their distance in km.
+    - lat, lng: The point
+    - count: How many stations (default 10, at most MAX_NEAREST)
+    - max_km: Leave out stations farther than this
+    - source: districts (default), sightings or groundwater
+    """
+    try:
+        source = station_source()
+        if 'lat' not in request.args or 'lng' not in request.args:
+            return jsonify({'error': 'lat and lng are required'}), 400
+        lat = query_arg('lat', float)
+        lng = query_arg('lng', float)
+        if not (-90 <= lat <= 90 and -180 <= lng <= 180):
+            raise ValueError('lat and lng must be valid coordinates')
+        count = query_arg('count', int, 10)
+        if not 1 <= count <= MAX_NEAREST:
+            raise ValueError(f'count must be between 1 and {MAX_NEAREST}')
+        max_km = query_arg('max_km', float)
+        if max_km is not None and not max_km > 0:
+            raise ValueError('max_km must be positive')
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     
-    return jsonify(stations)
+    return jsonify(get_nearest_stations(lat, lng, count, source, max_km))
+
+# Aggregated heatmap tiles, keyed by layer, tile and the database write generation
+HEATMAP_MAX_TILES = int(os.environ.get('AQUAGUARD_HEATMAP_MAX_TILES', '64'))
+heatmap_cache = ByteLRUCache(int(os.environ.get('AQUAGUARD_HEATMAP_CACHE_BYTES', str(32 * 1024 * 1024))))
+
+def get_cached_tile(layer, zoom, x, y, stamp):
+    """
+    Return a heatmap tile as ([min, max] of its cell means or None, its cells as a JSON array).
+    
+    Tiles are cached already encoded, so a cached tile is copied into the
+    response without being decoded again.
+    """
+    key = content_key('heatmap', layer, zoom, x, y, heatmap.CELLS_PER_TILE, stamp)
+    cached = heatmap_cache.get(key)
+    if cached is None:
+        bounds = heatmap.tile_bounds(zoom, x, y)
+        cells = heatmap.aggregate_tile(get_heatmap_points(layer, bounds), bounds)
+        means = [cell['mean'] for cell in cells]
+        mean_range = [min(means), max(means)] if cells else None
+        cached = (json.dumps(mean_range) + '\n' + json.dumps(cells, separators=(',', ':'))).encode('utf-8')
+        heatmap_cache.put(key, cached)
+    mean_range, cells = cached.split(b'\n', 1)
+    return json.loads(mean_range), cells
+
+@app.route('/api/heatmap/<layer>', methods=['GET'])
+def heatmap_endpoint(layer):
+    """
+    Get a layer's points aggregated into grid cells for a heatmap.
+    - layer: An ocean data type (e.g. temperature) or groundwater
+    - bbox: min_lng,min_lat,max_lng,max_lat of the viewport
+    - zoom: Map zoom level; each zoom level halves the cell size
+    Returns the count, mean, min and max of every non-empty cell in the tiles
+    overlapping bbox, plus the range of the cell means.
+    """
+    if layer not in get_heatmap_layers():
+        return jsonify({'error': f'Unknown layer {layer}'}), 404
+    try:
+        if not request.args.get('bbox') or 'zoom' not in request.args:
+            raise ValueError('bbox and zoom are required')
+        bbox = parse_bbox(request.args['bbox'])
+        zoom = int(request.args['zoom'])
+        if not 0 <= zoom <= heatmap.MAX_ZOOM:
+            raise ValueError(f'zoom must be between 0 and {heatmap.MAX_ZOOM}')
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    tiles = heatmap.tiles_for_bbox(bbox, zoom)
+    if len(tiles) > HEATMAP_MAX_TILES:
+        return jsonify({'error': 'bbox covers too many tiles at this zoom; zoom in or narrow it'}), 400
+    
+    # Bumped by every insert, update and delete of the points, so cells are never stale
+    stamp = get_write_generation()
+    heatmap_cache.set_generation(stamp)
+    mean_ranges = []
+    tile_cells = []
+    for x, y in tiles:
+        mean_range, cells = get_cached_tile(layer, zoom, x, y, stamp)
+        if mean_range is not None:
+            mean_ranges.append(mean_range)
+            tile_cells.append(cells[1:-1])
+    
+    summary = json.dumps({
+        'layer': layer,
+        'zoom': zoom,
+        'cell_size': heatmap.tile_size(zoom) / heatmap.CELLS_PER_TILE,
+        'tiles': len(tiles),
+        'min': min(low for low, _ in mean_ranges) if mean_ranges else None,
+        'max': max(high for _, high in mean_ranges) if mean_ranges else None,
+    }, separators=(',', ':'))
+    # Splice the tiles' encoded cells into the summary object
+    body = summary[:-1].encode('utf-8') + b',"cells":[' + b','.join(tile_cells) + b']}'
+    return Response(body, mimetype='application/json')
+
+# Precomputed station map tiles
+TILE_MAX_AGE = int(os.environ.get('AQUAGUARD_TILE_MAX_AGE', '60'))
+
+@app.route('/api/tiles/<layer>/<int:z>/<int:x>/<int:y>', methods=['GET'])
+def tile_endpoint(layer, z, x, y):
+    """
+    Get a Web Mercator map tile of a station layer as GeoJSON.
+    - layer: stations or groundwater
+    - z, x, y: The tile, with z at most tiles.MAX_ZOOM
+    Stations close together on screen come back as one point with cluster
+    and point_count properties (and mean_level for groundwater).
+    """
+    if layer not in TILE_LAYERS or z > tiles.MAX_ZOOM or x >= 2 ** z or y >= 2 ** z:
+        return jsonify({'error': 'Tile not found'}), 404
+    
+    etag, data = tiles.get_tile(layer, z, x, y)
+    if request.if_none_match.contains_weak(etag):
+        response = Response(status=304)
+    else:
+        response = Response(data, mimetype='application/geo+json')
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = f'public, max-age={TILE_MAX_AGE}'
+    return response
 
 @app.route('/api/search', methods=['GET'])
+@cached_response
 def search_endpoint():
     """
     Search for stations based on query parameters:
-    - q: General search query (searches state, district, and station)
+    - q: General search query (searches state, district, city and station)
+    - limit: Maximum number of results (default 20, at most 100)
+    - fuzzy: Set to 1 to tolerate typos in the query
     """
     query = request.args.get('q', '')
-    results = search_locations(query)
+    limit = min(max(request.args.get('limit', 20, type=int), 1), 100)
+    fuzzy = request.args.get('fuzzy', '').lower() in ('1', 'true', 'yes')
+    results = search_locations(query, limit, fuzzy)
     return jsonify(results)
 
 
 
-# ML prediction endpoint
+# Rendered plots, keyed by a hash of the values they show and the render options,
+# and dropped when the database write generation changes
+PLOT_OPTIONS = {'format': 'png', 'dpi': 150, 'version': 1}
+PLOT_MAX_AGE = int(os.environ.get('AQUAGUARD_PLOT_MAX_AGE', '3600'))
+plot_cache = ByteLRUCache(
+    int(os.environ.get('AQUAGUARD_PLOT_CACHE_BYTES', str(64 * 1024 * 1024))),
+    os.environ.get('AQUAGUARD_PLOT_CACHE_DIR'),
+    int(os.environ.get('AQUAGUARD_PLOT_CACHE_DISK_BYTES', str(256 * 1024 * 1024)))
+)
+
+# ML prediction endpoints
+PLOT_KINDS = ('2d', '3d')
+
+# Batch prediction limits
+MAX_BATCH_SIZE = int(os.environ.get('AQUAGUARD_MAX_BATCH_SIZE', '10000'))
+BATCH_CHUNK_SIZE = int(os.environ.get('AQUAGUARD_BATCH_CHUNK_SIZE', '1024'))
+
+# Years /api/predict/<city> forecasts, after the observations
+MAX_PREDICTION_YEARS = prediction_jobs.MAX_YEARS
+
+def prediction_year():
+    """The ?year= a city is predicted for, by default the year after the observations"""
+    year = request.args.get('year', type=int, default=DATA_YEAR + 1)
+    if not DATA_YEAR < year <= DATA_YEAR + MAX_PREDICTION_YEARS:
+        raise ValueError(f'year must be between {DATA_YEAR + 1} and {DATA_YEAR + MAX_PREDICTION_YEARS}')
+    return year
+
+def find_prediction(city, year):
+    """
+    Get a city's or station's predictions for a year and the model version
+    they come from, or None for an unknown city.
+    
+    Stored forecasts are looked up by the current model file's version, and
+    used only if made from the current inputs, so replacing the model or the
+    observations invalidates them. On a miss the station is forecast in the
+    job pool with that same model version, identical concurrent misses
+    sharing one run, and every year up to the target is stored for the next
+    request.
+    """
+    station, source_version = prediction_source(city)
+    if source_version is None:
+        return None
+    
+    model_version = get_file_version()
+    stored = get_stored_prediction(station, model_version, year)
+    if stored is not None and stored['source_version'] == source_version:
+        return stored['predictions'], stored['model_version']
+    
+    steps = year - DATA_YEAR
+    forecast = job_pool.run(('forecast', station, steps, model_version),
+                            tasks.forecast_station, station, steps, model_version)
+    if forecast is None:
+        return None
+    model_version, details, summaries = forecast
+    save_prediction_summaries(station, model_version, source_version, DATA_YEAR, details, summaries)
+    return summaries[-1], model_version
+
+def plot_cache_key(kind, predictions):
+    """Content hash identifying a plot of these predictions; doubles as its ETag"""
+    return content_key(kind, predictions, PLOT_OPTIONS)
+
+def get_cached_plot(kind, predictions):
+    """Return the PNG for a plot of predictions, rendering it only on a cache miss"""
+    key = plot_cache_key(kind, predictions)
+    plot_cache.set_generation(get_write_generation())
+    png = plot_cache.get(key)
+    if png is None:
+        png = job_pool.run(('plot', key), tasks.render_plot, kind, predictions)
+        plot_cache.put(key, png)
+    return png
+
+@app.route('/api/predict/batch', methods=['POST'])
+def predict_batch():
+    """
+    Predict groundwater parameters for many stations with one vectorized model call.
+    
+    Request body:
+    - stations: List of {"id": ..., "features": [...] or {feature: value}}
+      or {"id": ..., "station": "<name or code>"} for a city with a known
+      sample or an observed station.
+      Each station may also set rainfall (m/year), catchment_area (m²) and
+      recharge_coef for its recharge estimate.
+    - chunk_size: Optional number of rows per model.predict call
+    """
+    try:
+        body = request.get_json(silent=True) or {}
+        stations = body.get('stations')
+        if not isinstance(stations, list) or not stations:
+            return jsonify({'error': 'stations must be a non-empty list'}), 400
+        if len(stations) > MAX_BATCH_SIZE:
+            return jsonify({'error': f'at most {MAX_BATCH_SIZE} stations per batch'}), 413
+        
+        chunk_size = body.get('chunk_size', BATCH_CHUNK_SIZE)
+        if not isinstance(chunk_size, int) or chunk_size < 1:
+            return jsonify({'error': 'chunk_size must be a positive integer'}), 400
+        chunk_size = min(chunk_size, MAX_BATCH_SIZE)
+        
+        # Resolve every station to a feature vector, recording per-station errors,
+        # then one vectorized predict (per chunk) for the whole batch
+        results = job_pool.run(None, tasks.predict_stations, stations, chunk_size)
+        
+        return jsonify({'count': len(results), 'results': results})
+
+    except JobQueueFull as e:
+        return busy_response(e)
+    except JobTimeout as e:
+        return jsonify({'error': str(e)}), 504
+    except Exception as e:
+        print("Error in batch prediction:", str(e))
+        return jsonify({'error': str(e)}), 500
+
+# Largest page of results returned by the job status endpoint
+MAX_JOB_RESULTS_PAGE = int(os.environ.get('AQUAGUARD_JOB_RESULTS_PAGE', '1000'))
+
+@app.route('/api/predict/jobs', methods=['POST'])
+def create_prediction_job():
+    """
+    Queue an asynchronous forecast and return its job id.
+    
+    Request body:
+    - stations: Stations as for /api/predict/batch, or
+    - state: Forecast every observed station in the state
+    - years: Years to forecast ahead, 1-10 (default 1)
+    - from_year: Year of the input measurements, used to label forecast years
+    """
+    try:
+        job_id = prediction_jobs.submit_job(request.get_json(silent=True))
+        response = jsonify({'id': job_id, 'status': 'queued', 'url': f'/api/predict/jobs/{job_id}'})
+        response.status_code = 202
+        response.headers['Location'] = f'/api/predict/jobs/{job_id}'
+        return response
+
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        print("Error creating prediction job:", str(e))
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/predict/jobs/<job_id>', methods=['GET'])
+def prediction_job_status(job_id):
+    """
+    Get an asynchronous forecast's status, progress and results.
+    - offset: First result to return (default 0)
+    - limit: Results per page (default and maximum 1000)
+    """
+    job = get_prediction_job(job_id)
+    if job is None:
+        return jsonify({'error': 'Prediction job not found'}), 404
+    
+    try:
+        offset = max(int(request.args.get('offset', 0)), 0)
+        limit = min(max(int(request.args.get('limit', MAX_JOB_RESULTS_PAGE)), 1), MAX_JOB_RESULTS_PAGE)
+    except ValueError:
+        return jsonify({'error': 'offset and limit must be integers'}), 400
+    
+    total = job['total_rows']
+    response_data = {
+        'id': job['id'],
+        'status': job['status'],
+        'years': job['request']['years'],
+        'progress': {
+            'completed': job['completed_rows'],
+            'total': total,
+            'percent': round(job['completed_rows'] * 100 / total, 1) if total else 0.0
+        },
+        'created_at': job['created_at'],
+        'started_at': job['started_at'],
+        'finished_at': job['finished_at'],
+    }
+    if job['error']:
+        response_data['error'] = job['error']
+    
+    # Results are saved chunk by chunk, so running jobs return what is done so far
+    results = get_prediction_job_results(job_id, offset, limit)
+    response_data['results'] = results
+    if offset + len(results) < job['completed_rows']:
+        response_data['next_offset'] = offset + len(results)
+    return jsonify(response_data)
+
 @app.route('/api/predict/<city>', methods=['GET'])
 def predict_city(city):
+    """
+    Predict groundwater parameters for a city, or an observed station by code.
+    - year: Year to predict, up to 10 after the observations (default: the next)
+    - plots: Which plots to inline as base64 PNGs: none, 2d, 3d or all (default)
+    """
     try:
         print(f"Received prediction request for city: {city}")
         
-        # For Kalyani, use representative values based on typical West Bengal groundwater parameters
-        if 'KALYANI' in city.upper():
-            # Create a single sample with typical values for the region
-            sample_data = np.array([[
-                1,  # Station Name encoded (doesn't affect prediction significantly)
-                1,  # STATE encoded (West Bengal)
-                25.0,  # Temperature Min (typical for West Bengal)
-                32.0,  # Temperature Max
-                6.8,   # pH Min (typical groundwater range)
-                7.5,   # pH Max
-                500,   # Conductivity Min (µmhos/cm, typical for the region)
-                800    # Conductivity Max
-            ]])
-            
-            # Create feature names matching the model's expectations
-            X_pred = pd.DataFrame(
-                sample_data,
-                columns=[
-                    'Station Name_prev', 'STATE_prev',
-                    'Temperature Min_prev', 'Temperature Max_prev',
-                    'pH Min_prev', 'pH Max_prev',
-                    'Conductivity (µmhos/cm) Min_prev', 'Conductivity (µmhos/cm) Max_prev'
-                ]
-            )
-            
-            print("Created sample data for prediction")
-            
-            # Make predictions
-            predictions = model.predict(X_pred)
-            print("Predictions made successfully:", predictions)
-            
-            # Create DataFrame for predictions
-            pred_df = pd.DataFrame(predictions, columns=[
-                'Temperature Min', 'Temperature Max',
-                'pH Min', 'pH Max',
-                'Conductivity (µmhos/cm) Min', 'Conductivity (µmhos/cm) Max'
-            ])
-
-            # Calculate recharge potential
-            def calculate_recharge_potential(row):
-                avg_pH = (row['pH Min'] + row['pH Max']) / 2
-                avg_cond = (row['Conductivity (µmhos/cm) Min'] + row['Conductivity (µmhos/cm) Max']) / 2
-                avg_temp = (row['Temperature Min'] + row['Temperature Max']) / 2
-                
-                pH_factor = 1.0 - abs(7.5 - avg_pH) / 7.5
-                cond_factor = 1.0 / (1.0 + avg_cond/5000)
-                temp_factor = 1.0 - abs(25 - avg_temp) / 25
-                
-                quality_factor = (pH_factor * 0.4 + cond_factor * 0.4 + temp_factor * 0.2)
-                
-                rainfall = 1.5
-                catchment_area = 100 * 1000000
-                base_recharge_coef = 0.20
-                
-                recharge_volume_mcm = (rainfall * catchment_area * base_recharge_coef * quality_factor) / 1000000
-                recharge_percentage = (recharge_volume_mcm / (rainfall * catchment_area * base_recharge_coef / 1000000)) * 100
-                
-                return recharge_volume_mcm, recharge_percentage
-
-            recharge_results = pred_df.apply(calculate_recharge_potential, axis=1)
-            recharge_volume = recharge_results.iloc[0][0]
-            recharge_percentage = recharge_results.iloc[0][1]
-
-            # Create visualizations with default style
-            # Parameter Predictions (2D Plots)
-            plt.figure(figsize=(15, 10))
-
-            # First row of subplots
-            plt.subplot(231)
-            bars = plt.bar(['Min', 'Max'], 
-                    [pred_df['Temperature Min'].values[0], pred_df['Temperature Max'].values[0]],
-                    color=['#3498db', '#e74c3c'], width=0.5)
-            plt.title('Temperature Prediction', fontsize=14, pad=10)
-            plt.ylabel('Temperature (°C)', fontsize=12)
-            # Add value labels on top of bars
-            for bar in bars:
-                height = bar.get_height()
-                plt.text(bar.get_x() + bar.get_width()/2., height,
-                        f'{height:.2f}°C',
-                        ha='center', va='bottom', fontsize=12)
-
-            plt.subplot(232)
-            bars = plt.bar(['Min', 'Max'], 
-                    [pred_df['pH Min'].values[0], pred_df['pH Max'].values[0]],
-                    color=['#2ecc71', '#f1c40f'], width=0.5)
-            plt.title('pH Level Prediction', fontsize=14, pad=10)
-            plt.ylabel('pH Value', fontsize=12)
-            for bar in bars:
-                height = bar.get_height()
-                plt.text(bar.get_x() + bar.get_width()/2., height,
-                        f'{height:.2f}',
-                        ha='center', va='bottom', fontsize=12)
-
-            plt.subplot(233)
-            bars = plt.bar(['Recharge'], [recharge_volume], color='#9b59b6', width=0.5)
-            plt.title('Groundwater Recharge', fontsize=14, pad=10)
-            plt.ylabel('Million Cubic Meters/year', fontsize=12)
-            for bar in bars:
-                height = bar.get_height()
-                plt.text(bar.get_x() + bar.get_width()/2., height,
-                        f'{height:.2f} MCM',
-                        ha='center', va='bottom', fontsize=12)
-
-            # Second row of subplots
-            # Monthly Rainfall Pattern
-            plt.subplot(234)
-            months = ['Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec']
-            rainfall_data = [15.2, 25.1, 35.8, 58.4, 156.2, 305.7, 325.4, 328.6, 252.3, 125.6, 28.9, 12.6]
-            plt.plot(months, rainfall_data, marker='o', color='#3498db', linewidth=2, markersize=8)
-            plt.title('Monthly Rainfall Pattern', fontsize=14, pad=10)
-            plt.ylabel('Rainfall (mm)', fontsize=12)
-            plt.xticks(rotation=45, fontsize=10)
-            plt.yticks(fontsize=10)
-            plt.grid(True, linestyle='--', alpha=0.7)
-
-            # Historical Ground Level
-            plt.subplot(235)
-            years = [2018, 2019, 2020, 2021, 2022, 2023]
-            levels = [14.2, 13.8, 13.1, 12.9, 12.7, 12.5]
-            plt.plot(years, levels, marker='s', color='#e74c3c', linewidth=2, markersize=8)
-            plt.title('5-Year Ground Level Trend', fontsize=14, pad=10)
-            plt.ylabel('Ground Level (m)', fontsize=12)
-            plt.xticks(fontsize=10)
-            plt.yticks(fontsize=10)
-            plt.grid(True, linestyle='--', alpha=0.7)
-
-            # Add a text box with parameter predictions
-            plt.subplot(236)
-            plt.axis('off')
-            summary_text = f"""Parameter Predictions
-
-Temperature
-Min: {pred_df['Temperature Min'].values[0]:.2f}°C
-Max: {pred_df['Temperature Max'].values[0]:.2f}°C
-
-pH Levels
-Min: {pred_df['pH Min'].values[0]:.2f}
-Max: {pred_df['pH Max'].values[0]:.2f}
-
-Conductivity
-Min: {pred_df['Conductivity (µmhos/cm) Min'].values[0]:.0f} µmhos/cm
-Max: {pred_df['Conductivity (µmhos/cm) Max'].values[0]:.0f} µmhos/cm
-
-Recharge Potential
-Volume: {recharge_volume:.2f} MCM
-Percentage: {recharge_percentage:.2f}%"""
-
-            plt.text(0.1, 0.95, summary_text, fontsize=12, verticalalignment='top', 
-                    bbox=dict(boxstyle='round', facecolor='white', alpha=0.8, edgecolor='gray'))
-
-            plt.tight_layout(pad=1.0)  # Adjusted padding
-            
-            # Save 2D plot to memory with higher quality settings
-            buf = io.BytesIO()
-            plt.savefig(buf, format='png', dpi=150, bbox_inches='tight', 
-                       facecolor='white', edgecolor='none', pad_inches=0.5,
-                       transparent=False)
-            buf.seek(0)
-            plt.close()
-            
-            # Convert plot to base64
-            plot_2d = base64.b64encode(buf.getvalue()).decode('utf-8')
-
-            # Create 3D visualization with improved visibility
-            fig = plt.figure(figsize=(10, 8))
-            ax = fig.add_subplot(111, projection='3d')
-
-            # Plot data points with larger markers
-            scatter1 = ax.scatter(pred_df['pH Min'].values[0], 
-                      pred_df['Conductivity (µmhos/cm) Min'].values[0], 
-                      pred_df['Temperature Min'].values[0], 
-                      color='#3498db', s=200, label='Minimum Values', alpha=0.8)
-            scatter2 = ax.scatter(pred_df['pH Max'].values[0], 
-                      pred_df['Conductivity (µmhos/cm) Max'].values[0], 
-                      pred_df['Temperature Max'].values[0], 
-                      color='#e74c3c', s=200, label='Maximum Values', alpha=0.8)
-
-            # Connect points with a line
-            ax.plot([pred_df['pH Min'].values[0], pred_df['pH Max'].values[0]],
-                   [pred_df['Conductivity (µmhos/cm) Min'].values[0], pred_df['Conductivity (µmhos/cm) Max'].values[0]],
-                   [pred_df['Temperature Min'].values[0], pred_df['Temperature Max'].values[0]],
-                   'k--', alpha=0.5)
-
-            # Customize the appearance with larger fonts
-            ax.set_xlabel('pH Level', fontsize=12, labelpad=15)
-            ax.set_ylabel('Conductivity (µmhos/cm)', fontsize=12, labelpad=15)
-            ax.set_zlabel('Temperature (°C)', fontsize=12, labelpad=15)
-            ax.set_title('Parameter Space Visualization', fontsize=16, pad=20)
-
-            # Adjust the viewing angle for better perspective
-            ax.view_init(elev=25, azim=45)
-
-            # Add grid with custom style
-            ax.grid(True, linestyle='--', alpha=0.4)
-
-            # Customize tick labels
-            ax.tick_params(axis='both', which='major', labelsize=10)
-
-            # Customize legend with better positioning
-            ax.legend(fontsize=12, bbox_to_anchor=(1.15, 0.9))
-
-            # Adjust layout to prevent cutoff
-            plt.tight_layout(rect=[0, 0, 0.9, 1])
-
-            # Save 3D plot to memory with higher quality settings
-            buf_3d = io.BytesIO()
-            plt.savefig(buf_3d, format='png', dpi=150, bbox_inches='tight',
-                       facecolor='white', edgecolor='none', pad_inches=0.5,
-                       transparent=False)
-            buf_3d.seek(0)
-            plt.close()
-            
-            # Convert 3D plot to base64
-            plot_3d = base64.b64encode(buf_3d.getvalue()).decode('utf-8')
-
-            # Prepare response data
-            response_data = {
-                'predictions': {
-                    'temperature': {
-                        'min': float(pred_df['Temperature Min'].values[0]),
-                        'max': float(pred_df['Temperature Max'].values[0])
-                    },
-                    'pH': {
-                        'min': float(pred_df['pH Min'].values[0]),
-                        'max': float(pred_df['pH Max'].values[0])
-                    },
-                    'conductivity': {
-                        'min': float(pred_df['Conductivity (µmhos/cm) Min'].values[0]),
-                        'max': float(pred_df['Conductivity (µmhos/cm) Max'].values[0])
-                    },
-                    'recharge': {
-                        'volume': float(recharge_volume),
-                        'percentage': float(recharge_percentage)
-                    }
-                },
-                'plots': {
-                    'plot_2d': plot_2d,
-                    'plot_3d': plot_3d
-                }
+        plots = request.args.get('plots', 'all').lower()
+        if plots not in ('none', 'all') + PLOT_KINDS:
+            return jsonify({'error': 'plots must be one of none, 2d, 3d or all'}), 400
+        try:
+            year = prediction_year()
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        found = find_prediction(city, year)
+        if found is None:
+            return jsonify({'error': f'No sample or observations to predict {city} from'}), 404
+        
+        predictions, model_version = found
+        response_data = {'predictions': predictions, 'year': year, 'model_version': model_version}
+        
+        # Render plots, or reuse them if these predictions were already plotted
+        kinds = PLOT_KINDS if plots == 'all' else () if plots == 'none' else (plots,)
+        if kinds:
+            response_data['plots'] = {
+                f'plot_{kind}': base64.b64encode(get_cached_plot(kind, predictions)).decode('utf-8')
+                for kind in kinds
             }
+        
+        return jsonify(response_data)
 
-            return jsonify(response_data)
-        else:
-            return jsonify({
-                'error': 'Currently only supporting predictions for Kalyani'
-            }), 400
-
+    except JobQueueFull as e:
+        return busy_response(e)
+    except JobTimeout as e:
+        return jsonify({'error': str(e)}), 504
     except Exception as e:
         print("Error in prediction:", str(e))
         return jsonify({'error': str(e)}), 500
 
-# Initialize database when app starts
-init_db()
+@app.route('/api/predict/<city>/plot/<kind>.png', methods=['GET'])
+def predict_city_plot(city, kind):
+    """Get a single prediction plot as a raw PNG image; takes the same year as /api/predict/<city>"""
+    try:
+        if kind not in PLOT_KINDS:
+            return jsonify({'error': 'plot kind must be 2d or 3d'}), 404
+        try:
+            year = prediction_year()
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        found = find_prediction(city, year)
+        if found is None:
+            return jsonify({'error': f'No sample or observations to predict {city} from'}), 404
+        
+        predictions = found[0]
+        etag = plot_cache_key(kind, predictions)
+        
+        # The client already has this exact image; skip rendering entirely
+        if request.if_none_match.contains_weak(etag):
+            response = Response(status=304)
+        else:
+            response = Response(get_cached_plot(kind, predictions), mimetype='image/png')
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = f'public, max-age={PLOT_MAX_AGE}'
+        return response
+
+    except JobQueueFull as e:
+        return busy_response(e)
+    except JobTimeout as e:
+        return jsonify({'error': str(e)}), 504
+    except Exception as e:
+        print("Error rendering prediction plot:", str(e))
+        return jsonify({'error': str(e)}), 500
+
+_started = False
+
+def create_app():
+    """
+    Prepare the database and start the background work, once per process,
+    then return the app. Runs on import; see the call below.
+    """
+    global _started
+    if _started:
+        return app
+    _started = True
+    
+    # Initialize database when app starts
+    init_db()
+    
+    # Optionally load the model in the background; otherwise the first predict call loads it
+    if os.environ.get('AQUAGUARD_MODEL_WARMUP', '0') == '1':
+        if job_pool.workers > 0:
+            # Starts the pool; its workers load the model as they come up
+            job_pool.submit('model-info', tasks.model_info)
+        else:
+            warm_up()
+    
+    # Run queued prediction jobs in the background
+    prediction_jobs.start_workers(job_pool)
+    
+    # Keep stored map tiles up to date with changed station rows
+    tiles.start_sync()
+    return app
+
+# Job pool workers are spawned and import this module again; only the serving
+# process (python app.py, flask run, each gunicorn worker) starts up
+if multiprocessing.parent_process() is None:
+    create_app()
 
 if __name__ == '__main__':
     app.run(debug=True, host='0.0.0.0', port=5000)
\ No newline at end of file
@@ -0,0 +1,971 @@
+"""
+Benchmarks for the AquaGuard backend.
+
+Each benchmark builds a throwaway SQLite database filled with synthetic rows,
+so the real aquaguard.db is never touched.
+
+Usage:
+    python benchmarks.py groundwater --rows 10000 1000000
+    python benchmarks.py search --stations 300000
+    python benchmarks.py batch --stations 10 100 1000 --model ground_water_predictor.pkl
+    python benchmarks.py observations --stations 10000 --model ground_water_predictor.pkl
+    python benchmarks.py forecast --stations 100000 --years 5 --workers 1 2 4 --model ground_water_predictor.pkl
+    python benchmarks.py stored --stations 100000 --requests 200 --model ground_water_predictor.pkl
+    python benchmarks.py recharge --rows 10000 100000 1000000
+    python benchmarks.py startup
+    python benchmarks.py stream --rows 100000
+    python benchmarks.py spatial --stations 100000 300000
+    python benchmarks.py heatmap --points 100000 1000000
+    python benchmarks.py tiles --stations 100000 --moved 100
+    python benchmarks.py ingest --rows 1000000
+    python benchmarks.py responses --stations 100000 --rows 100000
+    python benchmarks.py compression --stations 100000 --rows 100000
+"""
+import argparse
+import csv
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import connection_pool
+import database
+
+
+def use_temp_database(name):
+    """Point database.py at a fresh database file in a temp directory"""
+    tmp_dir = tempfile.mkdtemp(prefix='aquaguard-bench-')
+    database.DB_PATH = os.path.join(tmp_dir, name)
+    connection_pool.close_all_connections()
+    database.migrate_database()
+    return tmp_dir
+
+
+def count_queries(conn):
+    """Count statements executed on conn; returns a callable reading the count"""
+    counter = {'queries': 0}
+
+    def trace(statement):
+        counter['queries'] += 1
+
+    conn.set_trace_callback(trace)
+    return lambda: counter['queries']
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+
+# Groundwater benchmark
+def populate_groundwater(rows, states=36, districts_per_state=25):
+    """Insert synthetic groundwater rows spread over states, districts and cities"""
+    rng = random.Random(42)
+    history = json.dumps([{"year": 2018 + i, "level": 12.0 + i / 10} for i in range(6)])
+    rainfall = json.dumps([{"month": m, "rainfall": 10.0} for m in ('Jan', 'Feb', 'Mar')])
+
+    def generate():
+        for i in range(rows):
+            state = f"STATE {i % states:02d}"
+            district = f"District {(i // states) % districts_per_state:02d}"
+            # Every row of a district gets its own city, keeping the natural key unique
+            block = i // (states * districts_per_state)
+            city = f"CITY {block}"
+            if block == 0 and i % 97 == 0:
+                city = None  # district-level row
+            yield (state, district, city, 2023, rng.uniform(2, 30), 'Good',
+                   rng.uniform(8, 35), rng.uniform(68, 97), '#64B5F6', 1200.0,
+                   4000.0, 800.0, 120.0, 6.0, 80.0, history, rainfall)
+
+    conn = database.create_connection()
+    conn.executemany('''
+    INSERT INTO groundwater (state_name, district_name, city_name, year, level, quality, latitude, longitude, color,
+                             rainfall, annual_extractable, current_extraction, ground_water_recharge, natural_discharges,
+                             extraction_percentage, historical_levels, monthly_rainfall)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ''', generate())
+    conn.commit()
+    conn.close()
+
+
+def legacy_get_groundwater_data(state=None, district=None):
+    """The original one-query-per-(state, district) implementation, kept for comparison"""
+    cursor = database.get_connection().cursor()
+    if state:
+        states = [state]
+    else:
+        cursor.execute("SELECT DISTINCT state_name FROM groundwater")
+        states = [row['state_name'] for row in cursor.fetchall()]
+
+    result = {}
+    for current_state in states:
+        result[current_state] = {}
+        if district and state == current_state:
+            districts = [district]
+        else:
+            cursor.execute(
+                "SELECT DISTINCT district_name FROM groundwater WHERE state_name = ?",
+                (current_state,)
+            )
+            districts = [row['district_name'] for row in cursor.fetchall()]
+
+        for current_district in districts:
+            cursor.execute(
+                "SELECT * FROM groundwater WHERE state_name = ? AND district_name = ?",
+                (current_state, current_district)
+            )
+            district_data = {}
+            for row in cursor.fetchall():
+                data_point = database._groundwater_data_point(row)
+                if row['city_name']:
+                    district_data[row['city_name']] = data_point
+                else:
+                    district_data = data_point
+            result[current_state][current_district] = district_data
+
+    return result
+
+
+def bench_groundwater(args):
+    for rows in args.rows:
+        tmp_dir = use_temp_database('groundwater.db')
+        try:
+            populate_groundwater(rows)
+            conn = database.get_connection()
+            queries = count_queries(conn)
+
+            print(f"\ngroundwater: {rows:,} rows")
+            for label, filters in (('unfiltered', ()),
+                                   ('state', ('STATE 01',)),
+                                   ('state+district', ('STATE 01', 'District 03'))):
+                before = queries()
+                legacy, legacy_time = timed(legacy_get_groundwater_data, *filters)
+                legacy_queries = queries() - before
+
+                before = queries()
+                current, current_time = timed(database.get_groundwater_data, *filters)
+                current_queries = queries() - before
+
+                status = 'identical' if legacy == current else 'MISMATCH'
+                print(f"  {label:<15} legacy: {legacy_queries:>5} queries {legacy_time * 1000:>9.1f} ms"
+                      f" | single pass: {current_queries:>5} queries {current_time * 1000:>9.1f} ms"
+                      f" | {status}")
+            conn.set_trace_callback(None)
+        finally:
+            connection_pool.close_all_connections()
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+# Search benchmark
+SEARCH_WORDS = ('Lodhi', 'Garden', 'Nagar', 'Colony', 'Pur', 'Abad', 'Ganj', 'Bagh',
+                'Kalyani', 'Industrial', 'Area', 'Park', 'Road', 'Camp', 'Tank', 'Village')
+
+
+def populate_stations(stations, states=36, districts_per_state=25):
+    """Insert synthetic station rows into the districts registry"""
+    rng = random.Random(7)
+
+    def generate():
+        for i in range(stations):
+            name = ' '.join(rng.sample(SEARCH_WORDS, 2)) + f' {i}'
+            yield (f'station_{i:07d}', '#4DD0E1', 'CGWB', f"STATE {i % states:02d}",
+                   f"District {(i // states) % districts_per_state:02d}", None, name,
+                   rng.uniform(8, 35), rng.uniform(68, 97), 'GROUND', 'Active')
+
+    conn = database.create_connection()
+    conn.executemany('''
+    INSERT INTO districts (id, color, agency_name, state_name, district_name, tahsil_name, station_name, latitude, longitude, station_type, station_status)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ''', generate())
+    conn.commit()
+    conn.close()
+
+
+def legacy_search_stations(query):
+    """The LIKE '%q%' scan the search endpoint used before the full-text index"""
+    cursor = database.get_connection().cursor()
+    cursor.execute(
+        "SELECT DISTINCT station_name AS name, district_name AS parent FROM districts WHERE station_name LIKE ?",
+        (f"%{query}%",)
+    )
+    return cursor.fetchall()
+
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def bench_search(args):
+    tmp_dir = use_temp_database('search.db')
+    try:
+        start = time.perf_counter()
+        populate_stations(args.stations)
+        print(f"\nsearch: {args.stations:,} stations (loaded with index triggers in "
+              f"{time.perf_counter() - start:.1f} s)")
+
+        # Simulate autocomplete keystrokes
+        queries = []
+        for word in ('Kalyani', 'Garden', 'Industrial', 'Nagar'):
+            queries.extend(word[:n] for n in range(1, len(word) + 1))
+
+        typos = ['Kalyni', 'Gardn', 'Industral', 'Nagr', 'Lodi Garden']
+
+        for label, func, inputs in (('index', lambda q: database.search_locations(q, 20), queries),
+                                    ('index (typos)', lambda q: database.search_locations(q, 20, True), typos),
+                                    ('legacy LIKE', legacy_search_stations, queries)):
+            samples = []
+            for _ in range(args.repeat):
+                for query in inputs:
+                    _, elapsed = timed(func, query)
+                    samples.append(elapsed * 1000)
+            print(f"  {label:<14} mean {sum(samples) / len(samples):7.2f} ms"
+                  f"   p95 {percentile(samples, 0.95):7.2f} ms   max {max(samples):7.2f} ms")
+    finally:
+        connection_pool.close_all_connections()
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+# Batch prediction benchmark
+def import_app(model_path=None):
+    """
+    Import the Flask app against the benchmark database and the given model.
+
+    Without the background job workers and tile sync, which would outlive
+    the benchmark's temporary database.
+    """
+    os.environ.setdefault('AQUAGUARD_PREDICTION_JOB_WORKERS', '0')
+    os.environ.setdefault('AQUAGUARD_TILES_SYNC_INTERVAL', '0')
+    if model_path is not None:
+        import model_registry
+        model_registry.MODEL_PATH = os.path.abspath(model_path)
+
+    import app
+    return app
+
+
+def bench_batch(args):
+    tmp_dir = use_temp_database('batch.db')
+    try:
+        client = import_app(args.model).app.test_client()
+        rng = random.Random(3)
+
+        for stations in args.stations:
+            vectors = [[rng.randint(0, 50), rng.randint(0, 30), rng.uniform(20, 30), rng.uniform(25, 35),
+                        rng.uniform(6, 8), rng.uniform(7, 9), rng.uniform(200, 1200), rng.uniform(500, 1500)]
+                       for _ in range(stations)]
+
+            def sequential():
+                for _ in range(stations):
+                    response = client.get('/api/predict/Kalyani?plots=none')
+                    assert response.status_code == 200
+
+            def batch():
+                response = client.post('/api/predict/batch', json={
+                    'stations': [{'id': i, 'features': vector} for i, vector in enumerate(vectors)]
+                })
+                assert response.status_code == 200
+
+            _, sequential_time = timed(sequential)
+            _, batch_time = timed(batch)
+            print(f"\nbatch: {stations:,} stations")
+            print(f"  sequential GET /api/predict/<city>  {sequential_time * 1000:9.1f} ms"
+                  f"  ({sequential_time / stations * 1000:.2f} ms/station)")
+            print(f"  POST /api/predict/batch             {batch_time * 1000:9.1f} ms"
+                  f"  ({batch_time / stations * 1000:.3f} ms/station, {sequential_time / batch_time:.0f}x)")
+    finally:
+        connection_pool.close_all_connections()
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+# Observations benchmark
+def write_observations_csv(path, stations, states=36):
+    """Write synthetic station observations in the layout of the CGWB CSV"""
+    rng = random.Random(8)
+    with open(path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['Station Code', 'Station Name', 'STATE', 'Temperature Min', 'Temperature Max',
+                         'pH Min', 'pH Max', 'Conductivity (µmhos/cm) Min', 'Conductivity (µmhos/cm) Max'])
+        for i in range(stations):
+            writer.writerow([f"S{i:06d}", f"STATION {i}", f"STATE {i % states:02d}",
+                             round(rng.uniform(20, 26), 1), round(rng.uniform(28, 34), 1),
+                             round(rng.uniform(6, 7), 2), round(rng.uniform(7, 8.5), 2),
+                             rng.randint(200, 1200), rng.randint(1200, 3000)])
+
+
+def legacy_predict_station(model, df, name):
+    """The original driver: fit fresh encoders, then find one station with str.contains"""
+    from sklearn.preprocessing import LabelEncoder
+
+    from inference import FEATURE_COLUMNS
+    import predict
+
+    df = df.ffill()
+    matches = df['Station Name'].astype(str).str.contains(name)
+    df['Station Name'] = LabelEncoder().fit_transform(df['Station Name'])
+    df['STATE'] = LabelEncoder().fit_transform(df['STATE'])
+    X = df[matches][predict.OBSERVATION_COLUMNS]
+    X.columns = FEATURE_COLUMNS
+    return model.predict(X)
+
+
+def bench_observations(args):
+    import pandas as pd
+    from joblib import load
+
+    import predict
+
+    tmp_dir = tempfile.mkdtemp(prefix='aquaguard-bench-')
+    try:
+        path = os.path.join(tmp_dir, 'observations.csv')
+        write_observations_csv(path, args.stations)
+        model = load(args.model)
+        print(f"\nobservations: {args.stations:,} stations")
+
+        raw, load_time = timed(pd.read_csv, path)
+        typed, typed_time = timed(predict.load_observations, path)
+        print(f"  read_csv untyped          {load_time * 1000:9.1f} ms"
+              f"   {raw.memory_usage(deep=True).sum() / 1e6:6.1f} MB")
+        print(f"  read_csv typed            {typed_time * 1000:9.1f} ms"
+              f"   {typed.memory_usage(deep=True).sum() / 1e6:6.1f} MB")
+
+        sample = random.Random(2).sample(range(args.stations), args.legacy_stations)
+        _, legacy_time = timed(lambda: [legacy_predict_station(model, raw.copy(), f"STATION {i}$") for i in sample])
+        per_station = legacy_time / len(sample)
+        print(f"  per station (legacy)      {per_station * args.stations:9.1f} s"
+              f"   ({per_station * 1000:.1f} ms/station over {len(sample)} stations)")
+
+        preprocessor = predict.fit_preprocessor(typed, path)
+        (predictions, skipped), batch_time = timed(predict.predict_observations, model, typed, preprocessor)
+        assert len(predictions) == args.stations and not skipped
+        print(f"  one pass                  {batch_time:9.2f} s"
+              f"   ({per_station * args.stations / batch_time:,.0f}x)")
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+def bench_forecast(args):
+    import numpy as np
+    from joblib import load
+
+    import predict
+
+    tmp_dir = tempfile.mkdtemp(prefix='aquaguard-bench-')
+    try:
+        path = os.path.join(tmp_dir, 'observations.csv')
+        write_observations_csv(path, args.stations)
+        df = predict.load_observations(path)
+        X, _ = predict.encode_observations(df, predict.fit_preprocessor(df, path))
+        X = X.to_numpy()
+        model = load(args.model)
+        print(f"\nforecast: {args.stations:,} stations, {args.years} years, {predict.FORECAST_START_METHOD} workers")
+
+        expected = None
+        for workers in args.workers:
+            results = np.empty((args.years, len(X), 8))
+
+            def collect(start, values):
+                results[:, start:start + values.shape[1]] = values
+
+            worker_seconds, elapsed = timed(predict.forecast_stations, model, X, args.years, workers, None, collect)
+            if expected is None:
+                expected = results
+            status = 'identical' if np.array_equal(results, expected) else 'MISMATCH'
+            print(f"  {workers:2d} workers   {elapsed:7.2f} s   {args.stations / elapsed:9,.0f} stations/s"
+                  f"   (workers busy {worker_seconds:.2f} s, {status})")
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+def bench_stored(args):
+    tmp_dir = use_temp_database('stored.db')
+    try:
+        # Before the first import of predict, which reads these
+        path = os.path.join(tmp_dir, 'observations.csv')
+        write_observations_csv(path, args.stations)
+        os.environ['AQUAGUARD_GROUNDWATER_CSV'] = path
+        os.environ['AQUAGUARD_PREPROCESSOR_PATH'] = os.path.join(tmp_dir, 'preprocessor.pkl')
+        import predict
+        # The generated stations stand in for the model's training data
+        predict.save_preprocessor(predict.fit_preprocessor(predict.load_observations(path), path))
+        client = import_app(args.model).app.test_client()
+        codes = random.Random(6).sample([f"S{i:06d}" for i in range(args.stations)], args.requests)
+        print(f"\nstored: {args.stations:,} stations, {len(codes)} requests per pass")
+
+        def latencies(url):
+            samples = []
+            for code in codes:
+                start = time.perf_counter()
+                response = client.get(url.format(code))
+                samples.append(time.perf_counter() - start)
+                assert response.status_code == 200
+            return samples
+
+        # The first request pays for the model and the observations; keep it out of the timings
+        client.get(f'/api/predict/{codes[0]}?plots=none&year=2031')
+        live = latencies('/api/predict/{}?plots=none')
+        stored = latencies('/api/predict/{}?plots=none')
+        for label, samples in (('live (miss)', live), ('stored (hit)', stored)):
+            print(f"  {label:14s} p50 {percentile(samples, 0.5) * 1000:7.2f} ms"
+                  f"   p95 {percentile(samples, 0.95) * 1000:7.2f} ms")
+        print(f"  {percentile(live, 0.5) / percentile(stored, 0.5):.0f}x faster at p50")
+
+        import predict
+        _, fill_time = timed(predict.main, ['--workers', '1'])
+        print(f"  predict.py fill of every station: {fill_time:.2f} s")
+    finally:
+        connection_pool.close_all_connections()
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+# Recharge benchmark
+def legacy_recharge_row(row):
+    """The per-row recharge calculation formerly run through DataFrame.apply"""
+    avg_pH = (row['pH Min'] + row['pH Max']) / 2
+    avg_cond = (row['Conductivity (µmhos/cm) Min'] + row['Conductivity (µmhos/cm) Max']) / 2
+    avg_temp = (row['Temperature Min'] + row['Temperature Max']) / 2
+    quality_factor = ((1.0 - abs(7.5 - avg_pH) / 7.5) * 0.4 + (1.0 / (1.0 + avg_cond / 5000)) * 0.4
+                      + (1.0 - abs(25 - avg_temp) / 25) * 0.2)
+    recharge_volume_mcm = (1.5 * 100 * 1000000 * 0.20 * quality_factor) / 1000000
+    return recharge_volume_mcm, (recharge_volume_mcm / (1.5 * 100 * 1000000 * 0.20 / 1000000)) * 100
+
+
+def bench_recharge(args):
+    import numpy as np
+    import pandas as pd
+
+    from inference import TARGET_COLUMNS
+    from recharge import calculate_recharge_potential
+
+    rng = np.random.default_rng(5)
+    for rows in args.rows:
+        pred_df = pd.DataFrame(rng.uniform([20, 25, 6, 7, 200, 500], [30, 35, 8, 9, 1200, 1500], (rows, 6)),
+                               columns=TARGET_COLUMNS)
+        (volume, percentage), vectorized_time = timed(calculate_recharge_potential, pred_df)
+        print(f"\nrecharge: {rows:,} rows")
+        print(f"  vectorized        {vectorized_time * 1000:10.1f} ms")
+        if rows <= args.max_legacy_rows:
+            legacy, legacy_time = timed(pred_df.apply, legacy_recharge_row, 1)
+            legacy_volume = np.array([result[0] for result in legacy])
+            status = 'identical' if np.array_equal(legacy_volume, volume) else 'MISMATCH'
+            print(f"  DataFrame.apply   {legacy_time * 1000:10.1f} ms  ({legacy_time / vectorized_time:.0f}x, {status})")
+
+
+# Startup benchmark
+# Packages the API must not import until a prediction or plot is requested
+DEFERRED_PACKAGES = ('matplotlib', 'mpl_toolkits', 'pandas', 'numpy', 'sklearn', 'joblib')
+
+
+def parse_importtime(stderr):
+    """Parse python -X importtime output into {module: (self_us, cumulative_us)}"""
+    modules = {}
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        modules[name.strip()] = (int(self_us), int(cumulative_us))
+    return modules
+
+
+def bench_startup(args):
+    tmp_dir = use_temp_database('startup.db')
+    try:
+        env = dict(os.environ, AQUAGUARD_DB_PATH=database.DB_PATH, AQUAGUARD_MODEL_WARMUP='0')
+        backend_dir = os.path.dirname(os.path.abspath(__file__))
+
+        timings = []
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            completed = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import app'],
+                                       cwd=backend_dir, env=env, capture_output=True, text=True)
+            timings.append(time.perf_counter() - start)
+            if completed.returncode != 0:
+                print(completed.stderr)
+                sys.exit(1)
+        modules = parse_importtime(completed.stderr)
+
+        print(f"\nstartup: 'import app' best of {args.repeat}: {min(timings) * 1000:.0f} ms wall,"
+              f" {modules['app'][1] / 1000:.0f} ms import time, {len(modules)} modules")
+        top_level = {name: times for name, times in modules.items() if '.' not in name}
+        for name, (_, cumulative_us) in sorted(top_level.items(), key=lambda item: -item[1][1])[:args.top]:
+            print(f"  {name:<24} {cumulative_us / 1000:8.1f} ms")
+
+        eager = sorted({name.split('.')[0] for name in modules} & set(DEFERRED_PACKAGES))
+        if eager:
+            print(f"  FAIL: imported at startup: {', '.join(eager)}")
+            sys.exit(1)
+        print(f"  ok: none of {', '.join(DEFERRED_PACKAGES)} imported at startup")
+    finally:
+        connection_pool.close_all_connections()
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+# Streaming benchmark
+def measure_response(client, path, headers=None):
+    """Fetch path, returning (bytes, seconds to first byte, total seconds) without keeping the body"""
+    start = time.perf_counter()
+    response = client.get(path, headers=headers, buffered=False)
+    first_byte = None
+    size = 0
+    for chunk in response.response:
+        if first_byte is None:
+            first_byte = time.perf_counter() - start
+        size += len(chunk)
+    response.close()
+    return size, first_byte or 0.0, time.perf_counter() - start
+
+
+def bench_stream(args):
+    tmp_dir = use_temp_database('stream.db')
+    try:
+        populate_stations(args.rows)
+        populate_groundwater(args.rows)
+        client = import_app().app.test_client()
+        print(f"\nstream: {args.rows:,} stations and groundwater rows")
+
+        conn = database.get_connection()
+        for path, table in (('/api/districts', 'districts'), ('/api/groundwater', 'groundwater')):
+            # Streaming returns every stored row, one per line
+            lines = client.get(path, headers={'Accept': 'application/x-ndjson'}).get_data().count(b'\n')
+            rows = conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+            print(f"  {path}: {lines:,} NDJSON lines for {rows:,} rows")
+
+            for label, headers in (('json', None), ('ndjson', {'Accept': 'application/x-ndjson'})):
+                size, first_byte, total = measure_response(client, path, headers)
+                tracemalloc.start()
+                measure_response(client, path, headers)
+                peak = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+                print(f"    {label:<7} {size / 1e6:7.1f} MB   first byte {first_byte * 1000:8.1f} ms"
+                      f"   total {total * 1000:8.1f} ms   peak memory {peak / 1e6:7.1f} MB")
+    finally:
+        connection_pool.close_all_connections()
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+# Spatial benchmark
+def scan_stations_within(bbox):
+    """Viewport query without any index on the coordinates"""
+    min_lng, min_lat, max_lng, max_lat = bbox
+    cursor = database.get_connection().cursor()
+    cursor.execute(
+        "SELECT id FROM districts NOT INDEXED WHERE latitude BETWEEN ? AND ? AND longitude BETWEEN ? AND ?",
+        (min_lat, max_lat, min_lng, max_lng)
+    )
+    return [row['id'] for row in cursor]
+
+
+def btree_stations_within(bbox):
+    """Viewport query on the (latitude, longitude) B-tree index"""
+    min_lng, min_lat, max_lng, max_lat = bbox
+    cursor = database.get_connection().cursor()
+    cursor.execute(
+        "SELECT id FROM districts INDEXED BY idx_districts_latitude_longitude "
+        "WHERE latitude BETWEEN ? AND ? AND longitude BETWEEN ? AND ?",
+        (min_lat, max_lat, min_lng, max_lng)
+    )
+    return [row['id'] for row in cursor]
+
+
+def scan_nearest_stations(lat, lng, count):
+    """Nearest stations by computing the distance to every station"""
+    cursor = database.get_connection().cursor()
+    cursor.execute("SELECT id, latitude, longitude FROM districts WHERE latitude IS NOT NULL")
+    distances = [(database._haversine_km(lat, lng, row['latitude'], row['longitude']), row['id']) for row in cursor]
+    return [station_id for _, station_id in sorted(distances)[:count]]
+
+
+def bench_spatial(args):
+    for stations in args.stations:
+        tmp_dir = use_temp_database('spatial.db')
+        try:
+            start = time.perf_counter()
+            populate_stations(stations)
+            print(f"\nspatial: {stations:,} stations (loaded with index triggers in "
+                  f"{time.perf_counter() - start:.1f} s)")
+
+            rng = random.Random(11)
+            viewports = []
+            for _ in range(args.repeat):
+                lat, lng = rng.uniform(9, 33), rng.uniform(69, 96)
+                viewports.append((lng, lat, lng + 1.0, lat + 0.5))  # ~100 x 55 km
+            points = [(rng.uniform(8, 35), rng.uniform(68, 97)) for _ in range(args.repeat)]
+
+            within = {
+                'R*Tree': lambda bbox: [s['id'] for s in database.get_stations_within(bbox, limit=None)],
+                'B-tree': btree_stations_within,
+                'scan': scan_stations_within,
+            }
+            results = {}
+            for label, func in within.items():
+                samples = []
+                for bbox in viewports:
+                    found, elapsed = timed(func, bbox)
+                    results.setdefault(label, []).append(sorted(found))
+                    samples.append(elapsed * 1000)
+                print(f"  within  {label:<7} mean {sum(samples) / len(samples):8.2f} ms"
+                      f"   p95 {percentile(samples, 0.95):8.2f} ms"
+                      f"   ({sum(map(len, results[label])) / len(viewports):.0f} stations per viewport)")
+            assert results['R*Tree'] == results['scan'] == results['B-tree'], 'viewport results differ'
+
+            nearest = {
+                'R*Tree': lambda lat, lng: [s['id'] for s in database.get_nearest_stations(lat, lng, args.count)],
+                'scan': lambda lat, lng: scan_nearest_stations(lat, lng, args.count),
+            }
+            results = {}
+            for label, func in nearest.items():
+                samples = []
+                for lat, lng in points:
+                    found, elapsed = timed(func, lat, lng)
+                    results.setdefault(label, []).append(found)
+                    samples.append(elapsed * 1000)
+                print(f"  nearest {label:<7} mean {sum(samples) / len(samples):8.2f} ms"
+                      f"   p95 {percentile(samples, 0.95):8.2f} ms   ({args.count} stations)")
+            assert results['R*Tree'] == results['scan'], 'nearest results differ'
+        finally:
+            connection_pool.close_all_connections()
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+# Heatmap benchmark
+def populate_ocean_points(points, series=('temperature', 'salinity', 'ph')):
+    """Insert synthetic ocean data series with points spread over India's coast and seas"""
+    rng = random.Random(7)
+    conn = database.get_connection()
+    for data_type in series:
+        series_id = conn.execute(
+            "INSERT INTO ocean_data (region, data_type, min_value, max_value) VALUES (?, ?, ?, ?)",
+            ('bench', data_type, 0, 40)
+        ).lastrowid
+        conn.executemany(
+            "INSERT INTO ocean_data_points (ocean_data_id, latitude, longitude, value) VALUES (?, ?, ?, ?)",
+            ((series_id, rng.uniform(6, 24), rng.uniform(66, 94), rng.uniform(20, 35))
+             for _ in range(points // len(series)))
+        )
+    conn.commit()
+
+
+def bench_heatmap(args):
+    for points in args.points:
+        tmp_dir = use_temp_database('heatmap.db')
+        try:
+            populate_ocean_points(points)
+            app = import_app()
+            app.heatmap_cache.clear()
+            client = app.app.test_client()
+            print(f"\nheatmap: {points:,} ocean data points")
+
+            size, _, total = measure_response(client, '/api/ocean-data')
+            print(f"  raw points         {size / 1e6:8.2f} MB   {total * 1000:8.1f} ms")
+
+            # Every point of a layer falls in exactly one cell
+            layer_points = points // 3
+            cells = client.get('/api/heatmap/temperature?bbox=60,0,100,30&zoom=4').get_json()['cells']
+            assert sum(cell['count'] for cell in cells) == layer_points, 'cell counts differ from points'
+
+            rng = random.Random(3)
+            for zoom, span in ((5, 30.0), (7, 8.0)):
+                # A viewport panned around a few places, as a user browsing the map would
+                centers = [(rng.uniform(8, 22), rng.uniform(68, 92)) for _ in range(4)]
+                paths = [
+                    f"/api/heatmap/temperature?bbox={lng - span / 2 + dx},{lat - span / 4},"
+                    f"{lng + span / 2 + dx},{lat + span / 4}&zoom={zoom}"
+                    for lat, lng in centers for dx in (0, span / 8, span / 4) * (args.repeat // 3)
+                ]
+                for label in ('cold', 'warm'):
+                    if label == 'cold':
+                        app.heatmap_cache.clear()
+                    samples = []
+                    sizes = []
+                    for path in paths:
+                        size, _, elapsed = measure_response(client, path)
+                        samples.append(elapsed * 1000)
+                        sizes.append(size)
+                    print(f"  zoom {zoom} {label:<4} pans  {sum(sizes) / len(sizes) / 1e6:8.2f} MB"
+                          f"   mean {sum(samples) / len(samples):8.1f} ms   p95 {percentile(samples, 0.95):8.1f} ms")
+            print(f"  tile cache: {app.heatmap_cache.stats()}")
+        finally:
+            connection_pool.close_all_connections()
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+# Map tile benchmark
+def viewport_tiles(tiles, zoom, rng, count):
+    """Tiles of count random 1280x768 px viewports over India at a zoom level"""
+    import numpy as np
+
+    requested = []
+    for _ in range(count):
+        columns, rows = tiles.tiles_of(np.array([rng.uniform(70, 95)]), np.array([rng.uniform(10, 32)]), zoom)
+        requested += [(zoom, int(columns[0]) + dx, int(rows[0]) + dy) for dx in range(-2, 3) for dy in range(-1, 2)]
+    return requested
+
+
+def bench_tiles(args):
+    tmp_dir = use_temp_database('tiles.db')
+    try:
+        populate_stations(args.stations)
+        # Updates are synced explicitly below, not by the API's background thread
+        os.environ['AQUAGUARD_TILES_SYNC_INTERVAL'] = '0'
+        app = import_app()
+        import tiles
+        tiles.TILES_DIR = tmp_dir
+        database.delete_tile_changes('stations', database.get_last_tile_change('stations'))
+        client = app.app.test_client()
+        print(f"\ntiles: {args.stations:,} stations, zoom 0-{tiles.MAX_ZOOM}")
+
+        size, _, total = measure_response(client, '/api/districts')
+        print(f"  /api/districts       {size / 1e6:8.2f} MB   {total * 1000:8.1f} ms")
+
+        rng = random.Random(5)
+        requested = [tile for zoom in (5, 8, 11) for tile in viewport_tiles(tiles, zoom, rng, args.viewports)]
+        for label in ('on request', 'stored', 'cached (304)'):
+            if label == 'stored':
+                start = time.perf_counter()
+                counts = tiles.build('stations')
+                print(f"  build                {sum(counts.values()):,} tiles in {time.perf_counter() - start:.1f} s"
+                      f"   ({os.path.getsize(tiles.store_path('stations')) / 1e6:.1f} MB)")
+            samples = []
+            sizes = []
+            for zoom, x, y in requested:
+                path = f'/api/tiles/stations/{zoom}/{x}/{y}'
+                headers = None
+                if label == 'cached (304)':
+                    headers = {'If-None-Match': client.get(path).headers['ETag']}
+                size, _, elapsed = measure_response(client, path, headers)
+                samples.append(elapsed * 1000)
+                sizes.append(size)
+            print(f"  tiles {label:<14} {sum(sizes) / len(sizes) / 1e3:6.1f} KB"
+                  f"   mean {sum(samples) / len(samples):6.2f} ms   p95 {percentile(samples, 0.95):6.2f} ms")
+
+        # Move some stations, then check the incremental update against a full render
+        conn = database.get_connection()
+        ids = [row['id'] for row in conn.execute("SELECT id FROM districts ORDER BY RANDOM() LIMIT ?", (args.moved,))]
+        conn.executemany("UPDATE districts SET latitude = ?, longitude = ? WHERE id = ?",
+                         [(rng.uniform(8, 35), rng.uniform(68, 97), station_id) for station_id in ids])
+        conn.commit()
+        rendered, elapsed = timed(tiles.sync, 'stations')
+        stored = tiles._store('stations').execute("SELECT COUNT(*) FROM map").fetchone()[0]
+        print(f"  update after moving {args.moved:,} stations: {rendered:,} of {stored:,} stored tiles"
+              f" rendered again in {elapsed * 1000:.0f} ms")
+
+        store = tiles._store('stations')
+        for zoom, column, row, data in store.execute("SELECT * FROM tiles"):
+            y = 2 ** zoom - 1 - row
+            assert data == tiles._render_from_database('stations', zoom, column, y), f'tile {zoom}/{column}/{y} is stale'
+    finally:
+        connection_pool.close_all_connections()
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+def write_groundwater_csv(path, rows, changed_every=None):
+    """Write synthetic groundwater rows as a CSV, one row per city and year"""
+    rng = random.Random(11)
+    with open(path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['State Name', 'District Name', 'City Name', 'Year', 'Level', 'Quality',
+                         'Latitude', 'Longitude', 'Rainfall', 'Station Code'])
+        for i in range(rows):
+            level = round(rng.uniform(2, 30), 2)
+            if changed_every and i % changed_every == 0:
+                level += 1
+            writer.writerow([f"STATE {i % 36:02d}", f"District {i // 36 % 25:02d}", f"CITY {i // 900}",
+                             2023, level, 'Good', round(rng.uniform(8, 35), 5), round(rng.uniform(68, 97), 5),
+                             1200.0, f"S{i:07d}"])
+
+
+def bench_ingest(args):
+    import ingest
+
+    tmp_dir = tempfile.mkdtemp(prefix='aquaguard-bench-')
+    try:
+        path = os.path.join(tmp_dir, 'groundwater.csv')
+        changed_path = os.path.join(tmp_dir, 'groundwater-changed.csv')
+        write_groundwater_csv(path, args.rows)
+        write_groundwater_csv(changed_path, args.rows, changed_every=100)
+        print(f"\ningest: {args.rows:,} groundwater rows, {os.path.getsize(path) / 1e6:.1f} MB CSV")
+
+        for defer_indexes in (True, False, None):
+            label = {True: 'indexes rebuilt', False: 'indexes kept', None: 'auto'}[defer_indexes]
+            db_dir = use_temp_database('ingest.db')
+            try:
+                for run, csv_path in (('load', path), ('reload', path), ('1% changed', changed_path)):
+                    result = ingest.load_csv(csv_path, 'groundwater', defer_indexes=defer_indexes, progress=False)
+                    seconds = result['load_seconds'] + result['rebuild_seconds']
+                    print(f"  {label:<16} {run:<11} {result['written']:>10,} written   {seconds:6.1f} s"
+                          f"   {result['read'] / seconds:>9,.0f} rows/s")
+
+                conn = database.create_connection()
+                counts = [conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+                          for table in ('groundwater', 'groundwater_rtree')]
+                conn.close()
+                assert counts == [args.rows, args.rows], f'{label}: {counts}'
+            finally:
+                connection_pool.close_all_connections()
+                shutil.rmtree(db_dir, ignore_errors=True)
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+# Response cache benchmark
+def bench_responses(args):
+    tmp_dir = use_temp_database('responses.db')
+    try:
+        populate_stations(args.stations)
+        populate_groundwater(args.rows)
+        app = import_app(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'ground_water_predictor.pkl'))
+        client = app.app.test_client()
+        print(f"\nresponses: {args.stations:,} stations, {args.rows:,} groundwater rows")
+
+        for path in ('/api/regions', '/api/search/states', '/api/districts?limit=1000',
+                     '/api/districts', '/api/groundwater'):
+            def uncached():
+                app.response_cache.clear()
+                return client.get(path)
+
+            response, uncached_time = timed(uncached)
+            etag = response.headers['ETag']
+            _, cached_time = timed(lambda: [client.get(path) for _ in range(args.repeat)])
+            _, revalidated_time = timed(lambda: [client.get(path, headers={'If-None-Match': etag})
+                                                 for _ in range(args.repeat)])
+            cached_time /= args.repeat
+            revalidated_time /= args.repeat
+            print(f"  {path:<28} {len(response.data) / 1e6:7.2f} MB   uncached {uncached_time * 1000:8.2f} ms"
+                  f"   cached {cached_time * 1000:7.2f} ms ({uncached_time / cached_time:,.0f}x)"
+                  f"   304 {revalidated_time * 1000:6.2f} ms")
+    finally:
+        connection_pool.close_all_connections()
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+# Compression benchmark
+def bench_compression(args):
+    import compression
+
+    tmp_dir = use_temp_database('compression.db')
+    try:
+        populate_stations(args.stations)
+        populate_groundwater(args.rows)
+        app = import_app(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'ground_water_predictor.pkl'))
+        client = app.app.test_client()
+        print(f"\ncompression: {args.stations:,} stations, {args.rows:,} groundwater rows;"
+              f" encodings available: {', '.join(compression.COMPRESSORS)}")
+
+        for path in ('/api/districts', '/api/groundwater'):
+            body = client.get(path).data
+            _, identity_time = timed(lambda: [client.get(path) for _ in range(args.repeat)])
+            print(f"  {path}  identity {len(body) / 1e6:7.2f} MB   cached hit {identity_time / args.repeat * 1000:7.2f} ms")
+            for encoding in compression.COMPRESSORS:
+                headers = {'Accept-Encoding': encoding}
+                response, first_time = timed(lambda: client.get(path, headers=headers))
+                assert response.headers['Content-Encoding'] == encoding
+                _, hit_time = timed(lambda: [client.get(path, headers=headers) for _ in range(args.repeat)])
+                _, dynamic_time = timed(compression.compress, body, encoding)
+                print(f"    {encoding:<5} {len(response.data) / 1e6:7.2f} MB ({len(body) / len(response.data):4.1f}x)"
+                      f"   first {first_time * 1000:8.2f} ms   stored hit {hit_time / args.repeat * 1000:7.2f} ms"
+                      f"   per-request compression would add {dynamic_time * 1000:8.2f} ms")
+    finally:
+        connection_pool.close_all_connections()
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='AquaGuard backend benchmarks')
+    subparsers = parser.add_subparsers(dest='benchmark', required=True)
+
+    groundwater = subparsers.add_parser('groundwater', help='nested groundwater builder vs the N+1 version')
+    groundwater.add_argument('--rows', type=int, nargs='+', default=[10000, 1000000])
+    groundwater.set_defaults(func=bench_groundwater)
+
+    search = subparsers.add_parser('search', help='autocomplete latency on the location search index')
+    search.add_argument('--stations', type=int, default=300000)
+    search.add_argument('--repeat', type=int, default=5)
+    search.set_defaults(func=bench_search)
+
+    batch = subparsers.add_parser('batch', help='batch prediction vs sequential single-city calls')
+    batch.add_argument('--stations', type=int, nargs='+', default=[10, 100, 1000])
+    batch.add_argument('--model', default=os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                                       'ground_water_predictor.pkl'))
+    batch.set_defaults(func=bench_batch)
+
+    observations = subparsers.add_parser('observations', help='one-pass prediction of every observed station vs per-station')
+    observations.add_argument('--stations', type=int, default=10000)
+    observations.add_argument('--legacy-stations', type=int, default=20)
+    observations.add_argument('--model', default=os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                                              'ground_water_predictor.pkl'))
+    observations.set_defaults(func=bench_observations)
+
+    forecast = subparsers.add_parser('forecast', help='multi-year station forecasts across worker processes')
+    forecast.add_argument('--stations', type=int, default=100000)
+    forecast.add_argument('--years', type=int, default=5)
+    forecast.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4])
+    forecast.add_argument('--model', default=os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                                          'ground_water_predictor.pkl'))
+    forecast.set_defaults(func=bench_forecast)
+
+    stored = subparsers.add_parser('stored', help='stored /api/predict/<city> forecasts vs live inference')
+    stored.add_argument('--stations', type=int, default=100000)
+    stored.add_argument('--requests', type=int, default=200)
+    stored.add_argument('--model', default=os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                                        'ground_water_predictor.pkl'))
+    stored.set_defaults(func=bench_stored)
+
+    recharge = subparsers.add_parser('recharge', help='vectorized recharge vs DataFrame.apply')
+    recharge.add_argument('--rows', type=int, nargs='+', default=[10000, 100000, 1000000])
+    recharge.add_argument('--max-legacy-rows', type=int, default=1000000)
+    recharge.set_defaults(func=bench_recharge)
+
+    startup = subparsers.add_parser('startup', help='API import time; fails if heavy packages load eagerly')
+    startup.add_argument('--repeat', type=int, default=5)
+    startup.add_argument('--top', type=int, default=10)
+    startup.set_defaults(func=bench_startup)
+
+    stream = subparsers.add_parser('stream', help='NDJSON streaming vs JSON for the listing endpoints')
+    stream.add_argument('--rows', type=int, default=100000)
+    stream.set_defaults(func=bench_stream)
+
+    spatial = subparsers.add_parser('spatial', help='R*Tree viewport and nearest queries vs scans')
+    spatial.add_argument('--stations', type=int, nargs='+', default=[100000, 300000])
+    spatial.add_argument('--count', type=int, default=10)
+    spatial.add_argument('--repeat', type=int, default=20)
+    spatial.set_defaults(func=bench_spatial)
+
+    heatmap = subparsers.add_parser('heatmap', help='aggregated heatmap tiles vs shipping raw points')
+    heatmap.add_argument('--points', type=int, nargs='+', default=[100000, 1000000])
+    heatmap.add_argument('--repeat', type=int, default=6)
+    heatmap.set_defaults(func=bench_heatmap)
+
+    tiles = subparsers.add_parser('tiles', help='stored map tiles vs listing every station, and incremental updates')
+    tiles.add_argument('--stations', type=int, default=100000)
+    tiles.add_argument('--viewports', type=int, default=10)
+    tiles.add_argument('--moved', type=int, default=100)
+    tiles.set_defaults(func=bench_tiles)
+
+    ingest = subparsers.add_parser('ingest', help='bulk CSV load with indexes rebuilt afterwards vs kept')
+    ingest.add_argument('--rows', type=int, default=1000000)
+    ingest.set_defaults(func=bench_ingest)
+
+    responses = subparsers.add_parser('responses', help='cached read-only responses and 304s vs querying and serializing')
+    responses.add_argument('--stations', type=int, default=100000)
+    responses.add_argument('--rows', type=int, default=100000)
+    responses.add_argument('--repeat', type=int, default=20)
+    responses.set_defaults(func=bench_responses)
+
+    compression = subparsers.add_parser('compression', help='stored compressed response variants vs compressing per request')
+    compression.add_argument('--stations', type=int, default=100000)
+    compression.add_argument('--rows', type=int, default=100000)
+    compression.add_argument('--repeat', type=int, default=20)
+    compression.set_defaults(func=bench_compression)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == '__main__':
+    main()
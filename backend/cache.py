@@ -0,0 +1,217 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+from collections import OrderedDict
+
+
+def content_key(*parts):
+    """Hash JSON-serializable parts into a stable hex key"""
+    payload = json.dumps(parts, sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class ByteLRUCache:
+    """
+    Thread-safe LRU cache of bytes values, bounded by their total size.
+
+    When disk_dir is given, entries are also written there and memory misses
+    fall back to disk, so cached values survive restarts and are shared
+    between worker processes. The files are bounded by disk_max_bytes
+    (default: max_bytes): a disk hit touches a file's modification time, and once
+    the files written push past the bound the least recently used are deleted
+    until DISK_TRIM_RATIO of it is left. As processes sharing the directory
+    all write and evict there, it is scanned for the actual files when
+    trimming rather than tracked per process.
+
+    set_generation() moves the cache to a newer database write generation:
+    entries stored before it are dropped, from memory and from disk.
+    """
+
+    # Trimming the disk tier leaves this share of disk_max_bytes, so it isn't rescanned on every put
+    DISK_TRIM_RATIO = 0.9
+
+    def __init__(self, max_bytes, disk_dir=None, disk_max_bytes=None):
+        self.max_bytes = max_bytes
+        self.disk_dir = disk_dir
+        self.disk_max_bytes = max_bytes if disk_max_bytes is None else disk_max_bytes
+        self._entries = OrderedDict()
+        self._size = 0
+        self._generation = 0
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'disk_hits': 0, 'misses': 0, 'evictions': 0, 'disk_evictions': 0}
+        self._disk_size = self._trim_disk() if disk_dir else 0
+
+    def _disk_path(self, key, generation):
+        return os.path.join(self.disk_dir, f'gen-{generation}', key[:2], key)
+
+    def _store(self, key, value):
+        # Caller holds the lock
+        if key in self._entries:
+            self._size -= len(self._entries.pop(key))
+        if len(value) > self.max_bytes:
+            return
+        self._entries[key] = value
+        self._size += len(value)
+        while self._size > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self._size -= len(evicted)
+            self._stats['evictions'] += 1
+
+    @staticmethod
+    def _dir_generation(name):
+        """Generation of a directory in disk_dir, or None for one the cache didn't write"""
+        if name.startswith('gen-') and name[4:].isdigit():
+            return int(name[4:])
+        # Key prefix directories from before generations; their entries count as oldest
+        if len(name) == 2 and all(c in '0123456789abcdef' for c in name):
+            return -1
+        return None
+
+    def _scan_disk(self):
+        """Return (mtime, size, path, generation) of every file under disk_dir"""
+        files = []
+        for root, _, names in os.walk(self.disk_dir):
+            generation = self._dir_generation(os.path.relpath(root, self.disk_dir).split(os.sep)[0])
+            if generation is None:
+                continue
+            for name in names:
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                files.append((stat.st_mtime, stat.st_size, path, generation))
+        return files
+
+    def _trim_disk(self, generation=0):
+        """
+        Delete the files of generations before generation, then the least
+        recently used ones until the rest fit DISK_TRIM_RATIO of disk_max_bytes.
+        Returns the size of the files left.
+        """
+        files = sorted(self._scan_disk())
+        total = sum(size for _, size, _, _ in files)
+        target = self.disk_max_bytes * self.DISK_TRIM_RATIO
+        evicted = 0
+        for _, size, path, file_generation in files:
+            if file_generation >= generation and total <= target:
+                continue
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                print(f"Error evicting cache entry {path}: {e}")
+                continue
+            total -= size
+            evicted += 1
+
+        # The emptied directories of older generations
+        for name in os.listdir(self.disk_dir) if os.path.isdir(self.disk_dir) else []:
+            dir_generation = self._dir_generation(name)
+            if dir_generation is not None and dir_generation < generation:
+                shutil.rmtree(os.path.join(self.disk_dir, name), ignore_errors=True)
+        with self._lock:
+            self._stats['disk_evictions'] += evicted
+        return total
+
+    def set_generation(self, generation):
+        """
+        Move to a newer write generation, dropping every entry stored under
+        older ones. Older or unknown (None) generations are ignored, so
+        processes that see a new generation at different times don't undo
+        each other.
+        """
+        with self._lock:
+            if generation is None or generation <= self._generation:
+                return
+            self._generation = generation
+            self._entries.clear()
+            self._size = 0
+
+        if self.disk_dir:
+            disk_size = self._trim_disk(generation)
+            with self._lock:
+                self._disk_size = disk_size
+
+    def get(self, key):
+        """Return the cached value for key, or None"""
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+                self._stats['hits'] += 1
+                return value
+            generation = self._generation
+
+        if self.disk_dir:
+            path = self._disk_path(key, generation)
+            try:
+                with open(path, 'rb') as f:
+                    value = f.read()
+                # Recency for trimming, which every process sharing the directory sees
+                os.utime(path)
+            except OSError:
+                value = None
+            if value is not None:
+                with self._lock:
+                    self._stats['disk_hits'] += 1
+                    self._store(key, value)
+                return value
+
+        with self._lock:
+            self._stats['misses'] += 1
+        return None
+
+    def put(self, key, value):
+        """Cache value under key, evicting least recently used entries as needed"""
+        with self._lock:
+            self._store(key, value)
+            generation = self._generation
+
+        if self.disk_dir and len(value) <= self.disk_max_bytes:
+            path = self._disk_path(key, generation)
+            try:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                # Write to a temp file first so readers never see a partial entry
+                fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+                try:
+                    with os.fdopen(fd, 'wb') as f:
+                        f.write(value)
+                    os.replace(tmp_path, path)
+                except OSError:
+                    os.unlink(tmp_path)
+                    raise
+            except OSError as e:
+                print(f"Error writing cache entry {key}: {e}")
+                return
+
+            with self._lock:
+                self._disk_size += len(value)
+                trim = self._disk_size > self.disk_max_bytes
+            if trim:
+                disk_size = self._trim_disk(generation)
+                with self._lock:
+                    self._disk_size = disk_size
+
+    def clear(self):
+        """Drop every in-memory entry"""
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    def stats(self):
+        """Return hit/miss counters and current sizes"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats['entries'] = len(self._entries)
+            stats['bytes'] = self._size
+            stats['disk_bytes'] = self._disk_size
+            stats['generation'] = self._generation
+        stats['max_bytes'] = self.max_bytes
+        stats['disk_dir'] = self.disk_dir
+        stats['disk_max_bytes'] = self.disk_max_bytes
+        return stats
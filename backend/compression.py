@@ -0,0 +1,84 @@
+"""
+Content-Encoding negotiation and compression for API responses.
+
+gzip is always available; brotli and zstd are offered too when the brotli
+and zstandard packages are installed. Bodies compressed once and stored
+(cached responses) use slower, denser levels than bodies compressed per
+request.
+"""
+import gzip
+import os
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Smaller bodies are sent as they are; compressing them saves less than it costs
+MIN_SIZE = int(os.environ.get('AQUAGUARD_COMPRESS_MIN_BYTES', '1024'))
+
+# Levels for bodies compressed per request, and for bodies compressed once and stored
+DYNAMIC_LEVELS = {'zstd': 3, 'br': 4, 'gzip': 5}
+STORED_LEVELS = {'zstd': 12, 'br': 8, 'gzip': 9}
+
+# Compressible response types besides text/*
+COMPRESSIBLE_TYPES = {
+    'application/json', 'application/geo+json', 'application/x-ndjson',
+    'application/javascript', 'image/svg+xml',
+}
+
+
+def _gzip(body, level):
+    # No timestamp, so the same body always compresses to the same bytes
+    return gzip.compress(body, compresslevel=level, mtime=0)
+
+
+def _brotli(body, level):
+    return brotli.compress(body, quality=level)
+
+
+def _zstd(body, level):
+    return zstandard.ZstdCompressor(level=level).compress(body)
+
+
+# Available encodings, most preferred first when the client accepts several equally
+COMPRESSORS = {
+    encoding: compress
+    for encoding, compress, available in (
+        ('zstd', _zstd, zstandard is not None),
+        ('br', _brotli, brotli is not None),
+        ('gzip', _gzip, True),
+    )
+    if available
+}
+
+
+def compressible(mimetype, size):
+    """Whether a body of this type and size is worth compressing"""
+    return size >= MIN_SIZE and (mimetype.startswith('text/') or mimetype in COMPRESSIBLE_TYPES)
+
+
+def negotiate(accept_encodings):
+    """
+    Pick the encoding to send for a request's Accept-Encoding header, or None
+    for an uncompressed body.
+
+    The client's highest quality wins; ties go to the order of COMPRESSORS.
+    """
+    best, best_quality = None, 0
+    for encoding in COMPRESSORS:
+        quality = accept_encodings[encoding]
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+
+def compress(body, encoding, stored=False):
+    """Compress body with an encoding from COMPRESSORS"""
+    levels = STORED_LEVELS if stored else DYNAMIC_LEVELS
+    return COMPRESSORS[encoding](body, levels[encoding])
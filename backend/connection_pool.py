@@ -0,0 +1,154 @@
+import os
+import sqlite3
+import threading
+import time
+from sqlite3 import Error
+
+# Pool settings, overridable from the environment
+CACHE_SIZE = int(os.environ.get('AQUAGUARD_SQLITE_CACHE_SIZE', '-16000'))  # negative values are KiB
+MMAP_SIZE = int(os.environ.get('AQUAGUARD_SQLITE_MMAP_SIZE', str(256 * 1024 * 1024)))
+SYNCHRONOUS = os.environ.get('AQUAGUARD_SQLITE_SYNCHRONOUS', 'NORMAL').upper()
+JOURNAL_MODE = os.environ.get('AQUAGUARD_SQLITE_JOURNAL_MODE', 'WAL').upper()
+BUSY_TIMEOUT_MS = int(os.environ.get('AQUAGUARD_SQLITE_BUSY_TIMEOUT_MS', '5000'))
+HEALTH_CHECK_INTERVAL = float(os.environ.get('AQUAGUARD_POOL_HEALTH_CHECK_INTERVAL', '30'))
+
+_SYNCHRONOUS_MODES = ('OFF', 'NORMAL', 'FULL', 'EXTRA')
+_JOURNAL_MODES = ('DELETE', 'TRUNCATE', 'PERSIST', 'MEMORY', 'WAL', 'OFF')
+
+# Each thread keeps one connection per database path
+_local = threading.local()
+
+_stats_lock = threading.Lock()
+_stats = {
+    'hits': 0,
+    'misses': 0,
+    'health_checks': 0,
+    'health_failures': 0,
+}
+
+# Bumped by close_all_connections() so every thread reopens on next use
+_generation = 0
+
+
+def _count(key):
+    with _stats_lock:
+        _stats[key] += 1
+
+
+def configure_connection(conn):
+    """Apply the pool's PRAGMA settings to a freshly opened connection"""
+    conn.row_factory = sqlite3.Row  # Return rows as dictionaries
+    cursor = conn.cursor()
+    if JOURNAL_MODE in _JOURNAL_MODES:
+        cursor.execute(f"PRAGMA journal_mode={JOURNAL_MODE}")
+    if SYNCHRONOUS in _SYNCHRONOUS_MODES:
+        cursor.execute(f"PRAGMA synchronous={SYNCHRONOUS}")
+    cursor.execute(f"PRAGMA cache_size={CACHE_SIZE:d}")
+    cursor.execute(f"PRAGMA mmap_size={MMAP_SIZE:d}")
+    cursor.execute(f"PRAGMA busy_timeout={BUSY_TIMEOUT_MS:d}")
+    cursor.execute("PRAGMA temp_store=MEMORY")
+    cursor.close()
+    return conn
+
+
+def open_connection(db_path):
+    """Open a new, unpooled connection with the pool's PRAGMA settings"""
+    return configure_connection(sqlite3.connect(db_path))
+
+
+def _is_healthy(conn):
+    _count('health_checks')
+    try:
+        conn.execute("SELECT 1").fetchone()
+        return True
+    except Error:
+        _count('health_failures')
+        return False
+
+
+def _close_quietly(conn):
+    try:
+        conn.close()
+    except Error:
+        pass
+
+
+def get_connection(db_path):
+    """
+    Get the calling thread's connection to db_path, opening it on first use.
+
+    Connections are reused for the lifetime of the thread. They are health
+    checked at most every HEALTH_CHECK_INTERVAL seconds, and are reopened
+    after a fork or a call to close_all_connections().
+    """
+    connections = getattr(_local, 'connections', None)
+    if connections is None:
+        connections = _local.connections = {}
+
+    entry = connections.get(db_path)
+    if entry is not None:
+        conn, pid, generation, checked_at = entry
+        if pid != os.getpid():
+            # Inherited from the parent process; never reuse it across a fork
+            del connections[db_path]
+        elif generation != _generation:
+            _close_quietly(conn)
+            del connections[db_path]
+        else:
+            now = time.monotonic()
+            if now - checked_at < HEALTH_CHECK_INTERVAL or _is_healthy(conn):
+                if now - checked_at >= HEALTH_CHECK_INTERVAL:
+                    connections[db_path] = (conn, pid, generation, now)
+                _count('hits')
+                return conn
+            _close_quietly(conn)
+            del connections[db_path]
+
+    _count('misses')
+    conn = open_connection(db_path)
+    connections[db_path] = (conn, os.getpid(), _generation, time.monotonic())
+    return conn
+
+
+def discard_connection(db_path):
+    """Close and forget the calling thread's connection to db_path"""
+    connections = getattr(_local, 'connections', None)
+    if connections and db_path in connections:
+        _close_quietly(connections.pop(db_path)[0])
+
+
+def close_all_connections():
+    """Close this thread's connections and make every other thread reconnect"""
+    global _generation
+    with _stats_lock:
+        _generation += 1
+    connections = getattr(_local, 'connections', None)
+    if connections:
+        for conn, _, _, _ in connections.values():
+            _close_quietly(conn)
+        connections.clear()
+
+
+def get_pool_stats():
+    """Return a snapshot of the pool counters and settings"""
+    with _stats_lock:
+        stats = dict(_stats)
+        stats['generation'] = _generation
+    total = stats['hits'] + stats['misses']
+    stats['hit_ratio'] = stats['hits'] / total if total else 0.0
+    stats['settings'] = {
+        'journal_mode': JOURNAL_MODE,
+        'synchronous': SYNCHRONOUS,
+        'cache_size': CACHE_SIZE,
+        'mmap_size': MMAP_SIZE,
+        'busy_timeout_ms': BUSY_TIMEOUT_MS,
+        'health_check_interval': HEALTH_CHECK_INTERVAL,
+    }
+    return stats
+
+
+def reset_pool_stats():
+    """Reset the hit/miss and health check counters"""
+    with _stats_lock:
+        for key in _stats:
+            _stats[key] = 0
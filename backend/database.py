@@ -1,126 +1,56 @@
+import difflib
 import json
+import math
 import os
-import sqlite3
+from datetime import datetime, timedelta, timezone
 from sqlite3 import Error
 
+import connection_pool
+import migrations
+
 # Database setup
-DB_PATH = os.path.join(os.path.dirname(__file__), 'aquaguard.db')
+DB_PATH = os.environ.get('AQUAGUARD_DB_PATH', os.path.join(os.path.dirname(__file__), 'aquaguard.db'))
+
+# Rows fetched per round trip by the streaming iterators
+STREAM_BATCH_SIZE = int(os.environ.get('AQUAGUARD_STREAM_BATCH_SIZE', '500'))
+
+# Largest page a paginated list query returns
+MAX_PAGE_SIZE = int(os.environ.get('AQUAGUARD_MAX_PAGE_SIZE', '1000'))
 
 def create_connection():
-    """Create a database connection to the SQLite database"""
+    """Create a new, unpooled database connection to the SQLite database"""
     conn = None
     try:
-        conn = sqlite3.connect(DB_PATH)
-        conn.row_factory = sqlite3.Row  # Return rows as dictionaries
+        conn = connection_pool.open_connection(DB_PATH)
         return conn
     except Error as e:
         print(e)
     return conn
 
-def create_tables():
-    """Create the database tables if they don't exist"""
+def get_connection():
+    """Get the current thread's pooled connection to the SQLite database"""
+    try:
+        return connection_pool.get_connection(DB_PATH)
+    except Error as e:
+        print(e)
+    return None
+
+def get_pool_stats():
+    """Get connection pool hit/miss counters"""
+    return connection_pool.get_pool_stats()
+
+def migrate_database():
+    """Create or upgrade the database schema by applying pending migrations"""
     conn = create_connection()
     if conn:
         try:
-            cursor = conn.cursor()
-            
-            # Create ocean_data table
-            cursor.execute('''
-            CREATE TABLE IF NOT EXISTS ocean_data (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                region TEXT NOT NULL,
-                data_type TEXT NOT NULL,
-                min_value REAL,
-                max_value REAL
-            )
-            ''')
-            
-            # Create ocean_data_points table
-            cursor.execute('''
-            CREATE TABLE IF NOT EXISTS ocean_data_points (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                ocean_data_id INTEGER,
-                latitude REAL NOT NULL,
-                longitude REAL NOT NULL,
-                value REAL NOT NULL,
-                FOREIGN KEY (ocean_data_id) REFERENCES ocean_data (id)
-            )
-            ''')
-            
-            # Create district table
-            cursor.execute('''
-            CREATE TABLE IF NOT EXISTS districts (
-                id TEXT PRIMARY KEY,
-                color TEXT,
-                agency_name TEXT,
-                state_name TEXT NOT NULL,
-                district_name TEXT NOT NULL,
-                tahsil_name TEXT,
-                station_name TEXT,
-                latitude REAL,
-                longitude REAL,
-                station_type TEXT,
-                station_status TEXT
-            )
-            ''')
-            
-            # Create regions table
-            cursor.execute('''
-            CREATE TABLE IF NOT EXISTS regions (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                name TEXT NOT NULL,
-                sw_lat REAL,
-                sw_lng REAL,
-                ne_lat REAL,
-                ne_lng REAL,
-                center_lat REAL,
-                center_lng REAL
-            )
-            ''')
-            
-            # Create sightings table
-            cursor.execute('''
-            CREATE TABLE IF NOT EXISTS sightings (
-                id TEXT PRIMARY KEY,
-                state_name TEXT NOT NULL,
-                district_name TEXT NOT NULL,
-                station_name TEXT,
-                latitude REAL,
-                longitude REAL,
-                temperature REAL,
-                ph REAL,
-                salinity REAL
-            )
-            ''')
-            
-            # Create groundwater table
-            cursor.execute('''
-            CREATE TABLE IF NOT EXISTS groundwater (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                state_name TEXT NOT NULL,
-                district_name TEXT NOT NULL,
-                city_name TEXT,
-                year INTEGER,
-                level REAL,
-                quality TEXT,
-                latitude REAL,
-                longitude REAL,
-                color TEXT,
-                rainfall REAL,
-                annual_extractable REAL,
-                current_extraction REAL,
-                ground_water_recharge REAL,
-                natural_discharges REAL,
-                extraction_percentage REAL,
-                historical_levels TEXT,
-                monthly_rainfall TEXT
-            )
-            ''')
-            
-            conn.commit()
-            print("Database tables created successfully")
+            applied = migrations.migrate(conn)
+            if applied:
+                print(f"Applied database migrations: {', '.join(map(str, applied))}")
+            else:
+                print("Database schema is up to date")
         except Error as e:
-            print(f"Error creating tables: {e}")
+            print(f"Error migrating database: {e}")
         finally:
             conn.close()
 
@@ -304,59 +234,165 @@ def populate_database():
 
 def init_db():
     """Initialize the database"""
-    create_tables()
+    migrate_database()
     populate_database()
 
 # Database query functions
-def get_ocean_data():
-    """Get all ocean data"""
-    conn = create_connection()
+def get_ocean_data(region=None):
+    """Get all ocean data or filter by region"""
+    conn = get_connection()
     if conn:
         try:
             cursor = conn.cursor()
-            cursor.execute("SELECT * FROM ocean_data")
+            
+            # Load every series with its points in one query; rows arrive
+            # grouped by series so the points are collected in a single pass
+            query = """
+                SELECT d.id, d.region, d.data_type, d.min_value, d.max_value,
+                       p.id AS point_id, p.latitude, p.longitude, p.value
+                FROM ocean_data d
+                LEFT JOIN ocean_data_points p ON p.ocean_data_id = d.id
+            """
+            if region:
+                cursor.execute(query + " WHERE d.region = ? ORDER BY d.id, p.id", (region,))
+            else:
+                cursor.execute(query + " ORDER BY d.id, p.id")
+            
             ocean_data = []
+            data = None
             
-            for row in cursor.fetchall():
-                data = dict(row)
-                # Get all points for this ocean data
-                cursor.execute(
-                    "SELECT * FROM ocean_data_points WHERE ocean_data_id = ?", 
-                    (row['id'],)
-                )
-                points = [dict(point) for point in cursor.fetchall()]
-                data['points'] = points
-                ocean_data.append(data)
+            for row in cursor:
+                if data is None or data['id'] != row['id']:
+                    data = {
+                        'id': row['id'],
+                        'region': row['region'],
+                        'data_type': row['data_type'],
+                        'min_value': row['min_value'],
+                        'max_value': row['max_value'],
+                        'points': []
+                    }
+                    ocean_data.append(data)
+                
+                # Series without points come back with a NULL point
+                if row['point_id'] is not None:
+                    data['points'].append({
+                        'id': row['point_id'],
+                        'ocean_data_id': row['id'],
+                        'latitude': row['latitude'],
+                        'longitude': row['longitude'],
+                        'value': row['value']
+                    })
             
             return ocean_data
         except Error as e:
             print(f"Error retrieving ocean data: {e}")
             return []
-        finally:
-            conn.close()
     
     return []
 
-def get_districts():
-    """Get all districts"""
-    conn = create_connection()
+# Column names per table, read once from the schema
+_table_columns = {}
+
+def get_table_columns(table):
+    """Get a table's column names in schema order"""
+    if table not in _table_columns:
+        conn = get_connection()
+        if conn is None:
+            return []  # Not cached: the next call retries once the database opens
+        _table_columns[table] = [row['name'] for row in conn.execute(f"PRAGMA table_info({table})")]
+    return _table_columns[table]
+
+def _list_query(table, fields=None, bbox=None, after=None, limit=None):
+    """
+    Build the SELECT for a station list with projection, viewport and keyset pagination.
+    
+    fields limits the selected columns (id is always selected when paging);
+    bbox is (min_lng, min_lat, max_lng, max_lat); after and limit page
+    through rows in id order. Raises ValueError for unknown fields.
+    """
+    if fields:
+        columns = get_table_columns(table)
+        unknown = [field for field in fields if field not in columns]
+        if unknown:
+            raise ValueError(f"unknown fields: {', '.join(unknown)}")
+        selected = list(dict.fromkeys(fields))
+        if limit is not None and 'id' not in selected:
+            selected.insert(0, 'id')  # Needed for the next page's cursor
+        select = ', '.join(selected)
+    else:
+        select = '*'
+    
+    conditions = []
+    params = []
+    if bbox:
+        min_lng, min_lat, max_lng, max_lat = bbox
+        conditions.append("latitude BETWEEN ? AND ? AND longitude BETWEEN ? AND ?")
+        params.extend((min_lat, max_lat, min_lng, max_lng))
+    if after is not None:
+        conditions.append("id > ?")
+        params.append(after)
+    
+    sql = f"SELECT {select} FROM {table}"
+    if conditions:
+        sql += " WHERE " + " AND ".join(conditions)
+    if limit is not None:
+        sql += " ORDER BY id LIMIT ?"
+        params.append(min(limit, MAX_PAGE_SIZE + 1))
+    return sql, params
+
+def get_districts(fields=None, bbox=None, after=None, limit=None):
+    """
+    Get all districts, or a page of them.
+    
+    See _list_query for fields, bbox, after and limit; with limit, rows come
+    in id order and the next page starts after the last row's id.
+    """
+    sql, params = _list_query('districts', fields, bbox, after, limit)
+    conn = get_connection()
     if conn:
         try:
             cursor = conn.cursor()
-            cursor.execute("SELECT * FROM districts")
+            cursor.execute(sql, params)
             districts = [dict(row) for row in cursor.fetchall()]
             return districts
         except Error as e:
             print(f"Error retrieving districts: {e}")
             return []
-        finally:
-            conn.close()
     
     return []
 
+def _iter_rows(description, sql, params=(), convert=dict):
+    """
+    Yield converted rows of a query, fetching STREAM_BATCH_SIZE at a time.
+    
+    Only one batch is held in memory, so large tables can be streamed to a
+    client row by row. The cursor is closed when the generator finishes or
+    is discarded.
+    """
+    conn = get_connection()
+    if conn:
+        cursor = conn.cursor()
+        try:
+            cursor.execute(sql, params)
+            while True:
+                rows = cursor.fetchmany(STREAM_BATCH_SIZE)
+                if not rows:
+                    break
+                for row in rows:
+                    yield convert(row)
+        except Error as e:
+            print(f"Error streaming {description}: {e}")
+        finally:
+            cursor.close()
+
+def iter_districts(fields=None, bbox=None, after=None, limit=None):
+    """Yield district rows; the streaming counterpart of get_districts()"""
+    sql, params = _list_query('districts', fields, bbox, after, limit)
+    return _iter_rows('districts', sql, params)
+
 def get_regions():
     """Get all regions"""
-    conn = create_connection()
+    conn = get_connection()
     if conn:
         try:
             cursor = conn.cursor()
@@ -366,119 +402,163 @@ def get_regions():
         except Error as e:
             print(f"Error retrieving regions: {e}")
             return []
-        finally:
-            conn.close()
     
     return []
 
-def get_sightings():
-    """Get all sightings"""
-    conn = create_connection()
+def get_sightings(fields=None, bbox=None, after=None, limit=None):
+    """Get all sightings, or a page of them; see get_districts()"""
+    sql, params = _list_query('sightings', fields, bbox, after, limit)
+    conn = get_connection()
     if conn:
         try:
             cursor = conn.cursor()
-            cursor.execute("SELECT * FROM sightings")
+            cursor.execute(sql, params)
             sightings = [dict(row) for row in cursor.fetchall()]
             return sightings
         except Error as e:
             print(f"Error retrieving sightings: {e}")
             return []
-        finally:
-            conn.close()
     
     return []
 
+def iter_sightings(fields=None, bbox=None, after=None, limit=None):
+    """Yield sighting rows; the streaming counterpart of get_sightings()"""
+    sql, params = _list_query('sightings', fields, bbox, after, limit)
+    return _iter_rows('sightings', sql, params)
+
+def _groundwater_data_point(row):
+    """Convert a groundwater row into the API's data point shape"""
+    data_point = {
+        "id": row['id'],
+        "year": row['year'],
+        "level": row['level'],
+        "quality": row['quality'],
+        "latitude": row['latitude'],
+        "longitude": row['longitude'],
+        "color": row['color'],
+        "rainfall": row['rainfall'],
+        "annualExtractable": row['annual_extractable'],
+        "groundWaterExtraction": row['current_extraction'],
+        "groundWaterRecharge": row['ground_water_recharge'],
+        "naturalDischarges": row['natural_discharges'],
+        "extraction": row['extraction_percentage']
+    }
+    
+    # Parse JSON data
+    if row['historical_levels']:
+        data_point['historicalLevels'] = json.loads(row['historical_levels'])
+    
+    if row['monthly_rainfall']:
+        data_point['monthlyRainfall'] = json.loads(row['monthly_rainfall'])
+    
+    return data_point
+
 def get_groundwater_data(state=None, district=None):
     """Get all groundwater data or filter by state and district"""
-    conn = create_connection()
+    conn = get_connection()
     if conn:
         try:
             cursor = conn.cursor()
             
-            # Get states for the result structure
-            if state:
-                states = [state]
+            # The district filter only applies together with a state
+            if state and district:
+                cursor.execute(
+                    """
+                    SELECT * FROM groundwater
+                    WHERE state_name = ? AND district_name = ?
+                    ORDER BY state_name, district_name, id
+                    """,
+                    (state, district)
+                )
+            elif state:
+                cursor.execute(
+                    """
+                    SELECT * FROM groundwater
+                    WHERE state_name = ?
+                    ORDER BY state_name, district_name, id
+                    """,
+                    (state,)
+                )
             else:
-                cursor.execute("SELECT DISTINCT state_name FROM groundwater")
-                states = [row['state_name'] for row in cursor.fetchall()]
+                cursor.execute("SELECT * FROM groundwater ORDER BY state_name, district_name, id")
             
+            # Requested states and districts are present even when they have no rows
             result = {}
+            if state:
+                result[state] = {}
+                if district:
+                    result[state][district] = {}
             
-            for current_state in states:
-                result[current_state] = {}
+            # Rows arrive grouped by (state, district), so the nested dict is
+            # built in a single pass over the cursor
+            current_key = None
+            district_data = None
+            for row in cursor:
+                key = (row['state_name'], row['district_name'])
+                if key != current_key:
+                    current_key = key
+                    district_data = {}
+                    result.setdefault(key[0], {})[key[1]] = district_data
                 
-                # Get districts for the current state
-                if district and state == current_state:
-                    districts = [district]
-                else:
-                    cursor.execute(
-                        "SELECT DISTINCT district_name FROM groundwater WHERE state_name = ?", 
-                        (current_state,)
-                    )
-                    districts = [row['district_name'] for row in cursor.fetchall()]
+                data_point = _groundwater_data_point(row)
                 
-                for current_district in districts:
-                    # Get district data
-                    cursor.execute(
-                        """
-                        SELECT * FROM groundwater 
-                        WHERE state_name = ? AND district_name = ?
-                        """, 
-                        (current_state, current_district)
-                    )
-                    
-                    district_data = {}
-                    
-                    for row in cursor.fetchall():
-                        data_point = {
-                            "id": row['id'],
-                            "year": row['year'],
-                            "level": row['level'],
-                            "quality": row['quality'],
-                            "latitude": row['latitude'],
-                            "longitude": row['longitude'],
-                            "color": row['color'],
-                            "rainfall": row['rainfall'],
-                            "annualExtractable": row['annual_extractable'],
-                            "groundWaterExtraction": row['current_extraction'],
-                            "groundWaterRecharge": row['ground_water_recharge'],
-                            "naturalDischarges": row['natural_discharges'],
-                            "extraction": row['extraction_percentage']
-                        }
-                        
-                        # Parse JSON data
-                        if row['historical_levels']:
-                            data_point['historicalLevels'] = json.loads(row['historical_levels'])
-                        
-                        if row['monthly_rainfall']:
-                            data_point['monthlyRainfall'] = json.loads(row['monthly_rainfall'])
-                        
-                        if row['city_name']:
-                            # If there's a city, this is city-level data
-                            district_data[row['city_name']] = data_point
-                        else:
-                            # This is district-level data
-                            district_data = data_point
-                    
-                    result[current_state][current_district] = district_data
-            
-            if state and district:
-                return {state: {district: result[state][district]}}
-            elif state:
-                return {state: result[state]}
+                if row['city_name']:
+                    # If there's a city, this is city-level data
+                    district_data[row['city_name']] = data_point
+                else:
+                    # This is district-level data
+                    district_data = data_point
+                    result[key[0]][key[1]] = district_data
             
             return result
         except Error as e:
             print(f"Error retrieving groundwater data: {e}")
             return {}
-        finally:
-            conn.close()
     
     return {}
 
+def _groundwater_record(row):
+    """A groundwater data point flattened with its location, for streaming"""
+    record = {
+        'state': row['state_name'],
+        'district': row['district_name'],
+        'city': row['city_name'] or None,
+    }
+    record.update(_groundwater_data_point(row))
+    return record
+
+def iter_groundwater_data(state=None, district=None):
+    """
+    Yield groundwater data points one by one, optionally filtered by state and district.
+    
+    The streaming counterpart of get_groundwater_data(): instead of one nested
+    dict, each data point carries its state, district and city (None for
+    district-level data), in the same order. Every stored row is yielded,
+    including ones the nested dict replaces with a later row for the same city.
+    """
+    # The district filter only applies together with a state
+    if state and district:
+        sql = """
+            SELECT * FROM groundwater
+            WHERE state_name = ? AND district_name = ?
+            ORDER BY state_name, district_name, id
+        """
+        params = (state, district)
+    elif state:
+        sql = """
+            SELECT * FROM groundwater
+            WHERE state_name = ?
+            ORDER BY state_name, district_name, id
+        """
+        params = (state,)
+    else:
+        sql = "SELECT * FROM groundwater ORDER BY state_name, district_name, id"
+        params = ()
+    return _iter_rows('groundwater data', sql, params, _groundwater_record)
+
 def get_available_states():
     """Get all unique states from sightings data"""
-    conn = create_connection()
+    conn = get_connection()
     if conn:
         try:
             cursor = conn.cursor()
@@ -488,14 +568,12 @@ def get_available_states():
         except Error as e:
             print(f"Error retrieving available states: {e}")
             return []
-        finally:
-            conn.close()
     
     return []
 
 def get_districts_by_state(state):
     """Get all unique districts for a given state"""
-    conn = create_connection()
+    conn = get_connection()
     if conn:
         try:
             cursor = conn.cursor()
@@ -508,63 +586,706 @@ def get_districts_by_state(state):
         except Error as e:
             print(f"Error retrieving districts for state {state}: {e}")
             return []
-        finally:
-            conn.close()
     
     return []
 
-def get_stations_by_district(state, district):
-    """Get all unique stations for a given district"""
-    conn = create_connection()
+def get_stations_by_district(state, district, after=None, limit=None):
+    """Get all unique stations for a given district, or the page of limit names after a name"""
+    sql = "SELECT DISTINCT station_name FROM sightings WHERE state_name = ? AND district_name = ?"
+    params = [state, district]
+    if after is not None:
+        sql += " AND station_name > ?"
+        params.append(after)
+    sql += " ORDER BY station_name"
+    if limit is not None:
+        sql += " LIMIT ?"
+        params.append(min(limit, MAX_PAGE_SIZE + 1))
+    
+    conn = get_connection()
     if conn:
         try:
             cursor = conn.cursor()
-            cursor.execute(
-                "SELECT DISTINCT station_name FROM sightings WHERE state_name = ? AND district_name = ? ORDER BY station_name", 
-                (state, district)
-            )
+            cursor.execute(sql, params)
             stations = [row['station_name'] for row in cursor.fetchall()]
             return stations
         except Error as e:
             print(f"Error retrieving stations for district {district} in state {state}: {e}")
             return []
-        finally:
-            conn.close()
     
     return []
 
-def search_locations(query):
-    """Search for locations matching the query"""
-    conn = create_connection()
+# Prefix matches are listed by type in this order
+SEARCH_TYPES = ('state', 'district', 'city', 'station')
+
+# Upper bound on typo-tolerant candidates scored per search
+FUZZY_CANDIDATES = 100
+
+def _fts_phrase(text):
+    """Quote text as an FTS5 phrase; on the trigram index it matches as a substring"""
+    return '"' + text.replace('"', '""') + '"'
+
+def _fuzzy_matches(query):
+    """
+    Build FTS5 MATCH expressions that tolerate a single typo in the query.
+    
+    Each expression splits the query around one position, either dropping
+    that character or not, and requires the remaining parts of three or more
+    characters to appear in the name. Expressions keeping the most of the
+    query come first.
+    """
+    alternatives = {}
+    for i in range(len(query)):
+        for left, right in ((query[:i], query[i + 1:]), (query[:i], query[i:])):
+            parts = [part for part in (left, right) if len(part) >= 3]
+            if parts:
+                expression = ' AND '.join(_fts_phrase(part) for part in parts)
+                alternatives[expression] = sum(len(part) for part in parts)
+    return sorted(alternatives, key=alternatives.get, reverse=True)
+
+def _similarity(query, name):
+    """Similarity of query to the closest word run in name, between 0 and 1"""
+    query = query.lower()
+    words = name.lower().split()
+    candidates = [name.lower()] + [' '.join(words[i:i + len(query.split())]) for i in range(len(words))]
+    return max(difflib.SequenceMatcher(None, query, candidate).ratio() for candidate in candidates)
+
+def search_locations(query, limit=20, fuzzy=False):
+    """
+    Search states, districts, cities and stations matching the query.
+    
+    Results are ranked in three tiers, each only queried while fewer than
+    limit results have been found: names starting with the query (states
+    first, then districts, cities and stations), names containing it, and
+    with fuzzy=True, names within one typo of it ranked by similarity.
+    Substring and fuzzy matching need at least three characters.
+    """
+    conn = get_connection()
     if conn:
         try:
             cursor = conn.cursor()
+            query = query.strip()
+            prefix = query.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+            results = []
+            seen = set()
             
-            # Search states, districts, stations, and cities
-            search_term = f"%{query}%"
+            def collect(rows):
+                for row in rows:
+                    if row['id'] not in seen:
+                        seen.add(row['id'])
+                        result = {'name': row['name'], 'type': row['type']}
+                        if row['parent']:
+                            result['parent'] = row['parent']
+                        results.append(result)
             
-            # Search states
-            cursor.execute(
-                "SELECT DISTINCT state_name AS name, 'state' AS type FROM groundwater WHERE state_name LIKE ?", 
-                (search_term,)
-            )
-            state_results = [dict(row) for row in cursor.fetchall()]
+            # Prefix matches walk the (type, name) index and stop at limit
+            for term_type in SEARCH_TYPES:
+                if len(results) >= limit:
+                    break
+                cursor.execute(
+                    """
+                    SELECT id, name, type, parent FROM search_terms
+                    WHERE type = ? AND name LIKE ? ESCAPE '\\'
+                    ORDER BY name
+                    LIMIT ?
+                    """,
+                    (term_type, prefix, limit - len(results))
+                )
+                collect(cursor)
             
-            # Search districts
-            cursor.execute(
-                "SELECT DISTINCT district_name AS name, state_name AS parent, 'district' AS type FROM groundwater WHERE district_name LIKE ?", 
-                (search_term,)
-            )
-            district_results = [dict(row) for row in cursor.fetchall()]
+            if len(query) >= 3 and len(results) < limit:
+                # Substring matches, in index order
+                cursor.execute(
+                    """
+                    SELECT t.id, t.name, t.type, t.parent FROM search_index s
+                    JOIN search_terms t ON t.id = s.rowid
+                    WHERE search_index MATCH ? AND t.name NOT LIKE ? ESCAPE '\\'
+                    LIMIT ?
+                    """,
+                    (_fts_phrase(query), prefix, limit - len(results))
+                )
+                collect(cursor)
             
-            # Combine results
-            results = state_results + district_results
+            if fuzzy and len(query) >= 3 and len(results) < limit:
+                # Typo-tolerant candidates, re-ranked by similarity to the query
+                candidates = {}
+                for expression in _fuzzy_matches(query):
+                    if len(candidates) >= FUZZY_CANDIDATES:
+                        break
+                    cursor.execute(
+                        """
+                        SELECT t.id, t.name, t.type, t.parent FROM search_index s
+                        JOIN search_terms t ON t.id = s.rowid
+                        WHERE search_index MATCH ?
+                        LIMIT ?
+                        """,
+                        (expression, FUZZY_CANDIDATES)
+                    )
+                    for row in cursor:
+                        if row['id'] not in seen:
+                            candidates[row['id']] = row
+                ranked = sorted(candidates.values(), key=lambda row: _similarity(query, row['name']), reverse=True)
+                collect(ranked)
             
-            return results
+            return results[:limit]
         except Error as e:
             print(f"Error searching locations: {e}")
             return []
-        finally:
-            conn.close()
     
-    return []
\ No newline at end of file
+    return []
+
+def _utc_now():
+    return datetime.now(timezone.utc).isoformat()
+
+def _prediction_job(row):
+    """Shape a prediction_jobs row for API responses"""
+    job = dict(row)
+    job['request'] = json.loads(job['request'])
+    return job
+
+def create_prediction_job(job_id, request):
+    """Queue a prediction job; request is its JSON-serializable description"""
+    conn = get_connection()
+    if conn:
+        try:
+            conn.execute(
+                "INSERT INTO prediction_jobs (id, status, request, created_at) VALUES (?, 'queued', ?, ?)",
+                (job_id, json.dumps(request), _utc_now())
+            )
+            conn.commit()
+            return True
+        except Error as e:
+            conn.rollback()
+            print(f"Error creating prediction job {job_id}: {e}")
+            return False
+    
+    return False
+
+def get_prediction_job(job_id):
+    """Get a prediction job's status and progress, or None if it doesn't exist"""
+    conn = get_connection()
+    if conn:
+        try:
+            row = conn.execute("SELECT * FROM prediction_jobs WHERE id = ?", (job_id,)).fetchone()
+            return _prediction_job(row) if row else None
+        except Error as e:
+            print(f"Error retrieving prediction job {job_id}: {e}")
+            return None
+    
+    return None
+
+def claim_prediction_job(worker, lease_seconds):
+    """
+    Mark the oldest runnable prediction job as running by worker and return it.
+    
+    Runnable jobs are queued ones and running ones whose worker hasn't
+    reported progress for lease_seconds, e.g. because its process died.
+    Returns None when there is nothing to run.
+    """
+    conn = get_connection()
+    if conn:
+        try:
+            now = datetime.now(timezone.utc)
+            expired = (now - timedelta(seconds=lease_seconds)).isoformat()
+            # A single UPDATE, so two workers can never claim the same job
+            row = conn.execute(
+                """
+                UPDATE prediction_jobs
+                SET status = 'running', worker = ?, started_at = COALESCE(started_at, ?), heartbeat_at = ?
+                WHERE id = (
+                    SELECT id FROM prediction_jobs
+                    WHERE status = 'queued' OR (status = 'running' AND heartbeat_at < ?)
+                    ORDER BY created_at
+                    LIMIT 1
+                )
+                RETURNING *
+                """,
+                (worker, now.isoformat(), now.isoformat(), expired)
+            ).fetchone()
+            conn.commit()
+            return _prediction_job(row) if row else None
+        except Error as e:
+            conn.rollback()
+            print(f"Error claiming prediction job: {e}")
+            return None
+    
+    return None
+
+def save_prediction_job_results(job_id, worker, start_index, results, total_rows):
+    """
+    Store results for rows start_index onwards and advance the job's progress.
+    
+    Returns False, storing nothing, if the job is no longer held by worker.
+    """
+    conn = get_connection()
+    if conn:
+        try:
+            cursor = conn.execute(
+                """
+                UPDATE prediction_jobs SET completed_rows = ?, total_rows = ?, heartbeat_at = ?
+                WHERE id = ? AND worker = ? AND status = 'running'
+                """,
+                (start_index + len(results), total_rows, _utc_now(), job_id, worker)
+            )
+            if cursor.rowcount == 0:
+                conn.rollback()
+                return False
+            conn.executemany(
+                "INSERT OR REPLACE INTO prediction_job_results (job_id, row_index, result) VALUES (?, ?, ?)",
+                [(job_id, start_index + offset, json.dumps(result)) for offset, result in enumerate(results)]
+            )
+            conn.commit()
+            return True
+        except Error as e:
+            conn.rollback()
+            print(f"Error saving results for prediction job {job_id}: {e}")
+            return False
+    
+    return False
+
+def finish_prediction_job(job_id, worker, error=None):
+    """Mark a job held by worker as succeeded, or failed with error"""
+    conn = get_connection()
+    if conn:
+        try:
+            conn.execute(
+                """
+                UPDATE prediction_jobs SET status = ?, error = ?, finished_at = ?
+                WHERE id = ? AND worker = ? AND status = 'running'
+                """,
+                ('failed' if error else 'succeeded', error, _utc_now(), job_id, worker)
+            )
+            conn.commit()
+            return True
+        except Error as e:
+            conn.rollback()
+            print(f"Error finishing prediction job {job_id}: {e}")
+            return False
+    
+    return False
+
+def get_prediction_job_results(job_id, offset=0, limit=1000):
+    """Get up to limit stored results of a prediction job, starting at row offset"""
+    conn = get_connection()
+    if conn:
+        try:
+            cursor = conn.execute(
+                """
+                SELECT result FROM prediction_job_results
+                WHERE job_id = ? AND row_index >= ?
+                ORDER BY row_index
+                LIMIT ?
+                """,
+                (job_id, offset, limit)
+            )
+            return [json.loads(row['result']) for row in cursor]
+        except Error as e:
+            print(f"Error retrieving results for prediction job {job_id}: {e}")
+            return []
+    
+    return []
+
+# Tables with a spatial index over their stations
+STATION_SOURCES = tuple(migrations.SPATIAL_SOURCES)
+
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE = math.pi * EARTH_RADIUS_KM / 180
+
+# First search radius for nearest-station queries; grown until enough stations are found
+NEAREST_START_KM = 10.0
+
+def _haversine_km(lat1, lng1, lat2, lng2):
+    """Great-circle distance between two points in km"""
+    lat1, lng1, lat2, lng2 = map(math.radians, (lat1, lng1, lat2, lng2))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lng2 - lng1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+def _bbox_around(lat, lng, radius_km):
+    """(min_lng, min_lat, max_lng, max_lat) containing every point within radius_km of lat, lng"""
+    dlat = radius_km / KM_PER_DEGREE
+    max_abs_lat = min(90.0, abs(lat) + dlat)
+    if max_abs_lat >= 89.9 or radius_km >= math.pi * EARTH_RADIUS_KM / 2:
+        dlng = 180.0
+    else:
+        dlng = min(180.0, dlat / math.cos(math.radians(max_abs_lat)))
+    return (max(-180.0, lng - dlng), max(-90.0, lat - dlat), min(180.0, lng + dlng), min(90.0, lat + dlat))
+
+def _stations_in_bbox(cursor, source, bbox, limit=None):
+    """Stations of a source table inside bbox, answered from its covering R*Tree"""
+    min_lng, min_lat, max_lng, max_lat = bbox
+    # The R*Tree stores 32-bit boxes rounded outwards, so match by overlap and
+    # then filter on the exact coordinates
+    sql = f"""
+        SELECT source_id AS id, name, state, district, latitude, longitude
+        FROM {source}_rtree
+        WHERE max_lat >= ? AND min_lat <= ? AND max_lng >= ? AND min_lng <= ?
+        AND latitude BETWEEN ? AND ? AND longitude BETWEEN ? AND ?
+    """
+    params = [min_lat, max_lat, min_lng, max_lng] * 2
+    if limit is not None:
+        sql += " LIMIT ?"
+        params.append(limit)
+    cursor.execute(sql, params)
+    return [dict(row) for row in cursor.fetchall()]
+
+def get_stations_within(bbox, source='districts', limit=MAX_PAGE_SIZE):
+    """
+    Get up to limit stations of a source table inside bbox, using the spatial index.
+    
+    bbox is (min_lng, min_lat, max_lng, max_lat); source is one of
+    STATION_SOURCES.
+    """
+    conn = get_connection()
+    if conn:
+        try:
+            return _stations_in_bbox(conn.cursor(), source, bbox, limit)
+        except Error as e:
+            print(f"Error retrieving {source} stations within {bbox}: {e}")
+            return []
+    
+    return []
+
+def get_nearest_stations(lat, lng, count=10, source='districts', max_km=None):
+    """
+    Get the count stations of a source table nearest to a point, closest first.
+    
+    The R*Tree is searched in a box that grows until it holds count stations
+    and the farthest of them is inside the box's inscribed circle, so no
+    closer station can be outside it. Each station gets its distance_km;
+    stations farther than max_km are left out.
+    """
+    conn = get_connection()
+    if conn:
+        try:
+            cursor = conn.cursor()
+            limit_km = max_km if max_km is not None else math.pi * EARTH_RADIUS_KM
+            radius = min(NEAREST_START_KM, limit_km)
+            while True:
+                stations = _stations_in_bbox(cursor, source, _bbox_around(lat, lng, radius))
+                for station in stations:
+                    station['distance_km'] = round(
+                        _haversine_km(lat, lng, station['latitude'], station['longitude']), 3)
+                stations = [station for station in stations if station['distance_km'] <= min(radius, limit_km)]
+                stations.sort(key=lambda station: (station['distance_km'], station['id']))
+                if len(stations) >= count or radius >= limit_km:
+                    return stations[:count]
+                # Too few within the radius: widen the search
+                radius = min(radius * 4, limit_km)
+        except Error as e:
+            print(f"Error retrieving {source} stations nearest to {lat}, {lng}: {e}")
+            return []
+    
+    return []
+
+def get_region_bbox(name):
+    """Get a region's bounding box as (min_lng, min_lat, max_lng, max_lat), or None"""
+    conn = get_connection()
+    if conn:
+        try:
+            row = conn.execute(
+                "SELECT sw_lng, sw_lat, ne_lng, ne_lat FROM regions WHERE name = ? COLLATE NOCASE", (name,)
+            ).fetchone()
+            if row and None not in tuple(row):
+                return tuple(row)
+            return None
+        except Error as e:
+            print(f"Error retrieving region {name}: {e}")
+            return None
+    
+    return None
+
+# Heatmap layers besides the ocean data types: layer -> groundwater column
+GROUNDWATER_LAYERS = {'groundwater': 'level'}
+
+def get_heatmap_layers():
+    """Get the names of the layers the heatmap can aggregate"""
+    conn = get_connection()
+    if conn:
+        try:
+            cursor = conn.cursor()
+            cursor.execute("SELECT DISTINCT data_type FROM ocean_data ORDER BY data_type")
+            return [row['data_type'] for row in cursor.fetchall()] + list(GROUNDWATER_LAYERS)
+        except Error as e:
+            print(f"Error retrieving heatmap layers: {e}")
+            return []
+    
+    return []
+
+def _heatmap_source(layer):
+    """Table, value column and row filter holding a layer's points"""
+    if layer in GROUNDWATER_LAYERS:
+        column = GROUNDWATER_LAYERS[layer]
+        return 'groundwater', column, f"{column} IS NOT NULL", []
+    return ('ocean_data_points', 'value',
+            "ocean_data_id IN (SELECT id FROM ocean_data WHERE data_type = ?)", [layer])
+
+def get_heatmap_points(layer, bounds):
+    """
+    Get a layer's (lat, lng, value) points inside bounds.
+    
+    bounds is (min_lng, min_lat, max_lng, max_lat) and includes its west and
+    south edges only, so points on a shared tile edge are counted once.
+    """
+    conn = get_connection()
+    if conn:
+        try:
+            table, column, where, params = _heatmap_source(layer)
+            min_lng, min_lat, max_lng, max_lat = bounds
+            cursor = conn.cursor()
+            # Plain tuples; NumPy reads them much faster than Row objects
+            cursor.row_factory = None
+            cursor.execute(f"""
+                SELECT latitude, longitude, {column} FROM {table}
+                WHERE {where}
+                AND latitude >= ? AND latitude < ? AND longitude >= ? AND longitude < ?
+            """, params + [min_lat, max_lat, min_lng, max_lng])
+            return cursor.fetchall()
+        except Error as e:
+            print(f"Error retrieving {layer} heatmap points: {e}")
+            return []
+    
+    return []
+
+# Properties of each map tile layer's stations, the rows the layer shows, and
+# the properties averaged over clustered stations
+TILE_LAYERS = {
+    'stations': {
+        'columns': ('id', 'station_name', 'state_name', 'district_name', 'station_type', 'station_status'),
+        'where': None,
+        'means': (),
+    },
+    'groundwater': {
+        'columns': ('id', 'city_name', 'state_name', 'district_name', 'level', 'quality'),
+        'where': 'level IS NOT NULL',
+        'means': ('level',),
+    },
+}
+
+# Ids per IN (...) lookup, well below SQLite's bound parameter limit
+TILE_LOOKUP_BATCH = 500
+
+def _tile_query(layer, columns):
+    """SELECT of columns from a tile layer's located rows; the caller appends further AND conditions"""
+    spec = TILE_LAYERS[layer]
+    sql = (f"SELECT {', '.join(columns)} FROM {migrations.TILE_SOURCES[layer]} "
+           "WHERE latitude IS NOT NULL AND longitude IS NOT NULL")
+    if spec['where']:
+        sql += f" AND {spec['where']}"
+    return sql
+
+def get_tile_points(layer, bbox=None):
+    """
+    Get a tile layer's points as (id, latitude, longitude, *means) tuples.
+    
+    bbox limits them to (min_lng, min_lat, max_lng, max_lat), edges included.
+    """
+    conn = get_connection()
+    if conn:
+        try:
+            sql = _tile_query(layer, ('id', 'latitude', 'longitude') + TILE_LAYERS[layer]['means'])
+            params = ()
+            if bbox:
+                min_lng, min_lat, max_lng, max_lat = bbox
+                sql += " AND latitude BETWEEN ? AND ? AND longitude BETWEEN ? AND ?"
+                params = (min_lat, max_lat, min_lng, max_lng)
+            cursor = conn.cursor()
+            # Plain tuples; NumPy reads them much faster than Row objects
+            cursor.row_factory = None
+            cursor.execute(sql, params)
+            return cursor.fetchall()
+        except Error as e:
+            print(f"Error retrieving {layer} tile points: {e}")
+            return []
+    
+    return []
+
+def get_tile_stations(layer, ids=None):
+    """Get the properties of a tile layer's stations by id, or of every station; returns {id: properties}"""
+    conn = get_connection()
+    if conn:
+        try:
+            sql = _tile_query(layer, TILE_LAYERS[layer]['columns'])
+            cursor = conn.cursor()
+            if ids is None:
+                cursor.execute(sql)
+                return {row['id']: dict(row) for row in cursor}
+            
+            ids = list(ids)
+            stations = {}
+            for start in range(0, len(ids), TILE_LOOKUP_BATCH):
+                batch = ids[start:start + TILE_LOOKUP_BATCH]
+                cursor.execute(f"{sql} AND id IN ({', '.join('?' * len(batch))})", batch)
+                stations.update((row['id'], dict(row)) for row in cursor)
+            return stations
+        except Error as e:
+            print(f"Error retrieving {layer} tile stations: {e}")
+            return {}
+    
+    return {}
+
+def get_tile_changes(layer):
+    """Get the recorded (id, latitude, longitude) positions of a tile layer's changed rows, oldest first"""
+    conn = get_connection()
+    if conn:
+        try:
+            cursor = conn.cursor()
+            cursor.execute(
+                "SELECT id, latitude, longitude FROM tile_changes WHERE layer = ? ORDER BY id", (layer,)
+            )
+            return [tuple(row) for row in cursor.fetchall()]
+        except Error as e:
+            print(f"Error retrieving {layer} tile changes: {e}")
+            return []
+    
+    return []
+
+def get_last_tile_change(layer):
+    """Get the id of a tile layer's latest recorded change, or 0 if there is none"""
+    conn = get_connection()
+    if conn:
+        try:
+            row = conn.execute("SELECT MAX(id) FROM tile_changes WHERE layer = ?", (layer,)).fetchone()
+            return row[0] or 0
+        except Error as e:
+            print(f"Error retrieving {layer} tile changes: {e}")
+            return 0
+    
+    return 0
+
+def delete_tile_changes(layer, up_to_id):
+    """Forget a tile layer's recorded changes up to and including up_to_id"""
+    conn = get_connection()
+    if conn:
+        try:
+            conn.execute("DELETE FROM tile_changes WHERE layer = ? AND id <= ?", (layer, up_to_id))
+            conn.commit()
+            return True
+        except Error as e:
+            conn.rollback()
+            print(f"Error deleting {layer} tile changes: {e}")
+            return False
+    
+    return False
+
+def get_last_tile_reset(layer):
+    """Get the id of a tile layer's latest recorded reset, or 0 if there is none"""
+    conn = get_connection()
+    if conn:
+        try:
+            row = conn.execute("SELECT MAX(id) FROM tile_resets WHERE layer = ?", (layer,)).fetchone()
+            return row[0] or 0
+        except Error as e:
+            print(f"Error retrieving {layer} tile resets: {e}")
+            return 0
+    
+    return 0
+
+def delete_tile_resets(layer, up_to_id):
+    """Forget a tile layer's recorded resets up to and including up_to_id"""
+    conn = get_connection()
+    if conn:
+        try:
+            conn.execute("DELETE FROM tile_resets WHERE layer = ? AND id <= ?", (layer, up_to_id))
+            conn.commit()
+            return True
+        except Error as e:
+            conn.rollback()
+            print(f"Error deleting {layer} tile resets: {e}")
+            return False
+    
+    return False
+
+# Stored forecast columns, in the order save_predictions() takes them
+PREDICTION_COLUMNS = (
+    'station_code', 'model_version', 'target_year', 'state_name', 'station_name', 'from_year',
+    'temperature_min', 'temperature_max', 'ph_min', 'ph_max', 'conductivity_min', 'conductivity_max',
+    'recharge_volume', 'recharge_percentage', 'source_version', 'created_at'
+)
+
+def save_predictions(rows):
+    """Store forecast rows with PREDICTION_COLUMNS values, replacing earlier runs of the same model"""
+    conn = get_connection()
+    if conn:
+        try:
+            conn.executemany(
+                f"INSERT OR REPLACE INTO predictions ({', '.join(PREDICTION_COLUMNS)}) "
+                f"VALUES ({', '.join('?' * len(PREDICTION_COLUMNS))})",
+                rows
+            )
+            conn.commit()
+            return True
+        except Error as e:
+            conn.rollback()
+            print(f"Error saving predictions: {e}")
+            return False
+    
+    return False
+
+def save_prediction_summaries(station_code, model_version, source_version, from_year, details, summaries):
+    """Store a station's live forecast, one summary per year after from_year, like save_predictions()"""
+    created_at = _utc_now()
+    return save_predictions([
+        (station_code, model_version, from_year + step, details['state_name'], details['station_name'], from_year,
+         summary['temperature']['min'], summary['temperature']['max'],
+         summary['pH']['min'], summary['pH']['max'],
+         summary['conductivity']['min'], summary['conductivity']['max'],
+         summary['recharge']['volume'], summary['recharge']['percentage'],
+         source_version, created_at)
+        for step, summary in enumerate(summaries, 1)
+    ])
+
+def _prediction_summary(row):
+    """Shape a predictions row like a live prediction's summary"""
+    return {
+        'temperature': {'min': row['temperature_min'], 'max': row['temperature_max']},
+        'pH': {'min': row['ph_min'], 'max': row['ph_max']},
+        'conductivity': {'min': row['conductivity_min'], 'max': row['conductivity_max']},
+        'recharge': {'volume': row['recharge_volume'], 'percentage': row['recharge_percentage']}
+    }
+
+def get_stored_prediction(station_code, model_version, target_year):
+    """Get a station's stored forecast by one primary key lookup, or None if there is none"""
+    conn = get_connection()
+    if conn:
+        try:
+            row = conn.execute(
+                "SELECT * FROM predictions WHERE station_code = ? AND model_version = ? AND target_year = ?",
+                (station_code, model_version, target_year)
+            ).fetchone()
+            if row is None:
+                return None
+            prediction = dict(row)
+            prediction['predictions'] = _prediction_summary(row)
+            return prediction
+        except Error as e:
+            print(f"Error retrieving prediction for {station_code}: {e}")
+            return None
+    
+    return None
+
+def delete_stale_predictions(model_version):
+    """Delete the stored forecasts of every other model version; returns how many were deleted"""
+    conn = get_connection()
+    if conn:
+        try:
+            deleted = conn.execute("DELETE FROM predictions WHERE model_version <> ?", (model_version,)).rowcount
+            conn.commit()
+            return deleted
+        except Error as e:
+            conn.rollback()
+            print(f"Error deleting stale predictions: {e}")
+            return None
+    
+    return None
+
+def get_write_generation():
+    """Get the count of writes to the served tables, or None if it can't be read"""
+    conn = get_connection()
+    if conn:
+        try:
+            row = conn.execute("SELECT generation FROM write_generation WHERE id = 1").fetchone()
+            return row[0] if row else None
+        except Error as e:
+            print(f"Error retrieving write generation: {e}")
+            return None
+    
+    return None
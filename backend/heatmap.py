@@ -0,0 +1,100 @@
+"""
+Grid aggregation of map layers for the heatmap endpoint.
+
+The world is cut into square tiles of 360 / 2**zoom degrees, the span of one
+256px map tile at that zoom, and every tile into CELLS_PER_TILE x
+CELLS_PER_TILE cells. A viewport is answered tile by tile, so the API can
+cache each tile's cells and reuse them for every viewport that overlaps it.
+
+NumPy is imported inside the functions that need it, so the API can start
+without loading it.
+"""
+import math
+import os
+
+# Cells along each side of a tile; 32 gives cells of about 8px on screen
+CELLS_PER_TILE = int(os.environ.get('AQUAGUARD_HEATMAP_CELLS', '32'))
+MAX_ZOOM = 18
+
+# Decimal places kept in the response
+COORDINATE_DIGITS = 6
+VALUE_DIGITS = 4
+
+
+def tile_size(zoom):
+    """Tile side in degrees at a zoom level"""
+    return 360.0 / 2 ** zoom
+
+
+def tiles_for_bbox(bbox, zoom):
+    """List the (x, y) tiles overlapping a (min_lng, min_lat, max_lng, max_lat) box"""
+    min_lng, min_lat, max_lng, max_lat = bbox
+    size = tile_size(zoom)
+    # Tiles are counted from (-180, -90); a box ending on a tile edge doesn't overlap the next tile
+    return [(x, y)
+            for y in _tile_range(min_lat + 90, max_lat + 90, size, math.ceil(180 / size))
+            for x in _tile_range(min_lng + 180, max_lng + 180, size, 2 ** zoom)]
+
+
+def _tile_range(start, end, size, count):
+    first = min(math.floor(start / size), count - 1)
+    return range(first, min(max(math.ceil(end / size), first + 1), count))
+
+
+def tile_bounds(zoom, x, y):
+    """A tile's (min_lng, min_lat, max_lng, max_lat); tiles include their west and south edges only"""
+    size = tile_size(zoom)
+    return (x * size - 180, y * size - 90, (x + 1) * size - 180, (y + 1) * size - 90)
+
+
+def aggregate_tile(points, bounds, cells=CELLS_PER_TILE):
+    """
+    Bin (lat, lng, value) points into a tile's grid cells.
+
+    Returns one dict per non-empty cell with its center and the count, mean,
+    min and max of its values, ordered south to north, then west to east.
+    """
+    if not len(points):
+        return []
+
+    import numpy as np
+
+    points = np.asarray(points, dtype=np.float64)
+    lat, lng, values = points[:, 0], points[:, 1], points[:, 2]
+    min_lng, min_lat, max_lng, max_lat = bounds
+    cell_lng = (max_lng - min_lng) / cells
+    cell_lat = (max_lat - min_lat) / cells
+
+    # Clipped so rounding can't push a point on the tile's edge out of the grid
+    col = np.clip(((lng - min_lng) / cell_lng).astype(np.int64), 0, cells - 1)
+    row = np.clip(((lat - min_lat) / cell_lat).astype(np.int64), 0, cells - 1)
+    cell = row * cells + col
+
+    # Sort by cell once, then reduce each run of equal cells
+    order = np.argsort(cell, kind='stable')
+    cell = cell[order]
+    values = values[order]
+    starts = np.flatnonzero(np.concatenate(([True], cell[1:] != cell[:-1])))
+    counts = np.diff(np.append(starts, len(cell)))
+    means = np.add.reduceat(values, starts) / counts
+    minimums = np.minimum.reduceat(values, starts)
+    maximums = np.maximum.reduceat(values, starts)
+
+    occupied = cell[starts]
+    center_lat = min_lat + (occupied // cells + 0.5) * cell_lat
+    center_lng = min_lng + (occupied % cells + 0.5) * cell_lng
+
+    return [
+        {
+            'lat': round(lat, COORDINATE_DIGITS),
+            'lng': round(lng, COORDINATE_DIGITS),
+            'count': count,
+            'mean': round(mean, VALUE_DIGITS),
+            'min': round(minimum, VALUE_DIGITS),
+            'max': round(maximum, VALUE_DIGITS),
+        }
+        for lat, lng, count, mean, minimum, maximum in zip(
+            center_lat.tolist(), center_lng.tolist(), counts.tolist(),
+            means.tolist(), minimums.tolist(), maximums.tolist()
+        )
+    ]
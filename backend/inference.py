@@ -0,0 +1,201 @@
+"""
+Model input/output schema and vectorized prediction helpers.
+
+NumPy and pandas are imported inside the functions that need them, so
+importing this module stays cheap for API workers that never predict.
+"""
+import hashlib
+import json
+import math
+import os
+
+from recharge import RECHARGE_PARAMS, recharge_param
+
+# Station observations forecasts start from, and the year they were measured
+DATA_PATH = os.environ.get(
+    'AQUAGUARD_GROUNDWATER_CSV',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'Ground Water 2021.csv')
+)
+DATA_YEAR = 2021
+
+# Feature columns the model was trained on (previous year's measurements)
+FEATURE_COLUMNS = [
+    'Station Name_prev', 'STATE_prev',
+    'Temperature Min_prev', 'Temperature Max_prev',
+    'pH Min_prev', 'pH Max_prev',
+    'Conductivity (µmhos/cm) Min_prev', 'Conductivity (µmhos/cm) Max_prev'
+]
+
+# Columns predicted by the model, in output order
+TARGET_COLUMNS = [
+    'Temperature Min', 'Temperature Max',
+    'pH Min', 'pH Max',
+    'Conductivity (µmhos/cm) Min', 'Conductivity (µmhos/cm) Max'
+]
+
+# Representative feature vectors for stations that can be predicted by name
+STATION_SAMPLES = {
+    # Typical West Bengal groundwater parameters
+    'KALYANI': [
+        1,  # Station Name encoded (doesn't affect prediction significantly)
+        1,  # STATE encoded (West Bengal)
+        25.0,  # Temperature Min (typical for West Bengal)
+        32.0,  # Temperature Max
+        6.8,   # pH Min (typical groundwater range)
+        7.5,   # pH Max
+        500,   # Conductivity Min (µmhos/cm, typical for the region)
+        800    # Conductivity Max
+    ],
+}
+
+
+def find_station_name(city):
+    """Return the STATION_SAMPLES name matching a city or station name, or None"""
+    name = city.upper()
+    for station in STATION_SAMPLES:
+        if station in name:
+            return station
+    return None
+
+
+def find_station_sample(city):
+    """Return the representative feature vector for a city or station name, or None"""
+    station = find_station_name(city)
+    return STATION_SAMPLES[station] if station else None
+
+
+def observations_version(path=DATA_PATH):
+    """Version of the observations file from its size and modification time, or None if it is missing"""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return f"{stat.st_mtime_ns:x}-{stat.st_size:x}"
+
+
+def prediction_source(city):
+    """
+    The key a city's or station's forecasts are stored under, and the version
+    of the inputs they are forecast from.
+
+    Sample cities are keyed by their STATION_SAMPLES name, anything else is
+    taken as the code of an observed station. Returns (station, version);
+    version is None when there are no observations to forecast from.
+    """
+    station = find_station_name(city)
+    if station:
+        sample = json.dumps(STATION_SAMPLES[station]).encode()
+        return station, 'sample-' + hashlib.sha256(sample).hexdigest()[:12]
+    return city, observations_version()
+
+
+def feature_vector(features):
+    """
+    Convert a feature list or a {column: value} mapping into a list of floats.
+
+    Raises ValueError when features are missing or not numeric.
+    """
+    if isinstance(features, dict):
+        missing = [column for column in FEATURE_COLUMNS if column not in features]
+        if missing:
+            raise ValueError(f"missing features: {', '.join(missing)}")
+        features = [features[column] for column in FEATURE_COLUMNS]
+    elif not isinstance(features, (list, tuple)) or len(features) != len(FEATURE_COLUMNS):
+        raise ValueError(f"features must be a list of {len(FEATURE_COLUMNS)} numbers or a mapping of feature names")
+
+    try:
+        vector = [float(value) for value in features]
+    except (TypeError, ValueError):
+        raise ValueError("features must be numeric")
+    if not all(math.isfinite(value) for value in vector):
+        raise ValueError("features must be finite")
+    return vector
+
+
+def resolve_stations(stations):
+    """
+    Resolve API station items to feature vectors and recharge parameters.
+
+    Each item is {"id": ..., "features": [...] or {feature: value}} or
+    {"id": ..., "station": "<name or code>"}, optionally with recharge
+    parameters. A station is a STATION_SAMPLES city or the code of an
+    observed station; looking up codes loads pandas and the observations.
+    Returns (results, rows, recharge_params): one result per item holding its
+    id and either an error or the index of its row, the feature rows of the
+    valid items, and their recharge parameters as lists.
+    """
+    results = []
+    rows = []
+    recharge_params = {name: [] for name in RECHARGE_PARAMS}
+    for index, item in enumerate(stations):
+        result = {'id': item.get('id', index) if isinstance(item, dict) else index}
+        results.append(result)
+        try:
+            if not isinstance(item, dict):
+                raise ValueError('each station must be an object')
+            if 'features' in item:
+                vector = feature_vector(item['features'])
+            elif 'station' in item:
+                vector = find_station_sample(str(item['station']))
+                if vector is None:
+                    from predict import station_features
+
+                    found = station_features(str(item['station']))
+                    if found is None:
+                        raise ValueError(f"no prediction sample or observations for station {item['station']}")
+                    vector = found[0]
+                result['station'] = item['station']
+            else:
+                raise ValueError('each station needs features or a station name')
+            params = {name: recharge_param(item, name) for name in RECHARGE_PARAMS}
+        except ValueError as e:
+            result['error'] = str(e)
+            continue
+
+        rows.append(vector)
+        for name, value in params.items():
+            recharge_params[name].append(value)
+        result['row'] = len(rows) - 1
+    return results, rows, recharge_params
+
+
+def predict_features(model, X, chunk_size=None):
+    """
+    Predict every row of the feature matrix X with vectorized model.predict calls.
+
+    Rows are predicted chunk_size at a time (all at once by default) and the
+    results returned as a DataFrame with TARGET_COLUMNS.
+    """
+    import numpy as np
+    import pandas as pd
+
+    X = np.asarray(X, dtype=np.float64).reshape(-1, len(FEATURE_COLUMNS))
+    if not len(X):
+        return pd.DataFrame(np.empty((0, len(TARGET_COLUMNS))), columns=TARGET_COLUMNS)
+
+    chunk_size = chunk_size or len(X)
+    chunks = []
+    for start in range(0, len(X), chunk_size):
+        # Keep feature names so the model sees the same schema it was fitted on
+        chunk = pd.DataFrame(X[start:start + chunk_size], columns=FEATURE_COLUMNS)
+        chunks.append(np.asarray(model.predict(chunk)).reshape(len(chunk), -1))
+    return pd.DataFrame(np.vstack(chunks), columns=TARGET_COLUMNS)
+
+
+def forecast_features(model, X, years, chunk_size=None):
+    """
+    Predict years steps ahead by feeding each year's predictions back in as
+    the next year's measurements.
+
+    Returns one DataFrame of TARGET_COLUMNS per year.
+    """
+    import numpy as np
+
+    X = np.asarray(X, dtype=np.float64).reshape(-1, len(FEATURE_COLUMNS))
+    forecasts = []
+    for _ in range(years):
+        pred_df = predict_features(model, X, chunk_size)
+        forecasts.append(pred_df)
+        # Station and state encodings stay; the measurements become this year's predictions
+        X = np.hstack([X[:, :len(FEATURE_COLUMNS) - len(TARGET_COLUMNS)], pred_df.to_numpy()])
+    return forecasts
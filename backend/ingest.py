@@ -0,0 +1,243 @@
+"""
+Bulk loading of station CSV files into the AquaGuard database.
+
+CSV headers name the table's columns, ignoring case and spacing ("State Name"
+loads state_name); other columns are skipped, and --column maps headers that
+don't match. Rows are upserted on the table's natural key, so loading a file
+again only writes the rows whose values changed.
+
+Each file is loaded in one transaction, read and inserted in chunks, so a
+failed load rolls back to the previous state. When a file holds over twice
+the rows of the table, the table's secondary indexes and its search and
+R*Tree, tile change and write generation triggers are dropped for the load.
+The indexes are then rebuilt in bulk, the write generation is bumped once so
+cached API responses go stale, and a tile reset makes the tile sync drop the
+layer's stored tiles. Smaller loads and reloads of mostly unchanged rows are
+faster with everything kept, the triggers recording each changed row.
+
+Usage:
+    python ingest.py groundwater "groundwater 2023.csv"
+    python ingest.py districts stations.csv --column "Station Code=id"
+    python ingest.py sightings part-*.csv --chunk-size 100000
+"""
+import argparse
+import csv
+import itertools
+import os
+import sys
+import time
+from sqlite3 import Error
+
+import database
+import migrations
+
+TABLES = tuple(migrations.NATURAL_KEYS)
+
+# Rows handed to each executemany call
+CHUNK_SIZE = int(os.environ.get('AQUAGUARD_INGEST_CHUNK_SIZE', '50000'))
+# Page cache for the load and the index builds after it; negative values are KiB
+CACHE_SIZE = int(os.environ.get('AQUAGUARD_INGEST_CACHE_SIZE', '-262144'))
+
+
+def _column_name(header):
+    return '_'.join(header.strip().lower().split())
+
+
+def _table_columns(cursor, table):
+    """The table's loadable columns and the ones every row needs a value for"""
+    cursor.execute(f"PRAGMA table_info({table})")
+    columns, required = [], set(migrations.NATURAL_KEYS[table])
+    for _, name, column_type, notnull, _, pk in cursor.fetchall():
+        if pk and column_type.upper() == 'INTEGER':
+            continue  # rowid alias, assigned by SQLite
+        columns.append(name)
+        if notnull or pk:
+            required.add(name)
+    return columns, required & set(columns)
+
+
+def _upsert_sql(table, columns):
+    """INSERT that updates the row with the same natural key, only if a value differs"""
+    key = migrations.NATURAL_KEYS[table]
+    updated = [column for column in columns if column not in key]
+    sql = (f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))}) "
+           f"ON CONFLICT ({', '.join(key)}) DO ")
+    if not updated:
+        return sql + "NOTHING"
+    new = ', '.join(f"excluded.{column}" for column in updated)
+    old = ', '.join(f"{table}.{column}" for column in updated)
+    return sql + f"UPDATE SET ({', '.join(updated)}) = ({new}) WHERE ({old}) IS NOT ({new})"
+
+
+def _defer_indexes(cursor, table):
+    """Drop the table's secondary indexes and per-row triggers; returns the SQL recreating them"""
+    cursor.execute(f"PRAGMA index_list({table})")
+    # Unique indexes stay: the upsert needs them to find existing rows
+    indexes = [row[1] for row in cursor.fetchall() if not row[2]]
+    triggers = [f"{table}_{kind}_{event}"
+                for kind in ('search', 'spatial', 'tiles', 'generation') for event in ('ai', 'ad', 'au')]
+
+    deferred = []
+    for object_type, names in (('index', indexes), ('trigger', triggers)):
+        for name in names:
+            cursor.execute("SELECT sql FROM sqlite_master WHERE type = ? AND name = ?", (object_type, name))
+            row = cursor.fetchone()
+            if row and row[0]:
+                deferred.append(row[0])
+                cursor.execute(f"DROP {object_type.upper()} {name}")
+    return deferred
+
+
+def _rebuild_indexes(cursor, table, deferred):
+    """Rebuild what the deferred triggers maintain, then recreate the indexes and triggers"""
+    # Recreated rather than emptied: R*Tree deletes cost as much as inserts
+    cursor.execute("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = ?", (f"{table}_rtree",))
+    rtree_sql = cursor.fetchone()[0]
+    cursor.execute(f"DROP TABLE {table}_rtree")
+    cursor.execute(rtree_sql)
+    cursor.execute("DELETE FROM station_locations WHERE source = ?", (table,))
+    migrations.backfill_spatial_index(cursor, table)
+    # Terms are counted across all source tables
+    cursor.execute("DELETE FROM search_terms")
+    migrations.backfill_search_terms(cursor)
+    # One generation bump and one tile reset for the whole load
+    cursor.execute("UPDATE write_generation SET generation = generation + 1 WHERE id = 1")
+    for layer, source in migrations.TILE_SOURCES.items():
+        if source == table:
+            cursor.execute("INSERT INTO tile_resets (layer) VALUES (?)", (layer,))
+    for sql in deferred:
+        cursor.execute(sql)
+
+
+def _estimate_rows(path):
+    """Rows in a CSV file, estimated from the line length of its start"""
+    with open(path, 'rb') as f:
+        sample = f.read(1 << 16)
+    return os.path.getsize(path) * sample.count(b'\n') // max(len(sample), 1)
+
+
+def load_csv(path, table, column_map=None, chunk_size=CHUNK_SIZE, defer_indexes=None, progress=True):
+    """
+    Upsert the rows of a CSV file into a table.
+
+    column_map maps CSV headers to table columns. defer_indexes rebuilds the
+    indexes after the load instead of maintaining them per row; by default
+    only for files with over twice the rows of the table. Rows missing a key or
+    NOT NULL value are skipped. Prints the throughput after every chunk when
+    progress is set. Returns the counts of rows read, written and skipped and
+    the load and index rebuild times in seconds. Raises ValueError for a file
+    whose headers don't cover the required columns.
+    """
+    column_map = column_map or {}
+    conn = database.create_connection()
+    conn.isolation_level = None  # One explicit transaction for the whole file
+    try:
+        cursor = conn.cursor()
+        cursor.execute(f"PRAGMA cache_size = {CACHE_SIZE}")
+        table_columns, required = _table_columns(cursor, table)
+
+        with open(path, newline='', encoding='utf-8-sig') as f:
+            reader = csv.reader(f)
+            header = next(reader, [])
+            positions = {}
+            for index, name in enumerate(header):
+                column = column_map.get(name.strip(), _column_name(name))
+                if column in table_columns and column not in positions:
+                    positions[column] = index
+            missing = required - set(positions)
+            if missing:
+                raise ValueError(f"{path} has no column for {', '.join(sorted(missing))}")
+
+            columns = list(positions)
+            indexes = [positions[column] for column in columns]
+            checked = [i for i, column in enumerate(columns) if column in required]
+            width = max(indexes) + 1
+            counts = {'read': 0, 'written': 0, 'skipped': 0}
+
+            def rows():
+                for row in reader:
+                    counts['read'] += 1
+                    if len(row) < width:
+                        counts['skipped'] += 1
+                        continue
+                    values = [row[i] or None for i in indexes]
+                    if any(values[i] is None for i in checked):
+                        counts['skipped'] += 1
+                        continue
+                    yield values
+
+            sql = _upsert_sql(table, columns)
+            cursor.execute("BEGIN IMMEDIATE")
+            try:
+                if defer_indexes is None:
+                    cursor.execute(f"SELECT COUNT(*) FROM {table}")
+                    defer_indexes = _estimate_rows(path) > 2 * cursor.fetchone()[0]
+                start = time.perf_counter()
+                deferred = _defer_indexes(cursor, table) if defer_indexes else []
+                chunks = rows()
+                while True:
+                    read = counts['read']
+                    cursor.executemany(sql, itertools.islice(chunks, chunk_size))
+                    counts['written'] += max(cursor.rowcount, 0)
+                    if counts['read'] == read:
+                        break
+                    if progress:
+                        elapsed = time.perf_counter() - start
+                        print(f"{table}: {counts['read']:,} rows read ({counts['read'] / elapsed:,.0f} rows/s)")
+                load_seconds = time.perf_counter() - start
+
+                start = time.perf_counter()
+                if deferred:
+                    _rebuild_indexes(cursor, table, deferred)
+                cursor.execute("COMMIT")
+                rebuild_seconds = time.perf_counter() - start
+            except BaseException:
+                cursor.execute("ROLLBACK")
+                raise
+
+        # Hand the load's pages back to the database file rather than leaving a huge WAL
+        cursor.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        return dict(counts, load_seconds=load_seconds, rebuild_seconds=rebuild_seconds,
+                    indexes_deferred=bool(deferred))
+    finally:
+        conn.close()
+
+
+def _column_mapping(value):
+    header, sep, column = value.rpartition('=')
+    if not sep or not header or not column:
+        raise argparse.ArgumentTypeError(f"expected HEADER=COLUMN, got {value!r}")
+    return header.strip(), column.strip()
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description='Bulk load station CSV files into the database')
+    parser.add_argument('table', choices=TABLES)
+    parser.add_argument('files', nargs='+', help='CSV files with a header row')
+    parser.add_argument('--column', type=_column_mapping, action='append', default=[],
+                        metavar='HEADER=COLUMN', help='load a CSV column into a differently named table column')
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE, help='rows per executemany call')
+    indexes = parser.add_mutually_exclusive_group()
+    indexes.add_argument('--defer-indexes', action='store_true', default=None,
+                         help='rebuild the indexes after the load (default: for files over twice the table)')
+    indexes.add_argument('--keep-indexes', action='store_false', dest='defer_indexes',
+                         help='maintain the indexes row by row during the load')
+    args = parser.parse_args(argv)
+
+    database.migrate_database()
+    for path in args.files:
+        try:
+            result = load_csv(path, args.table, dict(args.column), args.chunk_size, args.defer_indexes)
+        except (Error, OSError, ValueError) as e:
+            print(f"Error loading {path}: {e}")
+            return 1
+        seconds = result['load_seconds'] + result['rebuild_seconds']
+        print(f"Loaded {path} into {args.table}: {result['read']:,} rows read, "
+              f"{result['written']:,} written, {result['skipped']:,} skipped in {seconds:.1f} s "
+              f"({result['read'] / max(seconds, 1e-9):,.0f} rows/s"
+              + (f"; indexes rebuilt in {result['rebuild_seconds']:.1f} s)" if result['indexes_deferred'] else ")"))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,206 @@
+"""
+Process pool for CPU-heavy prediction and plot rendering work.
+
+Jobs run in a ProcessPoolExecutor so model inference and matplotlib renders
+don't hold the GIL in the request threads. Concurrent submissions with the
+same key share one future, the number of pending jobs is bounded (callers get
+JobQueueFull with a Retry-After estimate), and callers stop waiting after a
+per-job timeout.
+
+With AQUAGUARD_JOB_WORKERS=0 jobs run inline in the calling thread, still
+deduplicated and counted, which is handy for debugging and single-process
+deployments.
+"""
+import math
+import multiprocessing
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor, TimeoutError
+from concurrent.futures.process import BrokenProcessPool
+
+# Pool settings, overridable from the environment
+WORKERS = int(os.environ.get('AQUAGUARD_JOB_WORKERS', '2'))
+MAX_PENDING = int(os.environ.get('AQUAGUARD_JOB_QUEUE_SIZE', '32'))
+TIMEOUT = float(os.environ.get('AQUAGUARD_JOB_TIMEOUT', '60'))
+START_METHOD = os.environ.get('AQUAGUARD_JOB_START_METHOD', 'spawn')
+
+# Recent wait/run times kept for the percentiles in stats()
+TIMING_SAMPLES = 1000
+
+
+class JobQueueFull(Exception):
+    """Raised when too many jobs are pending; retry_after is a hint in seconds"""
+
+    def __init__(self, retry_after):
+        super().__init__(f"job queue is full, retry in {retry_after}s")
+        self.retry_after = retry_after
+
+
+class JobTimeout(Exception):
+    """Raised when a job didn't finish within its timeout"""
+
+
+def _init_worker(model_path):
+    # Spawned workers don't inherit module state, so point them at the parent's model
+    import model_registry
+    model_registry.MODEL_PATH = model_path
+    if os.environ.get('AQUAGUARD_MODEL_WARMUP', '0') == '1':
+        model_registry.warm_up()
+
+
+def _execute(fn, args):
+    """Run fn in a worker, returning wall-clock start/finish times with its result"""
+    started = time.time()
+    result = fn(*args)
+    return started, time.time(), result
+
+
+def _summary_ms(samples):
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    return {
+        'avg': round(sum(ordered) / len(ordered) * 1000, 2),
+        'p50': round(ordered[len(ordered) // 2] * 1000, 2),
+        'p95': round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] * 1000, 2),
+        'max': round(ordered[-1] * 1000, 2),
+    }
+
+
+class JobPool:
+    """Deduplicating, bounded front end to a lazily started process pool"""
+
+    def __init__(self, workers=WORKERS, max_pending=MAX_PENDING, timeout=TIMEOUT, start_method=START_METHOD):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.timeout = timeout
+        self.start_method = start_method
+        self._executor = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self._inflight = {}
+        self._pending = 0
+        self._waits = deque(maxlen=TIMING_SAMPLES)
+        self._runs = deque(maxlen=TIMING_SAMPLES)
+        self._stats = {
+            'submitted': 0, 'deduplicated': 0, 'rejected': 0,
+            'completed': 0, 'failed': 0, 'timeouts': 0, 'pool_restarts': 0,
+        }
+
+    def _get_executor(self):
+        # Caller holds the lock. Started on first use, and again after a fork or a crashed worker
+        if self._executor is None or self._pid != os.getpid():
+            import model_registry
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context(self.start_method),
+                initializer=_init_worker,
+                initargs=(model_registry.MODEL_PATH,)
+            )
+            self._pid = os.getpid()
+        return self._executor
+
+    def _retry_after(self):
+        # Caller holds the lock. Time for the workers to drain the current backlog
+        average_run = sum(self._runs) / len(self._runs) if self._runs else 1.0
+        return max(1, math.ceil(self._pending * average_run / max(self.workers, 1)))
+
+    def _finished(self, key, submitted_at, future):
+        with self._lock:
+            self._pending -= 1
+            if key is not None and self._inflight.get(key) is future:
+                del self._inflight[key]
+            if future.cancelled():
+                return
+            if future.exception() is not None:
+                self._stats['failed'] += 1
+                return
+            started, finished, _ = future.result()
+            self._stats['completed'] += 1
+            self._waits.append(max(0.0, started - submitted_at))
+            self._runs.append(finished - started)
+
+    def submit(self, key, fn, *args):
+        """
+        Schedule fn(*args) and return a future for (started, finished, result).
+
+        fn must be a module-level function so it can be pickled. A job with
+        the same key as a pending one shares its future instead of running
+        again; pass key=None to always run. Raises JobQueueFull when
+        max_pending jobs are already pending.
+        """
+        with self._lock:
+            future = self._inflight.get(key) if key is not None else None
+            if future is not None:
+                self._stats['deduplicated'] += 1
+                return future
+            if self._pending >= self.max_pending:
+                self._stats['rejected'] += 1
+                raise JobQueueFull(self._retry_after())
+
+            submitted_at = time.time()
+            if self.workers > 0:
+                try:
+                    future = self._get_executor().submit(_execute, fn, args)
+                except BrokenProcessPool:
+                    # A worker died; start a fresh pool and try once more
+                    self._executor = None
+                    self._stats['pool_restarts'] += 1
+                    future = self._get_executor().submit(_execute, fn, args)
+            else:
+                future = Future()
+            self._stats['submitted'] += 1
+            self._pending += 1
+            if key is not None:
+                self._inflight[key] = future
+
+        future.add_done_callback(lambda done: self._finished(key, submitted_at, done))
+        if self.workers == 0:
+            # Run inline; identical requests arriving meanwhile wait on this future
+            try:
+                future.set_result(_execute(fn, args))
+            except Exception as e:
+                future.set_exception(e)
+        return future
+
+    def run(self, key, fn, *args, timeout=None):
+        """
+        Run fn(*args) in the pool and return its result.
+
+        Raises JobTimeout after timeout seconds (default: the pool's timeout).
+        The job itself isn't cancelled, since other requests may share it; it
+        keeps running and can still be joined by later requests with the same key.
+        """
+        future = self.submit(key, fn, *args)
+        try:
+            return future.result(timeout=timeout or self.timeout)[2]
+        except TimeoutError:
+            with self._lock:
+                self._stats['timeouts'] += 1
+            raise JobTimeout(f"job {fn.__name__} timed out after {timeout or self.timeout}s")
+
+    def stats(self):
+        """Return queue depth, counters and recent wait/run times"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats.update({
+                'workers': self.workers,
+                'start_method': self.start_method if self.workers > 0 else 'inline',
+                'started': self._executor is not None,
+                'pending': self._pending,
+                'queued': max(0, self._pending - self.workers),
+                'max_pending': self.max_pending,
+                'timeout': self.timeout,
+                'wait_ms': _summary_ms(self._waits),
+                'run_ms': _summary_ms(self._runs),
+            })
+        return stats
+
+    def shutdown(self, wait=True):
+        """Stop the worker processes; the pool starts again on the next submit"""
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=wait, cancel_futures=True)
@@ -0,0 +1,782 @@
+"""
+Versioned schema migrations for the AquaGuard database.
+
+Each migration is a function that receives a cursor and is applied exactly
+once, inside its own transaction. Applied versions are recorded in the
+schema_migrations table.
+
+Usage:
+    python migrations.py                 # apply pending migrations
+    python migrations.py --check-plans   # verify hot queries use an index
+"""
+import sys
+from datetime import datetime, timezone
+from sqlite3 import Error
+
+
+def _migration_001_base_tables(cursor):
+    """Create the base tables"""
+    # Create ocean_data table
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS ocean_data (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        region TEXT NOT NULL,
+        data_type TEXT NOT NULL,
+        min_value REAL,
+        max_value REAL
+    )
+    ''')
+
+    # Create ocean_data_points table
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS ocean_data_points (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        ocean_data_id INTEGER,
+        latitude REAL NOT NULL,
+        longitude REAL NOT NULL,
+        value REAL NOT NULL,
+        FOREIGN KEY (ocean_data_id) REFERENCES ocean_data (id)
+    )
+    ''')
+
+    # Create district table
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS districts (
+        id TEXT PRIMARY KEY,
+        color TEXT,
+        agency_name TEXT,
+        state_name TEXT NOT NULL,
+        district_name TEXT NOT NULL,
+        tahsil_name TEXT,
+        station_name TEXT,
+        latitude REAL,
+        longitude REAL,
+        station_type TEXT,
+        station_status TEXT
+    )
+    ''')
+
+    # Create regions table
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS regions (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT NOT NULL,
+        sw_lat REAL,
+        sw_lng REAL,
+        ne_lat REAL,
+        ne_lng REAL,
+        center_lat REAL,
+        center_lng REAL
+    )
+    ''')
+
+    # Create sightings table
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS sightings (
+        id TEXT PRIMARY KEY,
+        state_name TEXT NOT NULL,
+        district_name TEXT NOT NULL,
+        station_name TEXT,
+        latitude REAL,
+        longitude REAL,
+        temperature REAL,
+        ph REAL,
+        salinity REAL
+    )
+    ''')
+
+    # Create groundwater table
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS groundwater (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        state_name TEXT NOT NULL,
+        district_name TEXT NOT NULL,
+        city_name TEXT,
+        year INTEGER,
+        level REAL,
+        quality TEXT,
+        latitude REAL,
+        longitude REAL,
+        color TEXT,
+        rainfall REAL,
+        annual_extractable REAL,
+        current_extraction REAL,
+        ground_water_recharge REAL,
+        natural_discharges REAL,
+        extraction_percentage REAL,
+        historical_levels TEXT,
+        monthly_rainfall TEXT
+    )
+    ''')
+
+
+def _migration_002_groundwater_assessment_columns(cursor):
+    """Add the assessment columns missing from databases created before they existed"""
+    columns = {
+        'rainfall': 'REAL',
+        'annual_extractable': 'REAL',
+        'current_extraction': 'REAL',
+        'ground_water_recharge': 'REAL',
+        'natural_discharges': 'REAL',
+        'extraction_percentage': 'REAL',
+        'historical_levels': 'TEXT',
+        'monthly_rainfall': 'TEXT',
+    }
+    cursor.execute("PRAGMA table_info(groundwater)")
+    existing = {row[1] for row in cursor.fetchall()}
+    for name, column_type in columns.items():
+        if name not in existing:
+            cursor.execute(f"ALTER TABLE groundwater ADD COLUMN {name} {column_type}")
+
+
+def _migration_003_query_indexes(cursor):
+    """Add the indexes used by the ocean data and groundwater queries"""
+    # Ocean data JOIN and region filter
+    cursor.execute('''
+    CREATE INDEX IF NOT EXISTS idx_ocean_data_points_ocean_data_id
+    ON ocean_data_points (ocean_data_id)
+    ''')
+    cursor.execute('''
+    CREATE INDEX IF NOT EXISTS idx_ocean_data_region
+    ON ocean_data (region)
+    ''')
+
+    # Ordered groundwater scan; also covers DISTINCT state_name
+    cursor.execute('''
+    CREATE INDEX IF NOT EXISTS idx_groundwater_state_district
+    ON groundwater (state_name, district_name)
+    ''')
+
+
+def _migration_004_covering_search_indexes(cursor):
+    """Add covering indexes for the search and listing endpoints"""
+    # DISTINCT state/district/station lookups on sightings
+    cursor.execute('''
+    CREATE INDEX IF NOT EXISTS idx_sightings_state_district_station
+    ON sightings (state_name, district_name, station_name)
+    ''')
+
+    # Station lookups on the districts registry
+    cursor.execute('''
+    CREATE INDEX IF NOT EXISTS idx_districts_state_district_station
+    ON districts (state_name, district_name, station_name)
+    ''')
+
+    # District name search on groundwater
+    cursor.execute('''
+    CREATE INDEX IF NOT EXISTS idx_groundwater_district_state
+    ON groundwater (district_name, state_name)
+    ''')
+
+
+# Location columns indexed for search: table -> [(type, name column, parent column)]
+SEARCH_SOURCES = {
+    'groundwater': [
+        ('state', 'state_name', None),
+        ('district', 'district_name', 'state_name'),
+        ('city', 'city_name', 'district_name'),
+    ],
+    'sightings': [
+        ('state', 'state_name', None),
+        ('district', 'district_name', 'state_name'),
+        ('station', 'station_name', 'district_name'),
+    ],
+    'districts': [
+        ('state', 'state_name', None),
+        ('district', 'district_name', 'state_name'),
+        ('station', 'station_name', 'district_name'),
+    ],
+}
+
+
+def _search_term_sql(table, ref, delta):
+    """SQL adding delta references to the search terms of a trigger's new/old row"""
+    statements = []
+    for term_type, column, parent_column in SEARCH_SOURCES[table]:
+        name = f"{ref}.{column}"
+        parent = f"COALESCE({ref}.{parent_column}, '')" if parent_column else "''"
+        if delta > 0:
+            statements.append(f"""
+        INSERT INTO search_terms (name, type, parent, refs)
+        SELECT {name}, '{term_type}', {parent}, 1
+        WHERE {name} IS NOT NULL AND {name} <> ''
+        ON CONFLICT (type, name, parent) DO UPDATE SET refs = refs + 1;""")
+        else:
+            match = f"type = '{term_type}' AND name = {name} AND parent = {parent}"
+            statements.append(f"""
+        UPDATE search_terms SET refs = refs - 1 WHERE {match};
+        DELETE FROM search_terms WHERE refs <= 0 AND {match};""")
+    return ''.join(statements)
+
+
+def _migration_005_search_index(cursor):
+    """Add the FTS5 location search index, kept in sync by triggers"""
+    # One row per distinct location, reference counted across source tables
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS search_terms (
+        id INTEGER PRIMARY KEY,
+        name TEXT NOT NULL COLLATE NOCASE,
+        type TEXT NOT NULL,
+        parent TEXT NOT NULL DEFAULT '',
+        refs INTEGER NOT NULL DEFAULT 0,
+        UNIQUE (type, name, parent)
+    )
+    ''')
+    cursor.execute('''
+    CREATE INDEX IF NOT EXISTS idx_search_terms_type_name
+    ON search_terms (type, name)
+    ''')
+
+    # Trigram tokens give case-insensitive substring and typo-tolerant matching
+    cursor.execute('''
+    CREATE VIRTUAL TABLE IF NOT EXISTS search_index USING fts5(
+        name,
+        content='search_terms',
+        content_rowid='id',
+        tokenize='trigram'
+    )
+    ''')
+    cursor.execute('''
+    CREATE TRIGGER IF NOT EXISTS search_terms_ai AFTER INSERT ON search_terms BEGIN
+        INSERT INTO search_index (rowid, name) VALUES (new.id, new.name);
+    END
+    ''')
+    cursor.execute('''
+    CREATE TRIGGER IF NOT EXISTS search_terms_ad AFTER DELETE ON search_terms BEGIN
+        INSERT INTO search_index (search_index, rowid, name) VALUES ('delete', old.id, old.name);
+    END
+    ''')
+    cursor.execute('''
+    CREATE TRIGGER IF NOT EXISTS search_terms_au AFTER UPDATE OF name ON search_terms BEGIN
+        INSERT INTO search_index (search_index, rowid, name) VALUES ('delete', old.id, old.name);
+        INSERT INTO search_index (rowid, name) VALUES (new.id, new.name);
+    END
+    ''')
+
+    # Keep search_terms in step with every source table
+    for table, sources in SEARCH_SOURCES.items():
+        columns = ', '.join(column for _, column, _ in sources)
+        cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS {table}_search_ai AFTER INSERT ON {table} BEGIN{_search_term_sql(table, 'new', 1)}
+        END
+        ''')
+        cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS {table}_search_ad AFTER DELETE ON {table} BEGIN{_search_term_sql(table, 'old', -1)}
+        END
+        ''')
+        cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS {table}_search_au AFTER UPDATE OF {columns} ON {table} BEGIN{_search_term_sql(table, 'old', -1)}{_search_term_sql(table, 'new', 1)}
+        END
+        ''')
+
+    backfill_search_terms(cursor)
+
+
+def backfill_search_terms(cursor):
+    """Count the locations of every source table row into search_terms"""
+    selects = []
+    for table, sources in SEARCH_SOURCES.items():
+        for term_type, column, parent_column in sources:
+            parent = f"COALESCE({parent_column}, '')" if parent_column else "''"
+            selects.append(
+                f"SELECT {column} AS name, '{term_type}' AS type, {parent} AS parent FROM {table} "
+                f"WHERE {column} IS NOT NULL AND {column} <> ''"
+            )
+    cursor.execute(f'''
+    INSERT INTO search_terms (name, type, parent, refs)
+    SELECT name, type, parent, COUNT(*) FROM ({' UNION ALL '.join(selects)})
+    WHERE true
+    GROUP BY type, name COLLATE NOCASE, parent
+    ON CONFLICT (type, name, parent) DO UPDATE SET refs = refs + excluded.refs
+    ''')
+
+
+def _migration_006_prediction_jobs(cursor):
+    """Add asynchronous prediction jobs and their per-station results"""
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS prediction_jobs (
+        id TEXT PRIMARY KEY,
+        status TEXT NOT NULL DEFAULT 'queued',
+        request TEXT NOT NULL,
+        total_rows INTEGER,
+        completed_rows INTEGER NOT NULL DEFAULT 0,
+        error TEXT,
+        worker TEXT,
+        created_at TEXT NOT NULL,
+        started_at TEXT,
+        heartbeat_at TEXT,
+        finished_at TEXT
+    )
+    ''')
+    # Workers claim the oldest queued (or abandoned) job
+    cursor.execute('''
+    CREATE INDEX IF NOT EXISTS idx_prediction_jobs_status_created
+    ON prediction_jobs (status, created_at)
+    ''')
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS prediction_job_results (
+        job_id TEXT NOT NULL,
+        row_index INTEGER NOT NULL,
+        result TEXT NOT NULL,
+        PRIMARY KEY (job_id, row_index),
+        FOREIGN KEY (job_id) REFERENCES prediction_jobs (id)
+    ) WITHOUT ROWID
+    ''')
+
+
+def _migration_007_location_indexes(cursor):
+    """Index station coordinates for map viewport (bbox) filtering"""
+    cursor.execute('''
+    CREATE INDEX IF NOT EXISTS idx_districts_latitude_longitude
+    ON districts (latitude, longitude)
+    ''')
+    cursor.execute('''
+    CREATE INDEX IF NOT EXISTS idx_sightings_latitude_longitude
+    ON sightings (latitude, longitude)
+    ''')
+
+
+# Tables whose latitude/longitude points are kept in an R*Tree, with the SQL
+# for each point's display name and the columns the R*Tree copies
+SPATIAL_SOURCES = {
+    'districts': ("{ref}.station_name", ('station_name', 'state_name', 'district_name')),
+    'sightings': ("{ref}.station_name", ('station_name', 'state_name', 'district_name')),
+    'groundwater': ("COALESCE({ref}.city_name, {ref}.district_name)", ('city_name', 'state_name', 'district_name')),
+}
+
+
+def _spatial_sql(table, ref, delta):
+    """SQL adding (delta > 0) or removing a trigger's new/old row from the table's R*Tree"""
+    source_id = f"CAST({ref}.id AS TEXT)"
+    if delta > 0:
+        name = SPATIAL_SOURCES[table][0].format(ref=ref)
+        return f"""
+        INSERT INTO station_locations (source, source_id)
+        SELECT '{table}', {source_id}
+        WHERE {ref}.latitude IS NOT NULL AND {ref}.longitude IS NOT NULL;
+        INSERT INTO {table}_rtree
+        SELECT id, {ref}.latitude, {ref}.latitude, {ref}.longitude, {ref}.longitude,
+               source_id, {name}, {ref}.state_name, {ref}.district_name, {ref}.latitude, {ref}.longitude
+        FROM station_locations WHERE source = '{table}' AND source_id = {source_id}
+        AND {ref}.latitude IS NOT NULL AND {ref}.longitude IS NOT NULL;"""
+    return f"""
+        DELETE FROM {table}_rtree WHERE id IN (
+            SELECT id FROM station_locations WHERE source = '{table}' AND source_id = {source_id}
+        );
+        DELETE FROM station_locations WHERE source = '{table}' AND source_id = {source_id};"""
+
+
+def _migration_008_spatial_index(cursor):
+    """Add R*Tree indexes over station coordinates, kept in sync by triggers"""
+    # Stable integer ids for the R*Tree entries, so triggers can find a row's
+    # entry whether the source table keys rows by text or integer ids
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS station_locations (
+        id INTEGER PRIMARY KEY,
+        source TEXT NOT NULL,
+        source_id TEXT NOT NULL,
+        UNIQUE (source, source_id)
+    )
+    ''')
+
+    for table, (_, copied_columns) in SPATIAL_SOURCES.items():
+        # Auxiliary (+) columns make the R*Tree covering: spatial queries never
+        # touch the source table, and exact coordinates refine the 32-bit boxes
+        cursor.execute(f'''
+        CREATE VIRTUAL TABLE IF NOT EXISTS {table}_rtree USING rtree(
+            id,
+            min_lat, max_lat,
+            min_lng, max_lng,
+            +source_id, +name, +state, +district, +latitude, +longitude
+        )
+        ''')
+        cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS {table}_spatial_ai AFTER INSERT ON {table} BEGIN{_spatial_sql(table, 'new', 1)}
+        END
+        ''')
+        cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS {table}_spatial_ad AFTER DELETE ON {table} BEGIN{_spatial_sql(table, 'old', -1)}
+        END
+        ''')
+        cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS {table}_spatial_au
+        AFTER UPDATE OF id, latitude, longitude, {', '.join(copied_columns)} ON {table}
+        BEGIN{_spatial_sql(table, 'old', -1)}{_spatial_sql(table, 'new', 1)}
+        END
+        ''')
+
+        backfill_spatial_index(cursor, table)
+
+
+def backfill_spatial_index(cursor, table):
+    """Add every located row of a source table to its R*Tree"""
+    name = SPATIAL_SOURCES[table][0]
+    cursor.execute(f'''
+    INSERT INTO station_locations (source, source_id)
+    SELECT '{table}', CAST(id AS TEXT) FROM {table}
+    WHERE latitude IS NOT NULL AND longitude IS NOT NULL
+    ''')
+    cursor.execute(f'''
+    INSERT INTO {table}_rtree
+    SELECT l.id, t.latitude, t.latitude, t.longitude, t.longitude,
+           l.source_id, {name.format(ref='t')}, t.state_name, t.district_name, t.latitude, t.longitude
+    FROM station_locations l JOIN {table} t ON CAST(t.id AS TEXT) = l.source_id
+    WHERE l.source = '{table}'
+    ''')
+
+
+def _migration_009_heatmap_indexes(cursor):
+    """Add covering indexes for the heatmap layers' point lookups"""
+    cursor.execute('''
+    CREATE INDEX IF NOT EXISTS idx_ocean_data_data_type
+    ON ocean_data (data_type)
+    ''')
+    # Points of one series inside a tile, read without touching the table
+    cursor.execute('''
+    CREATE INDEX IF NOT EXISTS idx_ocean_data_points_series_location
+    ON ocean_data_points (ocean_data_id, latitude, longitude, value)
+    ''')
+    cursor.execute('''
+    CREATE INDEX IF NOT EXISTS idx_groundwater_location_level
+    ON groundwater (latitude, longitude, level)
+    ''')
+
+
+# Map tile layers and the table holding each layer's stations
+TILE_SOURCES = {
+    'stations': 'districts',
+    'groundwater': 'groundwater',
+}
+
+
+def _migration_010_tile_changes(cursor):
+    """Record where station rows change, so only the map tiles they touch are rendered again"""
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS tile_changes (
+        id INTEGER PRIMARY KEY,
+        layer TEXT NOT NULL,
+        latitude REAL NOT NULL,
+        longitude REAL NOT NULL
+    )
+    ''')
+    cursor.execute('''
+    CREATE INDEX IF NOT EXISTS idx_tile_changes_layer
+    ON tile_changes (layer, id)
+    ''')
+
+    for layer, table in TILE_SOURCES.items():
+        record = {
+            ref: f"""
+            INSERT INTO tile_changes (layer, latitude, longitude)
+            SELECT '{layer}', {ref}.latitude, {ref}.longitude
+            WHERE {ref}.latitude IS NOT NULL AND {ref}.longitude IS NOT NULL;"""
+            for ref in ('new', 'old')
+        }
+        cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS {table}_tiles_ai AFTER INSERT ON {table} BEGIN{record['new']}
+        END
+        ''')
+        cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS {table}_tiles_ad AFTER DELETE ON {table} BEGIN{record['old']}
+        END
+        ''')
+        # Both positions: a moved station leaves one tile and enters another
+        cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS {table}_tiles_au AFTER UPDATE ON {table} BEGIN{record['old']}{record['new']}
+        END
+        ''')
+
+
+# Columns identifying a row across bulk loads of the same data, as the terms
+# of each table's unique key. Groundwater rows have no city for district-level figures
+NATURAL_KEYS = {
+    'districts': ('id',),
+    'sightings': ('id',),
+    'groundwater': ('state_name', 'district_name', "IFNULL(city_name, '')", 'year'),
+}
+
+
+def _migration_011_groundwater_natural_key(cursor):
+    """
+    Make groundwater rows unique per location and year, so bulk loads can upsert them.
+
+    Of any duplicates the newest row stays, the one a load would have left;
+    the others are moved to groundwater_duplicates rather than deleted.
+    """
+    duplicates = (f"id NOT IN (SELECT MAX(id) FROM groundwater "
+                  f"GROUP BY {', '.join(NATURAL_KEYS['groundwater'])})")
+    cursor.execute(f"SELECT COUNT(*) FROM groundwater WHERE {duplicates}")
+    moved = cursor.fetchone()[0]
+    if moved:
+        cursor.execute("CREATE TABLE IF NOT EXISTS groundwater_duplicates AS SELECT * FROM groundwater WHERE 0")
+        cursor.execute(f"INSERT INTO groundwater_duplicates SELECT * FROM groundwater WHERE {duplicates}")
+        cursor.execute(f"DELETE FROM groundwater WHERE {duplicates}")
+        print(f"Moved {moved:,} duplicate groundwater rows to groundwater_duplicates")
+    cursor.execute(f'''
+    CREATE UNIQUE INDEX IF NOT EXISTS idx_groundwater_natural_key
+    ON groundwater ({', '.join(NATURAL_KEYS['groundwater'])})
+    ''')
+
+
+def _migration_012_predictions(cursor):
+    """Add stored station forecasts, one row per station, model version and target year"""
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS predictions (
+        station_code TEXT NOT NULL,
+        model_version TEXT NOT NULL,
+        target_year INTEGER NOT NULL,
+        state_name TEXT,
+        station_name TEXT,
+        from_year INTEGER,
+        temperature_min REAL,
+        temperature_max REAL,
+        ph_min REAL,
+        ph_max REAL,
+        conductivity_min REAL,
+        conductivity_max REAL,
+        recharge_volume REAL,
+        recharge_percentage REAL,
+        created_at TEXT NOT NULL,
+        PRIMARY KEY (station_code, model_version, target_year)
+    ) WITHOUT ROWID
+    ''')
+    # A state's forecasts for one model and year
+    cursor.execute('''
+    CREATE INDEX IF NOT EXISTS idx_predictions_state_model_year
+    ON predictions (state_name, model_version, target_year)
+    ''')
+
+
+def _migration_013_prediction_sources(cursor):
+    """Record the version of the inputs each stored forecast was made from"""
+    cursor.execute("PRAGMA table_info(predictions)")
+    if 'source_version' not in {row[1] for row in cursor.fetchall()}:
+        cursor.execute("ALTER TABLE predictions ADD COLUMN source_version TEXT")
+
+
+def create_predictions_table(cursor):
+    """Create the predictions table as migrations 12 and 13 leave it, e.g. in a database of forecasts only"""
+    _migration_012_predictions(cursor)
+    _migration_013_prediction_sources(cursor)
+
+
+# Tables the read-only endpoints serve; a write to any of them bumps the write generation
+GENERATION_TABLES = ('ocean_data', 'ocean_data_points', 'districts', 'regions', 'sightings', 'groundwater')
+
+
+def _migration_014_write_generation(cursor):
+    """Count writes to the served tables, so cached responses know when they are stale"""
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS write_generation (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        generation INTEGER NOT NULL
+    )
+    ''')
+    cursor.execute("INSERT OR IGNORE INTO write_generation (id, generation) VALUES (1, 0)")
+
+    bump = """
+            UPDATE write_generation SET generation = generation + 1 WHERE id = 1;"""
+    for table in GENERATION_TABLES:
+        for event, name in (('INSERT', 'ai'), ('DELETE', 'ad'), ('UPDATE', 'au')):
+            cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS {table}_generation_{name} AFTER {event} ON {table} BEGIN{bump}
+            END
+            ''')
+
+
+def _migration_015_tile_resets(cursor):
+    """Let bulk loads invalidate a tile layer at once instead of recording every changed row"""
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS tile_resets (
+        id INTEGER PRIMARY KEY,
+        layer TEXT NOT NULL
+    )
+    ''')
+    cursor.execute('''
+    CREATE INDEX IF NOT EXISTS idx_tile_resets_layer
+    ON tile_resets (layer, id)
+    ''')
+
+
+MIGRATIONS = [
+    (1, 'base tables', _migration_001_base_tables),
+    (2, 'groundwater assessment columns', _migration_002_groundwater_assessment_columns),
+    (3, 'query indexes', _migration_003_query_indexes),
+    (4, 'covering search indexes', _migration_004_covering_search_indexes),
+    (5, 'location search index', _migration_005_search_index),
+    (6, 'prediction jobs', _migration_006_prediction_jobs),
+    (7, 'location indexes', _migration_007_location_indexes),
+    (8, 'spatial index', _migration_008_spatial_index),
+    (9, 'heatmap indexes', _migration_009_heatmap_indexes),
+    (10, 'tile changes', _migration_010_tile_changes),
+    (11, 'groundwater natural key', _migration_011_groundwater_natural_key),
+    (12, 'predictions', _migration_012_predictions),
+    (13, 'prediction sources', _migration_013_prediction_sources),
+    (14, 'write generation', _migration_014_write_generation),
+    (15, 'tile resets', _migration_015_tile_resets),
+]
+
+
+def get_schema_version(conn):
+    """Get the highest applied migration version, or 0 for a new database"""
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS schema_migrations (
+        version INTEGER PRIMARY KEY,
+        name TEXT NOT NULL,
+        applied_at TEXT NOT NULL
+    )
+    ''')
+    row = conn.execute("SELECT MAX(version) FROM schema_migrations").fetchone()
+    return row[0] or 0
+
+
+def migrate(conn, target=None):
+    """Apply pending migrations up to target (default: latest); returns the versions applied"""
+    isolation_level = conn.isolation_level
+    conn.isolation_level = None  # Manage transactions explicitly so DDL is atomic
+    applied = []
+    try:
+        current = get_schema_version(conn)
+        for version, name, migration in MIGRATIONS:
+            if version <= current or (target is not None and version > target):
+                continue
+            cursor = conn.cursor()
+            cursor.execute("BEGIN IMMEDIATE")
+            try:
+                # Another worker may have applied it while we waited for the lock
+                cursor.execute("SELECT 1 FROM schema_migrations WHERE version = ?", (version,))
+                if cursor.fetchone() is None:
+                    migration(cursor)
+                    cursor.execute(
+                        "INSERT INTO schema_migrations (version, name, applied_at) VALUES (?, ?, ?)",
+                        (version, name, datetime.now(timezone.utc).isoformat())
+                    )
+                    applied.append(version)
+                cursor.execute("COMMIT")
+            except Error:
+                cursor.execute("ROLLBACK")
+                raise
+    finally:
+        conn.isolation_level = isolation_level
+    return applied
+
+
+# Hot queries that must be answered from an index rather than a table scan
+HOT_QUERIES = [
+    ('groundwater (all)',
+     "SELECT * FROM groundwater ORDER BY state_name, district_name, id", ()),
+    ('groundwater (state)',
+     "SELECT * FROM groundwater WHERE state_name = ? ORDER BY state_name, district_name, id", ('S',)),
+    ('groundwater (state, district)',
+     "SELECT * FROM groundwater WHERE state_name = ? AND district_name = ? "
+     "ORDER BY state_name, district_name, id", ('S', 'D')),
+    ('ocean data (region)',
+     "SELECT d.id, p.id FROM ocean_data d LEFT JOIN ocean_data_points p ON p.ocean_data_id = d.id "
+     "WHERE d.region = ? ORDER BY d.id, p.id", ('R',)),
+    ('available states',
+     "SELECT DISTINCT state_name FROM sightings ORDER BY state_name", ()),
+    ('districts by state',
+     "SELECT DISTINCT district_name FROM sightings WHERE state_name = ? ORDER BY district_name", ('S',)),
+    ('stations by district',
+     "SELECT DISTINCT station_name FROM sightings WHERE state_name = ? AND district_name = ? "
+     "ORDER BY station_name", ('S', 'D')),
+    ('search (prefix)',
+     "SELECT id, name, type, parent FROM search_terms WHERE type = ? AND name LIKE ? ESCAPE '\\' "
+     "ORDER BY name LIMIT ?", ('station', 'q%', 20)),
+    ('search (substring)',
+     "SELECT t.id FROM search_index s JOIN search_terms t ON t.id = s.rowid "
+     "WHERE search_index MATCH ? AND t.name NOT LIKE ? ESCAPE '\\' LIMIT ?", ('"abc"', 'abc%', 20)),
+    ('search (fuzzy)',
+     "SELECT t.id FROM search_index s JOIN search_terms t ON t.id = s.rowid "
+     "WHERE search_index MATCH ? LIMIT ?", ('"abc" AND "def"', 200)),
+    ('districts (page)',
+     "SELECT * FROM districts WHERE id > ? ORDER BY id LIMIT ?", ('D', 100)),
+    ('sightings (page)',
+     "SELECT * FROM sightings WHERE id > ? ORDER BY id LIMIT ?", ('S', 100)),
+    ('districts (bbox)',
+     "SELECT * FROM districts WHERE latitude BETWEEN ? AND ? AND longitude BETWEEN ? AND ?",
+     (20.0, 25.0, 80.0, 90.0)),
+    ('stations by district (page)',
+     "SELECT DISTINCT station_name FROM sightings WHERE state_name = ? AND district_name = ? "
+     "AND station_name > ? ORDER BY station_name LIMIT ?", ('S', 'D', 'N', 100)),
+    ('prediction job claim',
+     "SELECT id FROM prediction_jobs WHERE status = ? ORDER BY created_at LIMIT 1", ('queued',)),
+    ('prediction job results',
+     "SELECT row_index, result FROM prediction_job_results WHERE job_id = ? AND row_index >= ? "
+     "ORDER BY row_index LIMIT ?", ('J', 0, 100)),
+    ('stations within (r*tree)',
+     "SELECT source_id, name FROM districts_rtree "
+     "WHERE max_lat >= ? AND min_lat <= ? AND max_lng >= ? AND min_lng <= ?", (20.0, 25.0, 80.0, 90.0)),
+    ('station location (trigger)',
+     "SELECT id FROM station_locations WHERE source = ? AND source_id = ?", ('districts', 'D')),
+    ('heatmap tile (ocean)',
+     "SELECT latitude, longitude, value FROM ocean_data_points "
+     "WHERE ocean_data_id IN (SELECT id FROM ocean_data WHERE data_type = ?) "
+     "AND latitude >= ? AND latitude < ? AND longitude >= ? AND longitude < ?",
+     ('temperature', 20.0, 25.0, 80.0, 90.0)),
+    ('heatmap tile (groundwater)',
+     "SELECT latitude, longitude, level FROM groundwater WHERE level IS NOT NULL "
+     "AND latitude >= ? AND latitude < ? AND longitude >= ? AND longitude < ?",
+     (20.0, 25.0, 80.0, 90.0)),
+    ('tile changes',
+     "SELECT id, latitude, longitude FROM tile_changes WHERE layer = ? AND id <= ? ORDER BY id", ('stations', 100)),
+    ('groundwater upsert (natural key)',
+     "SELECT id FROM groundwater WHERE state_name = ? AND district_name = ? "
+     "AND IFNULL(city_name, '') = ? AND year = ?", ('S', 'D', 'C', 2023)),
+    ('prediction (station)',
+     "SELECT * FROM predictions WHERE station_code = ? AND model_version = ? AND target_year = ?",
+     ('S', 'M', 2022)),
+    ('predictions (state)',
+     "SELECT * FROM predictions WHERE state_name = ? AND model_version = ? AND target_year = ? "
+     "ORDER BY station_code", ('S', 'M', 2022)),
+    ('tile reset (sync)',
+     "SELECT MAX(id) FROM tile_resets WHERE layer = ?", ('stations',)),
+    ('write generation',
+     "SELECT generation FROM write_generation WHERE id = 1", ()),
+]
+
+
+def _plan_problems(detail):
+    """Return why a query plan step is unacceptable, or None"""
+    if detail.startswith('SCAN ') and ' USING ' not in detail and ' VIRTUAL TABLE INDEX ' not in detail:
+        return 'full table scan'
+    if 'USE TEMP B-TREE' in detail:
+        return 'temporary b-tree'
+    return None
+
+
+def check_query_plans(conn, queries=None):
+    """Run EXPLAIN QUERY PLAN over the hot queries; returns a list of (name, detail, problem)"""
+    problems = []
+    for name, sql, params in queries or HOT_QUERIES:
+        for row in conn.execute("EXPLAIN QUERY PLAN " + sql, params):
+            detail = row[3]
+            problem = _plan_problems(detail)
+            if problem:
+                problems.append((name, detail, problem))
+    return problems
+
+
+def main(argv):
+    import database
+
+    conn = database.create_connection()
+    try:
+        applied = migrate(conn)
+        print(f"Schema at version {get_schema_version(conn)}"
+              + (f" (applied {', '.join(map(str, applied))})" if applied else ""))
+
+        if '--check-plans' in argv:
+            problems = check_query_plans(conn)
+            for name, detail, problem in problems:
+                print(f"{name}: {problem} ({detail})")
+            if problems:
+                return 1
+            print(f"All {len(HOT_QUERIES)} hot queries use an index")
+        return 0
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,164 @@
+"""
+Lazily loaded, hot-reloadable groundwater prediction model.
+
+The model file is resolved relative to this package (or AQUAGUARD_MODEL_PATH)
+and loaded on first use or by warm_up() in a background thread. With
+AQUAGUARD_MODEL_MMAP_MODE=r the model's arrays are memory-mapped, so forked
+workers share the same pages instead of each holding a private copy.
+
+When the file changes on disk it is reloaded in the background and swapped in
+atomically; requests keep using the previous model until the new one is ready.
+"""
+import hashlib
+import os
+import threading
+import time
+from datetime import datetime, timezone
+
+MODEL_PATH = os.environ.get(
+    'AQUAGUARD_MODEL_PATH',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'ground_water_predictor.pkl')
+)
+MMAP_MODE = os.environ.get('AQUAGUARD_MODEL_MMAP_MODE') or None
+RELOAD_INTERVAL = float(os.environ.get('AQUAGUARD_MODEL_RELOAD_INTERVAL', '30'))
+
+# (model, info) swapped as a single reference so readers never see a mix
+_current = None
+_load_lock = threading.Lock()
+_reloading = threading.Event()
+_last_checked = 0.0
+# path -> (signature, version) of model files hashed by get_file_version()
+_file_versions = {}
+
+
+def _file_signature(path):
+    stat = os.stat(path)
+    return stat.st_mtime_ns, stat.st_size
+
+
+def _file_version(path):
+    """Short content hash of the model file, used as its version"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()[:12]
+
+
+def _load(path):
+    from joblib import load
+
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"Model file not found: {path}")
+
+    signature = _file_signature(path)
+    started = time.perf_counter()
+    model = load(path, mmap_mode=MMAP_MODE)
+    info = {
+        'path': path,
+        'version': _file_version(path),
+        'mmap_mode': MMAP_MODE,
+        'signature': signature,
+        'loaded_at': datetime.now(timezone.utc).isoformat(),
+        'load_seconds': round(time.perf_counter() - started, 3),
+    }
+    print(f"Loaded model {info['version']} from {path} in {info['load_seconds']}s")
+    return model, info
+
+
+def _reload_in_background():
+    def run():
+        try:
+            reload_model()
+        except Exception as e:
+            print(f"Error reloading model: {e}")
+        finally:
+            _reloading.clear()
+
+    if not _reloading.is_set():
+        _reloading.set()
+        threading.Thread(target=run, name='model-reload', daemon=True).start()
+
+
+def _check_for_update(current):
+    global _last_checked
+    now = time.monotonic()
+    if RELOAD_INTERVAL <= 0 or now - _last_checked < RELOAD_INTERVAL:
+        return
+    _last_checked = now
+    try:
+        if _file_signature(current[1]['path']) != current[1]['signature']:
+            _reload_in_background()
+    except OSError:
+        # File is being replaced; keep serving the loaded model
+        pass
+
+
+def get_model():
+    """Return the current model, loading it on first use"""
+    global _current
+    current = _current
+    if current is None:
+        with _load_lock:
+            if _current is None:
+                _current = _load(MODEL_PATH)
+            current = _current
+    else:
+        _check_for_update(current)
+    return current[0]
+
+
+def get_model_info():
+    """Return the loaded model's version and load details, or None if not loaded yet"""
+    current = _current
+    if current is None:
+        return None
+    info = dict(current[1])
+    info.pop('signature')
+    return info
+
+
+def get_model_version():
+    """Return the loaded model's version, loading the model if needed"""
+    get_model()
+    return _current[1]['version']
+
+
+def get_file_version(path=None):
+    """
+    Version of the model file on disk (default: the current path), without
+    loading the model.
+
+    The file is hashed again only when its size or modification time change,
+    so this is cheap enough to call per request.
+    """
+    path = path or (_current[1]['path'] if _current else MODEL_PATH)
+    signature = _file_signature(path)
+    cached = _file_versions.get(path)
+    if cached is None or cached[0] != signature:
+        cached = (signature, _file_version(path))
+        _file_versions[path] = cached
+    return cached[1]
+
+
+def reload_model(path=None):
+    """Load the model from path (default: the current path) and swap it in atomically"""
+    global _current
+    path = path or (_current[1]['path'] if _current else MODEL_PATH)
+    loaded = _load(path)
+    with _load_lock:
+        _current = loaded
+    return get_model_info()
+
+
+def warm_up():
+    """Load the model in a background thread so the first request doesn't pay for it"""
+    def run():
+        try:
+            get_model()
+        except Exception as e:
+            print(f"Error warming up model: {e}")
+
+    thread = threading.Thread(target=run, name='model-warm-up', daemon=True)
+    thread.start()
+    return thread
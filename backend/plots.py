@@ -0,0 +1,244 @@
+"""
+Matplotlib renderers for the prediction plots.
+
+Plots are drawn with the object-oriented Figure API on an Agg canvas, never
+through pyplot, so no global figure state is shared between requests. Each
+plot kind keeps a pool of pre-built figure templates: a render checks one out,
+updates its artists (bar heights, labels, the 3D points) and hands
+it back, so concurrent requests each draw on their own figure and the static
+parts of the dashboard are built once.
+
+Importing this module loads matplotlib, so the API imports it only when a
+plot is actually rendered.
+"""
+import io
+import queue
+from contextlib import contextmanager
+
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+
+# Options shared by every saved plot
+SAVE_OPTIONS = {
+    'format': 'png', 'dpi': 150, 'bbox_inches': 'tight',
+    'facecolor': 'white', 'edgecolor': 'none', 'pad_inches': 0.5,
+    'transparent': False,
+}
+
+# Idle templates kept per plot kind; extra ones built under load are dropped
+MAX_IDLE_TEMPLATES = 8
+
+# The two 3D points; redrawn on each render, so their style is kept here
+SCATTER_3D_STYLES = {
+    'scatter_min': {'color': '#3498db', 's': 200, 'label': 'Minimum Values', 'alpha': 0.8},
+    'scatter_max': {'color': '#e74c3c', 's': 200, 'label': 'Maximum Values', 'alpha': 0.8},
+}
+
+MONTHS = ['Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec']
+MONTHLY_RAINFALL_MM = [15.2, 25.1, 35.8, 58.4, 156.2, 305.7, 325.4, 328.6, 252.3, 125.6, 28.9, 12.6]
+GROUND_LEVEL_YEARS = [2018, 2019, 2020, 2021, 2022, 2023]
+GROUND_LEVELS_M = [14.2, 13.8, 13.1, 12.9, 12.7, 12.5]
+
+SUMMARY_TEMPLATE = """Parameter Predictions
+
+Temperature
+Min: {temp_min:.2f}°C
+Max: {temp_max:.2f}°C
+
+pH Levels
+Min: {ph_min:.2f}
+Max: {ph_max:.2f}
+
+Conductivity
+Min: {cond_min:.0f} µmhos/cm
+Max: {cond_max:.0f} µmhos/cm
+
+Recharge Potential
+Volume: {recharge_volume:.2f} MCM
+Percentage: {recharge_percentage:.2f}%"""
+
+
+def _bar_panel(ax, labels, colors, title, ylabel, label_format):
+    """Bar chart with one value label per bar; heights are filled in per render"""
+    bars = ax.bar(labels, [0] * len(labels), color=colors, width=0.5)
+    ax.set_title(title, fontsize=14, pad=10)
+    ax.set_ylabel(ylabel, fontsize=12)
+    texts = [
+        ax.text(bar.get_x() + bar.get_width()/2., 0, '', ha='center', va='bottom', fontsize=12)
+        for bar in bars
+    ]
+    return {'ax': ax, 'bars': bars, 'texts': texts, 'format': label_format}
+
+
+def _subplot_params(fig):
+    params = fig.subplotpars
+    return {name: getattr(params, name) for name in ('left', 'bottom', 'right', 'top', 'wspace', 'hspace')}
+
+
+def _update_bar_panel(panel, heights):
+    for bar, text, height in zip(panel['bars'], panel['texts'], heights):
+        bar.set_height(height)
+        text.set_y(height)
+        text.set_text(panel['format'].format(height))
+    panel['ax'].relim()
+    panel['ax'].autoscale_view()
+
+
+def _build_template_2d():
+    """Build the 2D dashboard figure with placeholder values"""
+    fig = Figure(figsize=(15, 10))
+    FigureCanvasAgg(fig)
+    axes = fig.subplots(2, 3)
+
+    # First row: predicted values
+    panels = [
+        _bar_panel(axes[0, 0], ['Min', 'Max'], ['#3498db', '#e74c3c'],
+                   'Temperature Prediction', 'Temperature (°C)', '{:.2f}°C'),
+        _bar_panel(axes[0, 1], ['Min', 'Max'], ['#2ecc71', '#f1c40f'],
+                   'pH Level Prediction', 'pH Value', '{:.2f}'),
+        _bar_panel(axes[0, 2], ['Recharge'], '#9b59b6',
+                   'Groundwater Recharge', 'Million Cubic Meters/year', '{:.2f} MCM'),
+    ]
+
+    # Second row: static context panels, drawn once
+    ax = axes[1, 0]
+    ax.plot(MONTHS, MONTHLY_RAINFALL_MM, marker='o', color='#3498db', linewidth=2, markersize=8)
+    ax.set_title('Monthly Rainfall Pattern', fontsize=14, pad=10)
+    ax.set_ylabel('Rainfall (mm)', fontsize=12)
+    ax.tick_params(axis='x', labelrotation=45, labelsize=10)
+    ax.tick_params(axis='y', labelsize=10)
+    ax.grid(True, linestyle='--', alpha=0.7)
+
+    ax = axes[1, 1]
+    ax.plot(GROUND_LEVEL_YEARS, GROUND_LEVELS_M, marker='s', color='#e74c3c', linewidth=2, markersize=8)
+    ax.set_title('5-Year Ground Level Trend', fontsize=14, pad=10)
+    ax.set_ylabel('Ground Level (m)', fontsize=12)
+    ax.tick_params(axis='both', labelsize=10)
+    ax.grid(True, linestyle='--', alpha=0.7)
+
+    # Text box with parameter predictions
+    ax = axes[1, 2]
+    ax.axis('off')
+    summary = ax.text(0.1, 0.95, '', fontsize=12, verticalalignment='top',
+                      bbox=dict(boxstyle='round', facecolor='white', alpha=0.8, edgecolor='gray'))
+
+    return {'fig': fig, 'panels': panels, 'summary': summary, 'subplot_params': _subplot_params(fig)}
+
+
+def _build_template_3d():
+    """Build the 3D parameter space figure with placeholder points"""
+    fig = Figure(figsize=(10, 8))
+    FigureCanvasAgg(fig)
+    ax = fig.add_subplot(111, projection='3d')
+
+    scatters = {name: ax.scatter(0, 0, 0, **style) for name, style in SCATTER_3D_STYLES.items()}
+    # Line connecting the two points
+    line, = ax.plot([0, 0], [0, 0], [0, 0], 'k--', alpha=0.5)
+
+    ax.set_xlabel('pH Level', fontsize=12, labelpad=15)
+    ax.set_ylabel('Conductivity (µmhos/cm)', fontsize=12, labelpad=15)
+    ax.set_zlabel('Temperature (°C)', fontsize=12, labelpad=15)
+    ax.set_title('Parameter Space Visualization', fontsize=16, pad=20)
+    ax.view_init(elev=25, azim=45)
+    ax.grid(True, linestyle='--', alpha=0.4)
+    ax.tick_params(axis='both', which='major', labelsize=10)
+    ax.legend(fontsize=12, bbox_to_anchor=(1.15, 0.9))
+
+    # The 3D layout doesn't depend on the plotted values, so it is computed once
+    fig.tight_layout(rect=[0, 0, 0.9, 1])
+
+    return {'fig': fig, 'ax': ax, 'line': line, **scatters}
+
+
+class TemplatePool:
+    """Pool of reusable figure templates; each render checks one out exclusively"""
+
+    def __init__(self, build, max_idle=MAX_IDLE_TEMPLATES):
+        self.build = build
+        self._idle = queue.LifoQueue(maxsize=max_idle)
+        self.built = 0
+
+    @contextmanager
+    def checkout(self):
+        try:
+            template = self._idle.get_nowait()
+        except queue.Empty:
+            template = self.build()
+            self.built += 1
+        yield template
+
+        # Only reached when the render succeeded; a failed one may leave artists half-updated
+        try:
+            self._idle.put_nowait(template)
+        except queue.Full:
+            pass
+
+    def stats(self):
+        return {'built': self.built, 'idle': self._idle.qsize()}
+
+
+_pools = {
+    '2d': TemplatePool(_build_template_2d),
+    '3d': TemplatePool(_build_template_3d),
+}
+
+
+def get_template_stats():
+    """Return how many templates each plot kind has built and how many are idle"""
+    return {kind: pool.stats() for kind, pool in _pools.items()}
+
+
+def _tight_layout(template, **kwargs):
+    """Lay out a template from its original subplot positions, as if it were a new figure"""
+    template['fig'].subplots_adjust(**template['subplot_params'])
+    template['fig'].tight_layout(**kwargs)
+
+
+def _save_png(fig):
+    buf = io.BytesIO()
+    fig.savefig(buf, **SAVE_OPTIONS)
+    return buf.getvalue()
+
+
+def render_plot_2d(pred_df, recharge_volume, recharge_percentage):
+    """Render the 2D parameter prediction dashboard as PNG bytes"""
+    values = {column: pred_df[column].values[0] for column in pred_df.columns}
+
+    with _pools['2d'].checkout() as template:
+        temperature, ph, recharge = template['panels']
+        _update_bar_panel(temperature, [values['Temperature Min'], values['Temperature Max']])
+        _update_bar_panel(ph, [values['pH Min'], values['pH Max']])
+        _update_bar_panel(recharge, [recharge_volume])
+
+        template['summary'].set_text(SUMMARY_TEMPLATE.format(
+            temp_min=values['Temperature Min'], temp_max=values['Temperature Max'],
+            ph_min=values['pH Min'], ph_max=values['pH Max'],
+            cond_min=values['Conductivity (µmhos/cm) Min'],
+            cond_max=values['Conductivity (µmhos/cm) Max'],
+            recharge_volume=recharge_volume, recharge_percentage=recharge_percentage,
+        ))
+
+        # Tick label widths depend on the values, so lay out on every render
+        _tight_layout(template, pad=1.0)
+        return _save_png(template['fig'])
+
+
+def render_plot_3d(pred_df):
+    """Render the 3D parameter space visualization as PNG bytes"""
+    xs = [pred_df['pH Min'].values[0], pred_df['pH Max'].values[0]]
+    ys = [pred_df['Conductivity (µmhos/cm) Min'].values[0], pred_df['Conductivity (µmhos/cm) Max'].values[0]]
+    zs = [pred_df['Temperature Min'].values[0], pred_df['Temperature Max'].values[0]]
+
+    with _pools['3d'].checkout() as template:
+        ax = template['ax']
+        # 3D scatters have no public setter for their points, so each is drawn anew;
+        # the legend keeps its own copies of the handles and is unaffected
+        for i, (name, style) in enumerate(SCATTER_3D_STYLES.items()):
+            template[name].remove()
+            template[name] = ax.scatter(xs[i], ys[i], zs[i], **style)
+        template['line'].set_data_3d(xs, ys, zs)
+
+        # Rescale to the new points, discarding the previous render's limits
+        ax.auto_scale_xyz(xs, ys, zs, had_data=False)
+
+        return _save_png(template['fig'])
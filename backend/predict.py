@@ -1,166 +1,491 @@
+"""
+Groundwater predictions from the CGWB station observations.
+
+The station and state label encodings the model was trained with are fitted
+once and saved next to the model as a preprocessor artifact, together with
+the observation column schema. Predictions load it and encode observations
+by vectorized lookup, so every station keeps its training code however the
+input is filtered or ordered.
+
+Running this module forecasts the observed stations into the API database's
+predictions table (or a Parquet file / SQLite database with --output). The
+stations are sharded across worker processes; forked workers share the
+parent's loaded model, spawned ones memory-map it with
+AQUAGUARD_MODEL_MMAP_MODE=r.
+
+    python predict.py --state WB --all-stations --years 2022-2026 --workers 8
+    python predict.py --station W12345 --output forecast.parquet
+    python predict.py --fit-preprocessor training.csv  # fit the encodings on the model's training data
+"""
+import argparse
+import multiprocessing
+import os
+import sys
+import time
+from datetime import datetime, timezone
+
 import pandas as pd
-import numpy as np
-from joblib import load
-import matplotlib.pyplot as plt
-from mpl_toolkits.mplot3d import Axes3D
-from sklearn.preprocessing import LabelEncoder
-
-# Load the trained model
-model = load('ground_water_predictor.pkl')
-
-# Load 2021 data
-df_2021 = pd.read_csv('Ground Water 2021.csv')
-
-# Preprocess function (same as training)
-def preprocess(df):
-    df = df.copy()
-    df = df.ffill()  # Updated to use ffill()
-    le_station = LabelEncoder()
-    le_state = LabelEncoder()
-    df['Station Name'] = le_station.fit_transform(df['Station Name'])
-    df['STATE'] = le_state.fit_transform(df['STATE'])
-    return df, le_station, le_state
-
-df_2021_processed, le_station, le_state = preprocess(df_2021)
-
-# Filter for Kalyani Industrial Area
-west_bengal_data = df_2021_processed[df_2021_processed['STATE'] == le_state.transform(['WEST BENGAL'])[0]]
-kalyani_data = west_bengal_data[west_bengal_data['Station Name'].astype(str).str.contains('KALYANI INDUSTRIAL AREA')]
-
-# Features for prediction
-X_pred = kalyani_data[[
+
+import database
+from inference import DATA_PATH, DATA_YEAR, FEATURE_COLUMNS, observations_version
+from model_registry import MODEL_PATH
+
+# Fitted encodings, kept beside the model they were trained with
+PREPROCESSOR_PATH = os.environ.get(
+    'AQUAGUARD_PREPROCESSOR_PATH',
+    os.path.join(os.path.dirname(os.path.abspath(MODEL_PATH)), 'ground_water_preprocessor.pkl')
+)
+
+# Observation columns used as features, in FEATURE_COLUMNS order
+OBSERVATION_COLUMNS = [
     'Station Name', 'STATE',
     'Temperature Min', 'Temperature Max',
     'pH Min', 'pH Max',
     'Conductivity (µmhos/cm) Min', 'Conductivity (µmhos/cm) Max'
-]]
-
-# Rename columns to match training feature names (with '_prev')
-X_pred.columns = [
-    'Station Name_prev', 'STATE_prev',
-    'Temperature Min_prev', 'Temperature Max_prev',
-    'pH Min_prev', 'pH Max_prev',
-    'Conductivity (µmhos/cm) Min_prev', 'Conductivity (µmhos/cm) Max_prev'
 ]
-predictions = model.predict(X_pred)
+# Columns label encoded for the model
+CATEGORICAL_COLUMNS = ['Station Name', 'STATE']
 
-# Create DataFrame for predictions
-pred_df = pd.DataFrame(predictions, columns=[
-    'Temperature Min', 'Temperature Max',
-    'pH Min', 'pH Max',
-    'Conductivity (µmhos/cm) Min', 'Conductivity (µmhos/cm) Max'
-])
-
-# Add station info
-pred_df['Station Code'] = kalyani_data['Station Code'].values
-pred_df['Station Name'] = 'KALYANI INDUSTRIAL AREA'
-pred_df['STATE'] = 'WEST BENGAL'
-
-def calculate_recharge_potential(row):
-    # Average values
-    avg_pH = (row['pH Min'] + row['pH Max']) / 2
-    avg_cond = (row['Conductivity (µmhos/cm) Min'] + row['Conductivity (µmhos/cm) Max']) / 2
-    avg_temp = (row['Temperature Min'] + row['Temperature Max']) / 2
-    
-    # pH factor (optimal range 6.5-8.5)
-    pH_factor = 1.0 - abs(7.5 - avg_pH) / 7.5
-    
-    # Conductivity factor (normalized, lower conductivity means better recharge)
-    cond_factor = 1.0 / (1.0 + avg_cond/5000)  # 5000 µmhos/cm as normalization factor
-    
-    # Temperature factor (normalized around optimal 25°C)
-    temp_factor = 1.0 - abs(25 - avg_temp) / 25
-    
-    # Combined quality factor (0-1 scale)
-    quality_factor = (pH_factor * 0.4 + cond_factor * 0.4 + temp_factor * 0.2)
-    
-    # Calculate recharge in Million Cubic Meters (MCM)
-    rainfall = 1.5  # meters/year
-    catchment_area = 100 * 1000000  # m² (100 km²)
-    base_recharge_coef = 0.20
-    
-    # Calculate potential recharge volume in MCM
-    recharge_volume_mcm = (rainfall * catchment_area * base_recharge_coef * quality_factor) / 1000000
-    
-    # Calculate percentage of maximum theoretical recharge
-    max_theoretical_recharge = rainfall * catchment_area * base_recharge_coef / 1000000
-    recharge_percentage = (recharge_volume_mcm / max_theoretical_recharge) * 100
-    
-    return recharge_volume_mcm, recharge_percentage
-
-# Calculate rechargeability
-recharge_results = pred_df.apply(calculate_recharge_potential, axis=1)
-pred_df['Recharge_Volume_MCM'] = [x[0] for x in recharge_results]
-pred_df['Recharge_Potential_Percent'] = [x[1] for x in recharge_results]
-
-# Print prediction summary for Kalyani
-print("\nKalyani Industrial Area - Groundwater Prediction Summary for 2022:")
-print("----------------------------------------")
-print("Temperature Prediction:")
-print(f"Min: {pred_df['Temperature Min'].values[0]:.2f}°C")
-print(f"Max: {pred_df['Temperature Max'].values[0]:.2f}°C")
-print("\npH Prediction:")
-print(f"Min: {pred_df['pH Min'].values[0]:.2f}")
-print(f"Max: {pred_df['pH Max'].values[0]:.2f}")
-print("\nConductivity Prediction:")
-print(f"Min: {pred_df['Conductivity (µmhos/cm) Min'].values[0]:.2f} µmhos/cm")
-print(f"Max: {pred_df['Conductivity (µmhos/cm) Max'].values[0]:.2f} µmhos/cm")
-print("\nRecharge Potential:")
-print(f"Volume: {pred_df['Recharge_Volume_MCM'].values[0]:.2f} MCM/year")
-print(f"Percentage: {pred_df['Recharge_Potential_Percent'].values[0]:.2f}%")
-
-# 2D Visualizations for Kalyani
-plt.figure(figsize=(15, 5))
-
-# Temperature prediction plot
-plt.subplot(131)
-plt.bar(['Min Temperature', 'Max Temperature'], 
-        [pred_df['Temperature Min'].values[0], pred_df['Temperature Max'].values[0]],
-        color=['blue', 'red'])
-plt.title('Temperature Prediction for 2022')
-plt.ylabel('Temperature (°C)')
-
-# pH prediction plot
-plt.subplot(132)
-plt.bar(['Min pH', 'Max pH'], 
-        [pred_df['pH Min'].values[0], pred_df['pH Max'].values[0]],
-        color=['green', 'orange'])
-plt.title('pH Prediction for 2022')
-plt.ylabel('pH Value')
-
-# Recharge prediction plot
-plt.subplot(133)
-plt.bar(['Recharge Volume'], [pred_df['Recharge_Volume_MCM'].values[0]], color='purple')
-plt.title('Predicted Recharge Volume')
-plt.ylabel('Million Cubic Meters/year')
-
-plt.tight_layout()
-plt.savefig('kalyani_2d_predictions.png')
-plt.close()
-
-# 3D Visualization for Kalyani
-fig = plt.figure(figsize=(10, 8))
-ax = fig.add_subplot(111, projection='3d')
-
-# Create points for current and predicted values
-ax.scatter(pred_df['pH Min'].values[0], 
-          pred_df['Conductivity (µmhos/cm) Min'].values[0], 
-          pred_df['Temperature Min'].values[0], 
-          color='blue', label='Minimum Values')
-ax.scatter(pred_df['pH Max'].values[0], 
-          pred_df['Conductivity (µmhos/cm) Max'].values[0], 
-          pred_df['Temperature Max'].values[0], 
-          color='red', label='Maximum Values')
-
-ax.set_xlabel('pH')
-ax.set_ylabel('Conductivity (µmhos/cm)')
-ax.set_zlabel('Temperature (°C)')
-ax.set_title('3D Parameter Space for Kalyani Industrial Area')
-ax.legend()
-
-plt.savefig('kalyani_3d_visualization.png')
-plt.close()
-
-print('\nVisualizations saved as:')
-print('1. kalyani_2d_predictions.png')
-print('2. kalyani_3d_visualization.png')
+# Types the observations are read with; other columns in the file are skipped
+OBSERVATION_DTYPES = {
+    'Station Code': 'string',
+    **{column: 'category' for column in CATEGORICAL_COLUMNS},
+    **{column: 'float64' for column in OBSERVATION_COLUMNS if column not in CATEGORICAL_COLUMNS},
+}
+
+# Forecast worker processes and the stations handed to each task at most
+FORECAST_WORKERS = int(os.environ.get('AQUAGUARD_PREDICT_WORKERS', str(os.cpu_count() or 1)))
+SHARD_ROWS = int(os.environ.get('AQUAGUARD_PREDICT_SHARD_ROWS', '50000'))
+FORECAST_START_METHOD = os.environ.get(
+    'AQUAGUARD_PREDICT_START_METHOD',
+    'fork' if 'fork' in multiprocessing.get_all_start_methods() else 'spawn'
+)
+
+# ISO 3166-2:IN codes accepted for --state
+STATE_CODES = {
+    'AN': 'ANDAMAN AND NICOBAR ISLANDS', 'AP': 'ANDHRA PRADESH', 'AR': 'ARUNACHAL PRADESH',
+    'AS': 'ASSAM', 'BR': 'BIHAR', 'CH': 'CHANDIGARH', 'CT': 'CHHATTISGARH',
+    'DH': 'DADRA AND NAGAR HAVELI AND DAMAN AND DIU', 'DL': 'DELHI', 'GA': 'GOA', 'GJ': 'GUJARAT',
+    'HP': 'HIMACHAL PRADESH', 'HR': 'HARYANA', 'JH': 'JHARKHAND', 'JK': 'JAMMU AND KASHMIR',
+    'KA': 'KARNATAKA', 'KL': 'KERALA', 'LA': 'LADAKH', 'LD': 'LAKSHADWEEP', 'MH': 'MAHARASHTRA',
+    'ML': 'MEGHALAYA', 'MN': 'MANIPUR', 'MP': 'MADHYA PRADESH', 'MZ': 'MIZORAM', 'NL': 'NAGALAND',
+    'OR': 'ODISHA', 'PB': 'PUNJAB', 'PY': 'PUDUCHERRY', 'RJ': 'RAJASTHAN', 'SK': 'SIKKIM',
+    'TG': 'TELANGANA', 'TN': 'TAMIL NADU', 'TR': 'TRIPURA', 'UP': 'UTTAR PRADESH',
+    'UT': 'UTTARAKHAND', 'WB': 'WEST BENGAL',
+}
+
+_preprocessor = None
+# The model forecast workers predict with
+_forecast_model = None
+# (path, version, X, row by station code, details) of the observations station_features() read
+_stations = None
+
+
+def load_observations(path=DATA_PATH):
+    """Read the station observations CSV"""
+    return pd.read_csv(path, usecols=list(OBSERVATION_DTYPES), dtype=OBSERVATION_DTYPES)
+
+
+def fit_preprocessor(df, source=None):
+    """
+    Fit the label encodings of the categorical columns.
+
+    Codes are positions in the sorted distinct values, as LabelEncoder
+    assigns them, so a preprocessor fitted on the training observations
+    reproduces the codes the model was trained with.
+    """
+    df = df.ffill()
+    return {
+        'feature_columns': list(FEATURE_COLUMNS),
+        'observation_dtypes': dict(OBSERVATION_DTYPES),
+        'categories': {
+            column: sorted(df[column].dropna().astype(str).unique())
+            for column in CATEGORICAL_COLUMNS
+        },
+        'source': source,
+        'fitted_at': datetime.now(timezone.utc).isoformat(),
+    }
+
+
+def save_preprocessor(preprocessor, path=PREPROCESSOR_PATH):
+    """Save a fitted preprocessor with joblib"""
+    from joblib import dump
+
+    # Written aside and renamed, so a reader never loads a partial file
+    tmp_path = f"{path}.tmp"
+    dump(preprocessor, tmp_path)
+    os.replace(tmp_path, path)
+
+
+def get_preprocessor(path=PREPROCESSOR_PATH):
+    """
+    Load the fitted preprocessor, once per process.
+
+    Raises FileNotFoundError when there is none: only encodings fitted on the
+    model's training data give its codes, so they are never fitted here.
+    """
+    global _preprocessor
+    if _preprocessor is None or _preprocessor[0] != path:
+        from joblib import load
+
+        if not os.path.exists(path):
+            raise FileNotFoundError(
+                f"no preprocessor at {path}; fit it on the model's training data with "
+                f"python predict.py --fit-preprocessor <training.csv>"
+            )
+        preprocessor = load(path)
+        if preprocessor['feature_columns'] != FEATURE_COLUMNS:
+            raise ValueError(f"{path} was fitted for other features; refit it with --fit-preprocessor")
+        _preprocessor = (path, preprocessor)
+    return _preprocessor[1]
+
+
+def encode_observations(df, preprocessor=None):
+    """
+    Encode observations into model features.
+
+    Returns (X, known): X has FEATURE_COLUMNS, and known marks the rows whose
+    station and state the preprocessor has codes for; the others are encoded
+    as -1 and can't be predicted.
+    """
+    preprocessor = preprocessor or get_preprocessor()
+    df = df.ffill()  # Same filling as training
+    X = df[OBSERVATION_COLUMNS].copy()
+    known = pd.Series(True, index=df.index)
+    for column in CATEGORICAL_COLUMNS:
+        codes = pd.Categorical(df[column].astype(str), categories=preprocessor['categories'][column]).codes
+        X[column] = codes
+        known &= codes >= 0
+    X.columns = FEATURE_COLUMNS
+    return X, known
+
+
+def state_features(df, state, preprocessor=None):
+    """
+    Feature rows for every station observed in a state.
+
+    Returns (X, stations): X has FEATURE_COLUMNS, and stations holds each
+    row's station code and name. Raises ValueError for an unknown state.
+    """
+    state = state.strip().upper()
+    if state not in set(df['STATE'].dropna().astype(str)):
+        raise ValueError(f"no observations for state {state}")
+
+    X, known = encode_observations(df, preprocessor)
+    mask = known & (df['STATE'].astype(str) == state).to_numpy()
+    if not mask.any():
+        raise ValueError(f"state {state} was not in the model's training data")
+    stations = [
+        {'code': str(code), 'name': name}
+        for code, name in zip(df.loc[mask, 'Station Code'], df.loc[mask, 'Station Name'].astype(str))
+    ]
+    return X[mask], stations
+
+
+def station_features(code, path=DATA_PATH):
+    """
+    Feature row of one observed station, by station code, with its name and state.
+
+    The encoded observations are kept until the file changes, so lookups
+    after the first don't read it again. Returns (features, details), or None
+    for a station that isn't observed, that the preprocessor doesn't know, or
+    when there is no observations file.
+    """
+    global _stations
+    version = observations_version(path)
+    if version is None:
+        return None
+    if _stations is None or _stations[:2] != (path, version):
+        df = load_observations(path)
+        X, known = encode_observations(df)
+        known = known.to_numpy()
+        rows = {code: row for row, code in enumerate(df['Station Code'].astype(str)) if known[row]}
+        details = list(zip(df['STATE'].astype(str), df['Station Name'].astype(str)))
+        _stations = (path, version, X.to_numpy(), rows, details)
+
+    _, _, X, rows, details = _stations
+    row = rows.get(code)
+    if row is None:
+        return None
+    state_name, station_name = details[row]
+    return X[row].tolist(), {'state_name': state_name, 'station_name': station_name}
+
+
+def predict_observations(model, df, preprocessor=None, state=None):
+    """
+    Predict next year's values for every observation row, or a state's rows,
+    in one model call.
+
+    Returns (predictions, skipped): a DataFrame with each predicted row's
+    station code, name and state, TARGET_COLUMNS and the recharge columns,
+    and the number of rows skipped for stations the preprocessor doesn't know.
+    """
+    from inference import predict_features
+    from recharge import add_recharge_columns
+
+    X, known = encode_observations(df, preprocessor)
+    if state:
+        in_state = (df['STATE'].astype(str) == state.strip().upper()).to_numpy()
+        X, df, known = X[in_state], df[in_state], known[in_state]
+    pred_df = predict_features(model, X[known].to_numpy())
+    add_recharge_columns(pred_df)
+
+    stations = df.loc[known, ['Station Code', 'Station Name', 'STATE']].reset_index(drop=True)
+    predictions = pd.concat([stations.astype({'Station Name': str, 'STATE': str}), pred_df], axis=1)
+    return predictions, int((~known).sum())
+
+
+def write_predictions(predictions, path):
+    """
+    Write predictions to a Parquet file (.parquet) or the predictions table of a SQLite database.
+
+    Rows are upserted on (station_code, model_version, target_year), so the
+    API database's table keeps its key and indexes; a new database gets the
+    same table.
+    """
+    if path.endswith('.parquet'):
+        # Needs pyarrow or fastparquet; pandas names them in its ImportError
+        predictions.to_parquet(path, index=False)
+        return
+
+    import sqlite3
+
+    import migrations
+
+    key = ('station_code', 'model_version', 'target_year')
+    updated = [column for column in database.PREDICTION_COLUMNS if column not in key]
+    sql = (f"INSERT INTO predictions ({', '.join(database.PREDICTION_COLUMNS)}) "
+           f"VALUES ({', '.join('?' * len(database.PREDICTION_COLUMNS))}) "
+           f"ON CONFLICT ({', '.join(key)}) DO UPDATE SET "
+           + ', '.join(f"{column} = excluded.{column}" for column in updated))
+    conn = sqlite3.connect(path)
+    try:
+        migrations.create_predictions_table(conn.cursor())
+        rows = predictions[list(database.PREDICTION_COLUMNS)].itertuples(index=False, name=None)
+        conn.executemany(sql, rows)
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def _init_forecast_worker(model_path):
+    global _forecast_model
+    # Forked workers inherit the parent's loaded model; spawned ones load it,
+    # memory-mapped when AQUAGUARD_MODEL_MMAP_MODE is set
+    if _forecast_model is None:
+        import model_registry
+        model_registry.MODEL_PATH = model_path
+        _forecast_model = model_registry.get_model()
+
+
+def _forecast_shard(X, years):
+    """
+    Forecast a shard of feature rows years ahead.
+
+    Returns (values, seconds): values[step][row] holds TARGET_COLUMNS and the
+    recharge volume and percentage, and seconds the time the shard took.
+    """
+    import numpy as np
+
+    from inference import forecast_features
+    from recharge import add_recharge_columns
+
+    started = time.perf_counter()
+    values = np.stack([add_recharge_columns(pred_df).to_numpy()
+                       for pred_df in forecast_features(_forecast_model, X, years)])
+    return values, time.perf_counter() - started
+
+
+def forecast_stations(model, X, years, workers=FORECAST_WORKERS, shard_size=None, on_shard=None):
+    """
+    Forecast every row of the feature matrix X years ahead, sharded across
+    worker processes.
+
+    on_shard(start, values) is called in this process as each shard of rows
+    from start completes, in completion order, with values as returned by
+    _forecast_shard. Returns the seconds the workers spent forecasting.
+    """
+    global _forecast_model
+    import numpy as np
+
+    X = np.asarray(X, dtype=np.float64)
+    shard_size = shard_size or max(1, min(SHARD_ROWS, -(-len(X) // (max(workers, 1) * 4))))
+    shards = [(start, X[start:start + shard_size]) for start in range(0, len(X), shard_size)]
+    worker_seconds = 0.0
+
+    _forecast_model = model
+    if workers <= 1:
+        for start, rows in shards:
+            values, seconds = _forecast_shard(rows, years)
+            worker_seconds += seconds
+            on_shard(start, values)
+        return worker_seconds
+
+    import gc
+    import multiprocessing
+    from concurrent.futures import ProcessPoolExecutor, as_completed
+
+    from model_registry import MODEL_PATH
+
+    context = multiprocessing.get_context(FORECAST_START_METHOD)
+    if FORECAST_START_METHOD == 'fork':
+        # Keep the collector from touching (and so copying) the shared model's pages
+        gc.freeze()
+    else:
+        _forecast_model = None
+    try:
+        with ProcessPoolExecutor(workers, mp_context=context, initializer=_init_forecast_worker,
+                                 initargs=(MODEL_PATH,)) as executor:
+            futures = {executor.submit(_forecast_shard, rows, years): start for start, rows in shards}
+            for future in as_completed(futures):
+                values, seconds = future.result()
+                worker_seconds += seconds
+                on_shard(futures[future], values)
+    finally:
+        _forecast_model = None
+        gc.unfreeze()
+    return worker_seconds
+
+
+def _state_name(value):
+    name = value.strip().upper()
+    return STATE_CODES.get(name, name)
+
+
+def _year_range(value):
+    first, sep, last = value.partition('-')
+    try:
+        first = int(first)
+        last = int(last) if sep else first
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected a year or a range like 2022-2026, got {value!r}")
+    if last < first:
+        raise argparse.ArgumentTypeError(f"{value} ends before it starts")
+    return first, last
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description='Forecast groundwater values for observed stations')
+    parser.add_argument('--data', default=DATA_PATH, help='observations CSV')
+    parser.add_argument('--state', type=_state_name, help='only forecast one state, by name or code (e.g. WB)')
+    stations = parser.add_mutually_exclusive_group()
+    stations.add_argument('--all-stations', action='store_true', help='forecast every station (the default)')
+    stations.add_argument('--station', action='append', help='station code or name to forecast (repeatable)')
+    parser.add_argument('--years', type=_year_range, default=(DATA_YEAR + 1, DATA_YEAR + 1),
+                        help=f'target year or range (default: {DATA_YEAR + 1})')
+    parser.add_argument('--workers', type=int, default=FORECAST_WORKERS, help='worker processes')
+    parser.add_argument('--shard-size', type=int, help='stations per worker task')
+    parser.add_argument('--output', help='write to a .parquet file or SQLite database instead of the API database')
+    parser.add_argument('--fit-preprocessor', metavar='TRAINING_CSV',
+                        help="fit the encodings on the model's training data and save them, replacing the saved ones")
+    args = parser.parse_args(argv)
+
+    if args.fit_preprocessor:
+        preprocessor = fit_preprocessor(load_observations(args.fit_preprocessor), args.fit_preprocessor)
+        save_preprocessor(preprocessor)
+        print(f"Saved the preprocessor for {len(preprocessor['categories']['Station Name']):,} stations "
+              f"and {len(preprocessor['categories']['STATE']):,} states to {PREPROCESSOR_PATH}")
+        return 0
+
+    timings = {}
+    start = time.perf_counter()
+    df = load_observations(args.data)
+    timings['load'] = time.perf_counter() - start
+
+    first_year, last_year = args.years
+    if first_year <= DATA_YEAR:
+        print(f"Forecasts start after the {DATA_YEAR} observations")
+        return 1
+    if args.state and args.state not in set(df['STATE'].dropna().astype(str)):
+        print(f"No observations for state {args.state}")
+        return 1
+
+    import model_registry
+
+    start = time.perf_counter()
+    try:
+        preprocessor = get_preprocessor()
+    except FileNotFoundError as e:
+        print(f"Error: {e}")
+        return 1
+    model = model_registry.get_model()
+    model_version = model_registry.get_model_version()
+    timings['model'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    X, known = encode_observations(df, preprocessor)
+    selected = known.to_numpy().copy()
+    if args.state:
+        selected &= (df['STATE'].astype(str) == args.state).to_numpy()
+    if args.station:
+        wanted = set(args.station)
+        selected &= (df['Station Code'].isin(wanted) | df['Station Name'].astype(str).isin(wanted)).to_numpy()
+    skipped = int((~known.to_numpy()).sum())
+    X = X[selected].to_numpy()
+    stations = list(zip(df.loc[selected, 'Station Code'].astype(str),
+                        df.loc[selected, 'STATE'].astype(str),
+                        df.loc[selected, 'Station Name'].astype(str)))
+    timings['encode'] = time.perf_counter() - start
+    if not stations:
+        print("No stations to forecast")
+        return 1
+
+    if args.output is None:
+        database.migrate_database()
+    source_version = observations_version(args.data)
+    created_at = datetime.now(timezone.utc).isoformat()
+    first_step = first_year - DATA_YEAR - 1
+    written = []
+    progress = {'stations': 0, 'write': 0.0, 'failed': False}
+    started = time.perf_counter()
+
+    def on_shard(shard_start, values):
+        rows = [
+            (code, model_version, DATA_YEAR + step + 1, state, name, DATA_YEAR, *values[step, row].tolist(),
+             source_version, created_at)
+            for step in range(first_step, len(values))
+            for row, (code, state, name) in enumerate(stations[shard_start:shard_start + values.shape[1]])
+        ]
+        write_start = time.perf_counter()
+        if args.output is None:
+            progress['failed'] |= not database.save_predictions(rows)
+        else:
+            written.extend(rows)
+        progress['write'] += time.perf_counter() - write_start
+        progress['stations'] += values.shape[1]
+        elapsed = time.perf_counter() - started
+        print(f"  {progress['stations']:,}/{len(stations):,} stations "
+              f"({progress['stations'] / elapsed:,.0f} stations/s)")
+
+    worker_seconds = forecast_stations(model, X, last_year - DATA_YEAR, args.workers, args.shard_size, on_shard)
+    timings['forecast'] = time.perf_counter() - started - progress['write']
+    timings['write'] = progress['write']
+    if progress['failed']:
+        return 1
+    if args.output is None:
+        # Forecasts of replaced models are never served again
+        stale = database.delete_stale_predictions(model_version)
+        if stale:
+            print(f"Deleted {stale:,} predictions of earlier models")
+
+    if args.output is not None:
+        start = time.perf_counter()
+        try:
+            write_predictions(pd.DataFrame(written, columns=database.PREDICTION_COLUMNS), args.output)
+        except ImportError as e:
+            print(f"Error writing {args.output}: {e}")
+            return 1
+        timings['write'] += time.perf_counter() - start
+
+    years = f"{first_year}-{last_year}" if last_year > first_year else str(first_year)
+    total = sum(timings.values())
+    print(f"Forecast {len(stations):,} stations for {years} with model {model_version} into "
+          f"{args.output or 'the predictions table'} in {total:.2f} s ({len(stations) / total:,.0f} stations/s)"
+          + (f"; {skipped:,} skipped: not in the preprocessor" if skipped else ""))
+    print('  ' + '   '.join(f"{stage} {seconds:.2f} s" for stage, seconds in timings.items())
+          + f"   (workers busy {worker_seconds:.2f} s)")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,195 @@
+"""
+Asynchronous prediction jobs for runs too large for one HTTP request.
+
+A job forecasts a list of stations, or every observed station in a state, one
+or more years ahead. Jobs and their per-station results are stored in SQLite.
+Worker threads claim queued jobs, predict them a chunk of stations at a time
+through the job pool and save each chunk's results together with the job's
+progress. A job whose worker stops reporting progress (e.g. its process was
+restarted) is claimed again after LEASE_SECONDS and resumes after its last
+saved chunk.
+
+API processes start WORKERS threads each; with AQUAGUARD_PREDICTION_JOB_WORKERS=0
+jobs can instead be run by a separate process:
+
+    python prediction_jobs.py --workers 2
+"""
+import argparse
+import multiprocessing
+import os
+import socket
+import threading
+import time
+import uuid
+
+import database
+from inference import DATA_YEAR, observations_version
+from jobs import JobPool, JobQueueFull
+import tasks
+
+WORKERS = int(os.environ.get('AQUAGUARD_PREDICTION_JOB_WORKERS', '1'))
+CHUNK_ROWS = int(os.environ.get('AQUAGUARD_PREDICTION_JOB_CHUNK_ROWS', '500'))
+LEASE_SECONDS = float(os.environ.get('AQUAGUARD_PREDICTION_JOB_LEASE', '300'))
+POLL_INTERVAL = float(os.environ.get('AQUAGUARD_PREDICTION_JOB_POLL_INTERVAL', '2'))
+
+# Request limits
+MAX_STATIONS = int(os.environ.get('AQUAGUARD_PREDICTION_JOB_MAX_STATIONS', '100000'))
+MAX_YEARS = 10
+
+# Set when a job is queued so idle workers in this process pick it up at once
+_wake = threading.Event()
+_started_pid = None
+_start_lock = threading.Lock()
+
+
+def validate_request(body):
+    """
+    Check a job request body and return the normalized request to store.
+
+    The body holds either stations (as for the batch endpoint) or state, plus
+    optional years (default 1) and from_year, the year of the input
+    measurements. Only the request's shape is checked here; stations and
+    states are looked up when the job runs, and fail the job if unknown.
+    Raises ValueError for an invalid request.
+    """
+    if not isinstance(body, dict):
+        raise ValueError('request body must be a JSON object')
+
+    years = body.get('years', 1)
+    if isinstance(years, bool) or not isinstance(years, int) or not 1 <= years <= MAX_YEARS:
+        raise ValueError(f'years must be an integer between 1 and {MAX_YEARS}')
+    from_year = body.get('from_year')
+    if from_year is not None and (isinstance(from_year, bool) or not isinstance(from_year, int)):
+        raise ValueError('from_year must be an integer')
+
+    if ('stations' in body) == ('state' in body):
+        raise ValueError('request needs either stations or state')
+    if 'stations' in body:
+        stations = body['stations']
+        if not isinstance(stations, list) or not stations:
+            raise ValueError('stations must be a non-empty list')
+        if len(stations) > MAX_STATIONS:
+            raise ValueError(f'at most {MAX_STATIONS} stations per job')
+        return {'stations': stations, 'years': years, 'from_year': from_year}
+
+    if not isinstance(body['state'], str) or not body['state'].strip():
+        raise ValueError('state must be a non-empty string')
+    return {
+        'state': body['state'].strip().upper(),
+        'years': years,
+        'from_year': DATA_YEAR if from_year is None else from_year,
+        # Results are saved by row position, which only holds for the same observations
+        'source_version': observations_version(),
+    }
+
+
+def submit_job(body):
+    """Validate and queue a job; returns its id. Raises ValueError for an invalid request."""
+    request = validate_request(body)
+    job_id = uuid.uuid4().hex
+    if not database.create_prediction_job(job_id, request):
+        raise RuntimeError('could not store prediction job')
+    _wake.set()
+    return job_id
+
+
+def _run(pool, fn, *args):
+    """Run fn(*args) in the job pool, waiting out a full queue"""
+    while True:
+        try:
+            return pool.run(None, fn, *args)
+        except JobQueueFull as e:
+            time.sleep(e.retry_after)
+
+
+def _forecast_entries(forecast, from_year):
+    entries = []
+    for step, predictions in enumerate(forecast, start=1):
+        entry = {'step': step, 'predictions': predictions}
+        if from_year is not None:
+            entry['year'] = from_year + step
+        entries.append(entry)
+    return entries
+
+
+def run_job(pool, job, worker):
+    """Run a claimed job from its last saved chunk to the end"""
+    request = job['request']
+    try:
+        # Resolved in the pool, so the API process doesn't load pandas and the observations
+        results, rows, recharge_params = _run(pool, tasks.resolve_job_rows, request)
+        for start in range(job['completed_rows'], len(results), CHUNK_ROWS):
+            chunk = results[start:start + CHUNK_ROWS]
+            chunk_rows = [result['row'] for result in chunk if 'row' in result]
+            forecasts = []
+            if chunk_rows:
+                forecasts = _run(
+                    pool,
+                    tasks.forecast_rows,
+                    [rows[row] for row in chunk_rows],
+                    request['years'],
+                    {name: [values[row] for row in chunk_rows] for name, values in recharge_params.items()}
+                )
+
+            forecasts = iter(forecasts)
+            saved = []
+            for result in chunk:
+                result = dict(result)
+                if result.pop('row', None) is not None:
+                    result['forecast'] = _forecast_entries(next(forecasts), request['from_year'])
+                saved.append(result)
+
+            if not database.save_prediction_job_results(job['id'], worker, start, saved, len(results)):
+                print(f"Prediction job {job['id']} was taken over by another worker")
+                return
+        database.finish_prediction_job(job['id'], worker)
+    except Exception as e:
+        print(f"Error running prediction job {job['id']}: {e}")
+        database.finish_prediction_job(job['id'], worker, error=str(e))
+
+
+def _work(pool, worker):
+    while True:
+        # Cleared before looking, so a job queued meanwhile still wakes us
+        _wake.clear()
+        job = database.claim_prediction_job(worker, LEASE_SECONDS)
+        if job is None:
+            _wake.wait(POLL_INTERVAL)
+            continue
+        print(f"Worker {worker} running prediction job {job['id']}")
+        run_job(pool, job, worker)
+
+
+def start_workers(pool, count=WORKERS):
+    """Start count background worker threads in this process, once"""
+    global _started_pid
+    # Spawned job pool processes re-import the app's main module; they only run pool work
+    if multiprocessing.parent_process() is not None:
+        return
+    with _start_lock:
+        if count <= 0 or _started_pid == os.getpid():
+            return
+        _started_pid = os.getpid()
+        for index in range(count):
+            worker = f"{socket.gethostname()}:{os.getpid()}:{index}"
+            threading.Thread(target=_work, args=(pool, worker), name=f'prediction-job-{index}',
+                             daemon=True).start()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run asynchronous prediction jobs')
+    parser.add_argument('--workers', type=int, default=max(WORKERS, 1), help='jobs run at the same time')
+    args = parser.parse_args()
+
+    database.migrate_database()
+    start_workers(JobPool(), args.workers)
+    print(f"Running prediction jobs from {database.DB_PATH} with {args.workers} worker(s)")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
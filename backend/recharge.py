@@ -0,0 +1,83 @@
+"""
+Groundwater recharge potential from predicted water quality parameters.
+
+NumPy is imported inside the functions that need it, so the API can read the
+default parameters without loading it.
+"""
+
+# Default site parameters
+RAINFALL_M = 1.5  # meters/year
+CATCHMENT_AREA_M2 = 100 * 1000000  # m² (100 km²)
+RECHARGE_COEF = 0.20
+
+# Per-station parameters API callers may override, with their defaults
+RECHARGE_PARAMS = {
+    'rainfall': RAINFALL_M,
+    'catchment_area': CATCHMENT_AREA_M2,
+    'recharge_coef': RECHARGE_COEF,
+}
+
+
+def recharge_param(item, name):
+    """Read a positive recharge parameter from a request item, falling back to the default"""
+    value = item.get(name, RECHARGE_PARAMS[name])
+    if isinstance(value, bool) or not isinstance(value, (int, float)) or not 0 < value < float('inf'):
+        raise ValueError(f'{name} must be a positive number')
+    return float(value)
+
+
+def quality_factor(pred_df):
+    """Combined 0-1 water quality factor for every row of predicted parameters"""
+    import numpy as np
+
+    # Average values
+    avg_pH = (pred_df['pH Min'].to_numpy(dtype=np.float64) + pred_df['pH Max'].to_numpy(dtype=np.float64)) / 2
+    avg_cond = (pred_df['Conductivity (µmhos/cm) Min'].to_numpy(dtype=np.float64)
+                + pred_df['Conductivity (µmhos/cm) Max'].to_numpy(dtype=np.float64)) / 2
+    avg_temp = (pred_df['Temperature Min'].to_numpy(dtype=np.float64)
+                + pred_df['Temperature Max'].to_numpy(dtype=np.float64)) / 2
+
+    # pH factor (optimal range 6.5-8.5)
+    pH_factor = 1.0 - np.abs(7.5 - avg_pH) / 7.5
+
+    # Conductivity factor (normalized, lower conductivity means better recharge)
+    cond_factor = 1.0 / (1.0 + avg_cond / 5000)  # 5000 µmhos/cm as normalization factor
+
+    # Temperature factor (normalized around optimal 25°C)
+    temp_factor = 1.0 - np.abs(25 - avg_temp) / 25
+
+    return pH_factor * 0.4 + cond_factor * 0.4 + temp_factor * 0.2
+
+
+def calculate_recharge_potential(pred_df, rainfall=RAINFALL_M, catchment_area=CATCHMENT_AREA_M2,
+                                 recharge_coef=RECHARGE_COEF):
+    """
+    Compute recharge volume (MCM/year) and percentage of the theoretical maximum.
+
+    Works on whole columns of predictions at once. rainfall (m/year),
+    catchment_area (m²) and recharge_coef may be scalars or arrays with one
+    value per row. Returns two NumPy arrays: volume and percentage.
+    """
+    import numpy as np
+
+    rainfall = np.asarray(rainfall, dtype=np.float64)
+    catchment_area = np.asarray(catchment_area, dtype=np.float64)
+    recharge_coef = np.asarray(recharge_coef, dtype=np.float64)
+
+    # Calculate potential recharge volume in MCM
+    recharge_volume_mcm = (rainfall * catchment_area * recharge_coef * quality_factor(pred_df)) / 1000000
+
+    # Calculate percentage of maximum theoretical recharge
+    max_theoretical_recharge = rainfall * catchment_area * recharge_coef / 1000000
+    with np.errstate(divide='ignore', invalid='ignore'):
+        recharge_percentage = (recharge_volume_mcm / max_theoretical_recharge) * 100
+
+    return recharge_volume_mcm, recharge_percentage
+
+
+def add_recharge_columns(pred_df, **params):
+    """Add Recharge_Volume_MCM and Recharge_Potential_Percent columns to pred_df in place"""
+    volume, percentage = calculate_recharge_potential(pred_df, **params)
+    pred_df['Recharge_Volume_MCM'] = volume
+    pred_df['Recharge_Potential_Percent'] = percentage
+    return pred_df
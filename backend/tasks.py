@@ -0,0 +1,158 @@
+"""
+Prediction and plot rendering work run by the job pool.
+
+Every function here is module-level and takes and returns picklable values,
+so it can run in a worker process as well as inline.
+"""
+from inference import (
+    STATION_SAMPLES, TARGET_COLUMNS, forecast_features, observations_version, predict_features, resolve_stations
+)
+from model_registry import get_model, get_model_info, get_model_version, reload_model
+from recharge import RECHARGE_PARAMS, calculate_recharge_potential
+
+
+def summarize_prediction(row, recharge_volume, recharge_percentage):
+    """Shape one row of model output and its recharge potential for API responses"""
+    return {
+        'temperature': {
+            'min': float(row['Temperature Min']),
+            'max': float(row['Temperature Max'])
+        },
+        'pH': {
+            'min': float(row['pH Min']),
+            'max': float(row['pH Max'])
+        },
+        'conductivity': {
+            'min': float(row['Conductivity (µmhos/cm) Min']),
+            'max': float(row['Conductivity (µmhos/cm) Max'])
+        },
+        'recharge': {
+            'volume': float(recharge_volume),
+            'percentage': float(recharge_percentage)
+        }
+    }
+
+
+def prediction_frame(predictions):
+    """One-row DataFrame of TARGET_COLUMNS from a summarize_prediction() summary"""
+    import pandas as pd
+
+    return pd.DataFrame([[
+        predictions['temperature']['min'], predictions['temperature']['max'],
+        predictions['pH']['min'], predictions['pH']['max'],
+        predictions['conductivity']['min'], predictions['conductivity']['max'],
+    ]], columns=TARGET_COLUMNS)
+
+
+def predict_rows(rows, chunk_size, recharge_params):
+    """Predict a feature matrix with vectorized model calls and summarize every row"""
+    pred_df = predict_features(get_model(), rows, chunk_size)
+    recharge_volumes, recharge_percentages = calculate_recharge_potential(pred_df, **recharge_params)
+    return [
+        summarize_prediction(row, volume, percentage)
+        for row, volume, percentage in zip(pred_df.to_dict('records'), recharge_volumes, recharge_percentages)
+    ]
+
+
+def predict_stations(stations, chunk_size):
+    """
+    Resolve batch station items as resolve_stations does and predict the valid
+    ones; returns one result per item with its predictions or error.
+
+    Resolved here rather than by the caller, so looking up observed stations
+    loads pandas and the observations in the worker.
+    """
+    results, rows, recharge_params = resolve_stations(stations)
+    predictions = predict_rows(rows, chunk_size, recharge_params) if rows else []
+    for result in results:
+        row = result.pop('row', None)
+        if row is not None:
+            result['predictions'] = predictions[row]
+    return results
+
+
+def resolve_job_rows(request):
+    """
+    Return (results, rows, recharge_params) for a stored prediction job
+    request, as resolve_stations does; a state job gets one row per station
+    observed in the state.
+
+    Raises ValueError for a state job whose observations file changed since
+    it was submitted, as its rows, and the saved results' positions, would
+    belong to other stations.
+    """
+    if 'stations' in request:
+        return resolve_stations(request['stations'])
+
+    version = observations_version()
+    if version is None:
+        raise ValueError('state forecasts need the groundwater observations file, which is not available')
+    if 'source_version' in request and version != request['source_version']:
+        raise ValueError('the observations changed since the job was submitted; submit it again')
+
+    from predict import load_observations, state_features
+
+    X, stations = state_features(load_observations(), request['state'])
+    results = [{'id': station['code'], 'station': station['name'], 'row': row}
+               for row, station in enumerate(stations)]
+    recharge_params = {name: [value] * len(stations) for name, value in RECHARGE_PARAMS.items()}
+    return results, X.to_numpy().tolist(), recharge_params
+
+
+def forecast_rows(rows, years, recharge_params):
+    """Forecast a feature matrix years ahead; returns each row's per-year summaries"""
+    forecasts = [[] for _ in rows]
+    for pred_df in forecast_features(get_model(), rows, years):
+        recharge_volumes, recharge_percentages = calculate_recharge_potential(pred_df, **recharge_params)
+        for forecast, row, volume, percentage in zip(forecasts, pred_df.to_dict('records'),
+                                                     recharge_volumes, recharge_percentages):
+            forecast.append(summarize_prediction(row, volume, percentage))
+    return forecasts
+
+
+def forecast_station(station, years, model_version=None):
+    """
+    Forecast a sample city (by STATION_SAMPLES name) or an observed station
+    (by code) years ahead.
+
+    With model_version, a different loaded model is reloaded first, so the
+    forecast comes from the model file the caller looked its stored rows up
+    by, not the one loaded before the file was replaced. Returns
+    (model_version, details, summaries): the version of the model used, the
+    station's name and state and one summary per year. Returns None for a
+    station without observations.
+    """
+    sample = STATION_SAMPLES.get(station)
+    if sample is not None:
+        # The city's representative sample, e.g. typical West Bengal values for Kalyani
+        row, details = sample, {'state_name': None, 'station_name': station.title()}
+    else:
+        # Deferred so only forecasts of observed stations load pandas and the observations
+        from predict import station_features
+
+        found = station_features(station)
+        if found is None:
+            return None
+        row, details = found
+    if model_version is not None and get_model_version() != model_version:
+        reload_model()
+    model_version = get_model_version()
+    recharge_params = {name: [value] for name, value in RECHARGE_PARAMS.items()}
+    return model_version, details, forecast_rows([row], years, recharge_params)[0]
+
+
+def render_plot(kind, predictions):
+    """Render a 2d or 3d plot of a prediction summary as PNG bytes"""
+    # Deferred so matplotlib is only imported once a plot is rendered
+    from plots import render_plot_2d, render_plot_3d
+
+    pred_df = prediction_frame(predictions)
+    if kind == '2d':
+        return render_plot_2d(pred_df, predictions['recharge']['volume'], predictions['recharge']['percentage'])
+    return render_plot_3d(pred_df)
+
+
+def model_info():
+    """Load the model if needed and return its version and load details"""
+    get_model()
+    return get_model_info()
@@ -0,0 +1,488 @@
+"""
+Precomputed map tiles for the station layers.
+
+A layer's stations are cut into z/x/y Web Mercator tiles of GeoJSON, with
+stations closer than CLUSTER_PIXELS on screen merged into one cluster point.
+A tile only depends on the stations inside it, so a changed station touches
+one tile per zoom level.
+
+Each layer's tiles are stored in an MBTiles-style SQLite file in TILES_DIR,
+in the deduplicated layout: map rows point at images, and an image's id is
+the hash of its data, which doubles as the tile's ETag. Tiles down to
+BUILD_MAX_ZOOM can be built ahead of time; any tile that isn't stored is
+rendered on its first request:
+
+    python tiles.py build --layer stations
+
+Triggers record the old and new position of every changed station row in
+tile_changes. sync() renders again only the stored tiles those positions
+fall in, each from the stations within its bounds, or drops them all after
+a bulk load recorded a reset in tile_resets instead; every API process runs
+it in a background thread every SYNC_INTERVAL seconds, or run:
+
+    python tiles.py update
+
+Several processes store tiles in the same file, so a tile rendered on
+request must not be stored after a sync() in another process has passed it
+over. Writes to a store take its write lock (BEGIN IMMEDIATE), and sync()
+records in the store's metadata the database write generation it has
+applied the changes up to. A tile rendered from stations read at an older
+generation is served but not stored.
+
+NumPy is imported inside the functions that need it, so the API can start
+without loading it.
+"""
+import argparse
+import hashlib
+import json
+import multiprocessing
+import os
+import threading
+import time
+from sqlite3 import OperationalError
+
+import connection_pool
+import database
+from database import TILE_LAYERS
+
+TILES_DIR = os.environ.get('AQUAGUARD_TILES_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'tiles'))
+MAX_ZOOM = int(os.environ.get('AQUAGUARD_TILES_MAX_ZOOM', '12'))
+BUILD_MAX_ZOOM = int(os.environ.get('AQUAGUARD_TILES_BUILD_MAX_ZOOM', '10'))
+SYNC_INTERVAL = float(os.environ.get('AQUAGUARD_TILES_SYNC_INTERVAL', '5'))
+
+# Tile edge and cluster cell sizes in screen pixels
+TILE_PIXELS = 256
+CLUSTER_PIXELS = 32
+
+# Latitude limit of the Web Mercator projection
+MAX_LATITUDE = 85.0511287798066
+
+STORE_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS metadata (name TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE IF NOT EXISTS images (tile_id TEXT PRIMARY KEY, tile_data BLOB NOT NULL);
+CREATE TABLE IF NOT EXISTS map (
+    zoom_level INTEGER NOT NULL,
+    tile_column INTEGER NOT NULL,
+    tile_row INTEGER NOT NULL,
+    tile_id TEXT NOT NULL,
+    PRIMARY KEY (zoom_level, tile_column, tile_row)
+);
+CREATE INDEX IF NOT EXISTS map_tile_id ON map (tile_id);
+CREATE VIEW IF NOT EXISTS tiles AS
+SELECT map.zoom_level AS zoom_level, map.tile_column AS tile_column,
+       map.tile_row AS tile_row, images.tile_data AS tile_data
+FROM map JOIN images ON images.tile_id = map.tile_id;
+'''
+
+_initialized = set()
+_sync_pid = None
+_sync_lock = threading.Lock()
+
+
+def project(lng, lat, zoom):
+    """Web Mercator positions of points, in tiles, at a zoom level; takes and returns NumPy arrays"""
+    import numpy as np
+
+    n = 2 ** zoom
+    lat = np.clip(lat, -MAX_LATITUDE, MAX_LATITUDE)
+    x = (lng + 180) / 360 * n
+    y = (1 - np.arcsinh(np.tan(np.radians(lat))) / np.pi) / 2 * n
+    return x, y
+
+
+def tiles_of(lng, lat, zoom):
+    """The tile columns and rows points fall in, as integer arrays"""
+    import numpy as np
+
+    n = 2 ** zoom
+    x, y = project(lng, lat, zoom)
+    return np.clip(np.floor(x), 0, n - 1).astype(np.int64), np.clip(np.floor(y), 0, n - 1).astype(np.int64)
+
+
+def tile_bounds(zoom, x, y):
+    """A tile's (min_lng, min_lat, max_lng, max_lat)"""
+    import numpy as np
+
+    n = 2 ** zoom
+    lat = np.degrees(np.arctan(np.sinh(np.pi * (1 - 2 * np.array([y + 1, y]) / n))))
+    return x / n * 360 - 180, float(lat[0]), (x + 1) / n * 360 - 180, float(lat[1])
+
+
+def _points(rows, layer):
+    """Turn (id, latitude, longitude, *means) rows into (ids, lat, lng, {column: values}) arrays"""
+    import numpy as np
+
+    means = TILE_LAYERS[layer]['means']
+    ids = np.empty(len(rows), dtype=object)
+    ids[:] = [row[0] for row in rows]
+    values = np.array([row[1:] for row in rows], dtype=np.float64).reshape(len(rows), 2 + len(means))
+    return ids, values[:, 0], values[:, 1], {column: values[:, 2 + i] for i, column in enumerate(means)}
+
+
+def _select(points, index):
+    ids, lat, lng, means = points
+    return ids[index], lat[index], lng[index], {column: values[index] for column, values in means.items()}
+
+
+def _feature(lng, lat, properties):
+    return {
+        'type': 'Feature',
+        'geometry': {'type': 'Point', 'coordinates': [round(lng, 6), round(lat, 6)]},
+        'properties': properties,
+    }
+
+
+def render_tile(layer, zoom, x, y, points, stations):
+    """
+    Render a tile's points as clustered GeoJSON bytes.
+
+    points are the (ids, lat, lng, means) arrays of the stations inside the
+    tile; stations(ids) returns {id: properties} for the stations that are
+    drawn on their own.
+    """
+    import numpy as np
+
+    ids, lat, lng, means = points
+    features = []
+    if len(ids):
+        cells = TILE_PIXELS // CLUSTER_PIXELS
+        px, py = project(lng, lat, zoom)
+        cell = (np.clip(((py - y) * cells).astype(np.int64), 0, cells - 1) * cells
+                + np.clip(((px - x) * cells).astype(np.int64), 0, cells - 1))
+
+        # Ordered by position within each cell, so the same stations always
+        # give the same sums, bytes and ETag
+        order = np.lexsort((lng, lat, cell))
+        ids, lat, lng, means = _select((ids, lat, lng, means), order)
+        cell = cell[order]
+        starts = np.flatnonzero(np.concatenate(([True], cell[1:] != cell[:-1])))
+        counts = np.diff(np.append(starts, len(cell)))
+        center_lat = (np.add.reduceat(lat, starts) / counts).tolist()
+        center_lng = (np.add.reduceat(lng, starts) / counts).tolist()
+        cluster_means = {}
+        for column, values in means.items():
+            known = ~np.isnan(values)
+            totals = np.add.reduceat(np.where(known, values, 0.0), starts)
+            known_counts = np.add.reduceat(known.astype(np.int64), starts)
+            cluster_means[column] = [round(total / count, 4) if count else None
+                                     for total, count in zip(totals.tolist(), known_counts.tolist())]
+
+        singles = stations([ids[start] for start, count in zip(starts, counts) if count == 1])
+        for index, (start, count) in enumerate(zip(starts.tolist(), counts.tolist())):
+            if count == 1:
+                features.append(_feature(float(lng[start]), float(lat[start]), singles[ids[start]]))
+                continue
+            properties = {'cluster': True, 'point_count': count}
+            for column, values in cluster_means.items():
+                properties[f'mean_{column}'] = values[index]
+            features.append(_feature(center_lng[index], center_lat[index], properties))
+
+    collection = {'type': 'FeatureCollection', 'features': features}
+    return json.dumps(collection, separators=(',', ':'), sort_keys=True).encode('utf-8')
+
+
+def _tile_points(layer, zoom, tiles):
+    """The (ids, lat, lng, means) arrays of the stations tiles_of() assigns to any of the (x, y) tiles"""
+    import numpy as np
+
+    rows = []
+    for x, y in tiles:
+        min_lng, min_lat, max_lng, max_lat = tile_bounds(zoom, x, y)
+        # Stations beyond the projection's latitude limit are drawn in the edge rows of tiles
+        if y == 0:
+            max_lat = 90
+        if y == 2 ** zoom - 1:
+            min_lat = -90
+        margin = 1e-9
+        rows.extend(database.get_tile_points(
+            layer, (min_lng - margin, min_lat - margin, max_lng + margin, max_lat + margin)
+        ))
+    points = _points(rows, layer)
+    # Stations on a shared edge are read for both tiles; keep each once, in its own tile
+    ids, index = np.unique(points[0].astype(str), return_index=True)
+    points = _select(points, np.sort(index))
+    return _within(points, zoom, tiles)
+
+
+def _within(points, zoom, tiles):
+    """The points that fall in any of the (x, y) tiles"""
+    import numpy as np
+
+    columns, rows = tiles_of(points[2], points[1], zoom)
+    keys = rows * 2 ** zoom + columns
+    return _select(points, np.flatnonzero(np.isin(keys, [y * 2 ** zoom + x for x, y in tiles])))
+
+
+def _render_from_database(layer, zoom, x, y):
+    """Render a tile from the stations tiles_of() assigns to it"""
+    points = _tile_points(layer, zoom, [(x, y)])
+    return render_tile(layer, zoom, x, y, points, lambda ids: database.get_tile_stations(layer, ids))
+
+
+def store_path(layer):
+    """Path of a layer's MBTiles file"""
+    return os.path.join(TILES_DIR, f'{layer}.mbtiles')
+
+
+def _store(layer, create=True):
+    """Connection to a layer's tile store, created on first use; None if it doesn't exist and create is False"""
+    path = store_path(layer)
+    if path not in _initialized:
+        if not create and not os.path.exists(path):
+            return None
+        os.makedirs(TILES_DIR, exist_ok=True)
+        conn = connection_pool.get_connection(path)
+        conn.executescript(STORE_SCHEMA)
+        conn.executemany("INSERT OR REPLACE INTO metadata (name, value) VALUES (?, ?)", [
+            ('name', layer),
+            ('format', 'json'),
+            ('type', 'overlay'),
+            ('minzoom', '0'),
+            ('maxzoom', str(MAX_ZOOM)),
+            ('description', f'AquaGuard {layer} as clustered GeoJSON'),
+        ])
+        conn.commit()
+        _initialized.add(path)
+    return connection_pool.get_connection(path)
+
+
+def _lookup(conn, zoom, x, y):
+    # MBTiles rows count from the south (TMS), map tiles from the north
+    return conn.execute(
+        "SELECT map.tile_id, images.tile_data FROM map JOIN images ON images.tile_id = map.tile_id "
+        "WHERE map.zoom_level = ? AND map.tile_column = ? AND map.tile_row = ?",
+        (zoom, x, 2 ** zoom - 1 - y)
+    ).fetchone()
+
+
+def _put_tiles(conn, zoom, tiles):
+    """Store rendered {(x, y): data} tiles of one zoom level; the caller commits"""
+    tile_ids = {tile: hashlib.sha256(data).hexdigest() for tile, data in tiles.items()}
+    conn.executemany(
+        "INSERT OR IGNORE INTO images (tile_id, tile_data) VALUES (?, ?)",
+        {tile_ids[tile]: data for tile, data in tiles.items()}.items()
+    )
+    conn.executemany(
+        "INSERT OR REPLACE INTO map (zoom_level, tile_column, tile_row, tile_id) VALUES (?, ?, ?, ?)",
+        ((zoom, x, 2 ** zoom - 1 - y, tile_id) for (x, y), tile_id in tile_ids.items())
+    )
+
+
+def _prune_images(conn):
+    conn.execute("DELETE FROM images WHERE tile_id NOT IN (SELECT tile_id FROM map)")
+
+
+def _synced_generation(conn):
+    """The write generation a store's tiles are up to date with, as recorded by sync() and build()"""
+    row = conn.execute("SELECT value FROM metadata WHERE name = 'synced_generation'").fetchone()
+    return int(row[0]) if row else 0
+
+
+def _set_synced_generation(conn, generation):
+    conn.execute(
+        "INSERT OR REPLACE INTO metadata (name, value) VALUES ('synced_generation', ?)",
+        (str(max(generation, _synced_generation(conn))),)
+    )
+
+
+def get_tile(layer, zoom, x, y):
+    """
+    Return a tile as (ETag, GeoJSON bytes), rendering and storing it if it isn't stored yet.
+
+    A rendered tile isn't stored if a sync() applied changes newer than its
+    stations meanwhile, or if the store stays locked by another writer.
+    """
+    conn = _store(layer)
+    row = _lookup(conn, zoom, x, y)
+    if row is not None:
+        return row[0], row[1]
+
+    # Read before the stations, so it is at most the generation they are from
+    generation = database.get_write_generation()
+    data = _render_from_database(layer, zoom, x, y)
+    if generation is not None:
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                if _synced_generation(conn) <= generation:
+                    _put_tiles(conn, zoom, {(x, y): data})
+                conn.commit()
+            except BaseException:
+                conn.rollback()
+                raise
+        except OperationalError as e:
+            print(f"Not storing {layer} tile {zoom}/{x}/{y}: {e}")
+    return hashlib.sha256(data).hexdigest(), data
+
+
+def sync(layer):
+    """
+    Render again the stored tiles touched by the layer's changed rows.
+
+    Tiles that aren't stored are left to be rendered on request. After a
+    bulk load, which records a reset instead of every changed row, all of the
+    layer's stored tiles are dropped. Returns how many tiles were rendered.
+    """
+    if not database.get_last_tile_reset(layer) and not database.get_last_tile_change(layer):
+        return 0
+
+    import numpy as np
+
+    conn = _store(layer)
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        # Read under the store's write lock, so no tile can be stored between reading and applying them
+        reset = database.get_last_tile_reset(layer)
+        changes = database.get_tile_changes(layer)
+        # Read after the changes, so it covers every one of them
+        generation = database.get_write_generation()
+        if generation is None:
+            conn.rollback()
+            return 0
+
+        rendered = 0
+        if reset:
+            conn.execute("DELETE FROM map")
+        elif changes:
+            lat = np.array([change[1] for change in changes], dtype=np.float64)
+            lng = np.array([change[2] for change in changes], dtype=np.float64)
+            stations = lambda ids: database.get_tile_stations(layer, ids)
+            # Stations of the tiles the changes fall in, read at the first zoom with a stored one of
+            # them; deeper such tiles nest inside those, so their stations are narrowed from these
+            points = None
+            for zoom in range(MAX_ZOOM + 1):
+                columns, rows = tiles_of(lng, lat, zoom)
+                changed = set(zip(columns.tolist(), rows.tolist()))
+                touched = {(x, y) for x, y in changed if _lookup(conn, zoom, x, y) is not None}
+                if points is not None:
+                    points = _within(points, zoom, changed)
+                elif touched:
+                    points = _tile_points(layer, zoom, changed)
+                if not touched:
+                    continue
+                tiles = _render_tiles(layer, zoom, points, stations, touched)
+                # Stored tiles that lost their last station are empty now
+                for x, y in touched - tiles.keys():
+                    tiles[(x, y)] = render_tile(layer, zoom, x, y, _select(points, slice(0, 0)), stations)
+                _put_tiles(conn, zoom, tiles)
+                rendered += len(tiles)
+        _prune_images(conn)
+        _set_synced_generation(conn, generation)
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+
+    if changes:
+        database.delete_tile_changes(layer, changes[-1][0])
+    if reset:
+        database.delete_tile_resets(layer, reset)
+    return rendered
+
+
+def _sync_forever(interval):
+    while True:
+        time.sleep(interval)
+        for layer in TILE_LAYERS:
+            try:
+                sync(layer)
+            except Exception as e:
+                print(f"Error updating {layer} tiles: {e}")
+
+
+def start_sync(interval=SYNC_INTERVAL):
+    """Start a background thread in this process that keeps stored tiles up to date, once"""
+    global _sync_pid
+    # Spawned job pool processes re-import the app's main module; they don't serve tiles
+    if multiprocessing.parent_process() is not None:
+        return
+    with _sync_lock:
+        if interval <= 0 or _sync_pid == os.getpid():
+            return
+        _sync_pid = os.getpid()
+        threading.Thread(target=_sync_forever, args=(interval,), name='tile-sync', daemon=True).start()
+
+
+def _render_tiles(layer, zoom, points, stations, wanted=None):
+    """Render the non-empty tiles of a zoom level from a layer's points, or just the wanted (x, y) ones"""
+    import numpy as np
+
+    columns, rows = tiles_of(points[2], points[1], zoom)
+    keys = rows * 2 ** zoom + columns
+    order = np.argsort(keys, kind='stable')
+    keys = keys[order]
+    if not len(keys):
+        return {}
+    starts = np.flatnonzero(np.concatenate(([True], keys[1:] != keys[:-1])))
+    ends = np.append(starts[1:], len(keys))
+
+    tiles = {}
+    for start, end in zip(starts.tolist(), ends.tolist()):
+        y, x = divmod(int(keys[start]), 2 ** zoom)
+        if wanted is None or (x, y) in wanted:
+            tiles[(x, y)] = render_tile(layer, zoom, x, y, _select(points, order[start:end]), stations)
+    return tiles
+
+
+def build(layer, max_zoom=BUILD_MAX_ZOOM):
+    """
+    Render and store every non-empty tile of a layer up to max_zoom; returns tile counts per zoom.
+
+    Holds the store's write lock throughout, so tiles rendered on request
+    meanwhile are served without being stored.
+    """
+    conn = _store(layer)
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        last_change = database.get_last_tile_change(layer)
+        last_reset = database.get_last_tile_reset(layer)
+        # Read after the changes and before the stations, so the tiles cover it
+        generation = database.get_write_generation() or 0
+        points = _points(database.get_tile_points(layer), layer)
+        stations = database.get_tile_stations(layer)
+
+        counts = {}
+        for zoom in range(max_zoom + 1):
+            tiles = _render_tiles(layer, zoom, points, lambda ids: stations)
+            conn.execute("DELETE FROM map WHERE zoom_level = ?", (zoom,))
+            _put_tiles(conn, zoom, tiles)
+            counts[zoom] = len(tiles)
+
+        # Deeper tiles may predate the changes just built in; render them on request again
+        conn.execute("DELETE FROM map WHERE zoom_level > ?", (max_zoom,))
+        _prune_images(conn)
+        _set_synced_generation(conn, generation)
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+
+    database.delete_tile_changes(layer, last_change)
+    database.delete_tile_resets(layer, last_reset)
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Build and update the precomputed map tiles')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    build_parser = subparsers.add_parser('build', help='render every tile of the layers')
+    build_parser.add_argument('--layer', choices=list(TILE_LAYERS), action='append',
+                              help='layer to build (default: all)')
+    build_parser.add_argument('--max-zoom', type=int, default=BUILD_MAX_ZOOM)
+    subparsers.add_parser('update', help='render the tiles touched by changed rows')
+    args = parser.parse_args()
+
+    database.migrate_database()
+    if args.command == 'build':
+        for layer in args.layer or TILE_LAYERS:
+            start = time.perf_counter()
+            counts = build(layer, min(args.max_zoom, MAX_ZOOM))
+            print(f"Built {sum(counts.values()):,} {layer} tiles for zoom 0-{max(counts)} "
+                  f"in {time.perf_counter() - start:.1f} s ({store_path(layer)})")
+    else:
+        for layer in TILE_LAYERS:
+            print(f"Rendered {sync(layer):,} {layer} tiles again")
+
+
+if __name__ == '__main__':
+    main()